@@ -7,6 +7,92 @@ const pythonExecutable = process.env.PYTHON_EXECUTABLE || '/home/bur1/Holochain/
 const wrapperScriptPath = path.join(__dirname, 'gemini_wrapper.py');
 const dualBridgeScriptPath = path.join(__dirname, 'dual_bridge.py');
 
+// categorize_all statuses of items that were validated against the taxonomy
+// ("invalid" and "missing" items still go through the sequential fallback)
+const ACCEPTED_STATUSES = new Set(['ok', 'salvaged', 'cached', 'knn', 'clustered']);
+
+// One long-running `gemini_wrapper.py --serve` process shared by every batch, so each
+// batch no longer pays Python startup, google.genai import and client construction.
+let wrapperDaemon = null;
+
+function getWrapperDaemon() {
+    if (wrapperDaemon && !wrapperDaemon.exited) return wrapperDaemon;
+
+    const proc = spawn(pythonExecutable, [wrapperScriptPath, '--serve']);
+    const daemon = { proc, pending: new Map(), buffer: '', nextId: 0, exited: false, taxonomySent: false };
+
+    proc.stdout.on('data', (data) => {
+        daemon.buffer += data.toString();
+        let newlineIndex;
+        while ((newlineIndex = daemon.buffer.indexOf('\n')) >= 0) {
+            const line = daemon.buffer.slice(0, newlineIndex).trim();
+            daemon.buffer = daemon.buffer.slice(newlineIndex + 1);
+            if (!line) continue;
+            try {
+                const message = JSON.parse(line);
+                const waiter = daemon.pending.get(message.id);
+                if (waiter) {
+                    daemon.pending.delete(message.id);
+                    waiter.resolve(message.result);
+                }
+            } catch (err) {
+                console.error('Unparseable line from wrapper daemon:', line.substring(0, 200));
+            }
+        }
+        setDaemonRef(daemon);
+    });
+
+    proc.stderr.on('data', (data) => {
+        console.error('Python wrapper:', data.toString().trim());
+    });
+
+    const failPending = (err) => {
+        daemon.exited = true;
+        for (const waiter of daemon.pending.values()) waiter.reject(err);
+        daemon.pending.clear();
+    };
+    proc.on('close', (code) => failPending(new Error(`Python wrapper daemon exited with code ${code}`)));
+    proc.on('error', (err) => {
+        console.error('Failed to start Python wrapper daemon.', err);
+        failPending(err);
+    });
+
+    wrapperDaemon = daemon;
+    setDaemonRef(daemon);
+    return daemon;
+}
+
+// Only keep the Node event loop alive while the daemon has requests in flight,
+// so scripts still exit once they are done categorizing.
+function setDaemonRef(daemon) {
+    const method = daemon.pending.size > 0 ? 'ref' : 'unref';
+    daemon.proc[method]();
+    daemon.proc.stdout[method]();
+    daemon.proc.stderr[method]();
+    daemon.proc.stdin[method]();
+}
+
+function callWrapper(mode, input) {
+    const daemon = getWrapperDaemon();
+    const id = String(daemon.nextId++);
+
+    // The daemon remembers the last taxonomy it was sent, so only ship it once
+    if (mode === 'categorize' || mode === 'categorize_all') {
+        if (daemon.taxonomySent) {
+            input = { ...input };
+            delete input.taxonomy;
+        } else {
+            daemon.taxonomySent = true;
+        }
+    }
+
+    return new Promise((resolve, reject) => {
+        daemon.pending.set(id, { resolve, reject });
+        setDaemonRef(daemon);
+        daemon.proc.stdin.write(JSON.stringify({ id, mode, input }) + '\n');
+    });
+}
+
 class ProductCategorizer {
     constructor(apiKey) {
         console.log(`API Key loaded (first 4 chars): ${apiKey.substring(0, 4)}...`);
@@ -250,9 +336,21 @@ class ProductCategorizer {
         console.log(`[API_CATEGORIZER LLM-SPLIT] Products from map (primary set) needing only dual/multi: ${productsFromMapNeedingOnlyDual.length}`);
 
         if (productsNeedingPrimaryLLM.length > 0) {
-            for (let i = 0; i < productsNeedingPrimaryLLM.length; i += batchSize) {
-                const batch = productsNeedingPrimaryLLM.slice(i, i + batchSize);
-                console.log(`Processing LLM batch ${Math.floor(i / batchSize) + 1}/${Math.ceil(productsNeedingPrimaryLLM.length / batchSize)} for primary categorization`);
+            // First pass: the whole list in one categorize_all call, which keeps several
+            // batches in flight inside the wrapper. Anything it could not categorize
+            // falls back to the sequential per-batch path with halving retries below.
+            let remainingForLLM = productsNeedingPrimaryLLM;
+            try {
+                const { categorized, unresolved } = await this.categorizeAllConcurrently(productsNeedingPrimaryLLM, batchSize);
+                productsToActuallyCategorize.push(...categorized);
+                remainingForLLM = unresolved;
+            } catch (error) {
+                console.error(`Concurrent categorization failed, falling back to sequential batches: ${error.message}`);
+            }
+
+            for (let i = 0; i < remainingForLLM.length; i += batchSize) {
+                const batch = remainingForLLM.slice(i, i + batchSize);
+                console.log(`Processing LLM batch ${Math.floor(i / batchSize) + 1}/${Math.ceil(remainingForLLM.length / batchSize)} for primary categorization`);
                 try {
                     const batchResultsLLM = await this.processBatchWithRetry(batch); // Gets primary C/S/PT
                     productsToActuallyCategorize.push(...batchResultsLLM);
@@ -409,6 +507,43 @@ class ProductCategorizer {
     async processBatch(products) {
         if (products.length === 0) return [];
 
+        this.setImageUrls(products);
+
+        console.log(`Sending to Python wrapper: ${products.length} products, ${products.filter(p => p.image_url).length} with images`);
+
+        const inputData = {
+            products: products,
+            taxonomy: this.categoryData,
+            combined: true
+        };
+        if (this.currentTaxonomyCacheName) {
+            inputData.existing_taxonomy_cache_name = this.currentTaxonomyCacheName;
+        }
+
+        let pythonOutput;
+        try {
+            pythonOutput = await callWrapper('categorize', inputData);
+        } catch (error) {
+            console.error('Error calling Python wrapper:', error);
+            throw error;
+        }
+
+        console.log(`[api_categorizer.js] Python output for batch: ${JSON.stringify(pythonOutput)}`);
+
+        if (pythonOutput.taxonomy_cache_name) {
+            this.currentTaxonomyCacheName = pythonOutput.taxonomy_cache_name;
+            console.log(`Updated taxonomy_cache_name: ${this.currentTaxonomyCacheName}`);
+        }
+
+        if (pythonOutput.error) {
+            console.error('Python script returned an error:', pythonOutput.error);
+            throw new Error(pythonOutput.error);
+        }
+
+        return this.applyCategorizationResults(products, pythonOutput.categorizations || []);
+    }
+
+    setImageUrls(products) {
         for (let i = 0; i < products.length; i++) {
             const product = products[i];
             if (product.images && Array.isArray(product.images)) {
@@ -419,123 +554,104 @@ class ProductCategorizer {
                 }
             }
         }
+    }
 
-        console.log(`Sending to Python wrapper: ${products.length} products, ${products.filter(p => p.image_url).length} with images`);
-
-        try {
-            const pythonProcess = spawn(pythonExecutable, [wrapperScriptPath, '--mode', 'categorize']);
-
-            const inputData = {
-                products: products,
-                taxonomy: this.categoryData
-            };
-            if (this.currentTaxonomyCacheName) {
-                inputData.existing_taxonomy_cache_name = this.currentTaxonomyCacheName;
+    applyCategorizationResults(products, categorizationResults) {
+        const categorizedProducts = categorizationResults.map((result, i) => {
+            const product = products[i];
+            if (!product) {
+                console.error(`Product at index ${i} is undefined. Results length: ${categorizationResults.length}, Products length: ${products.length}`);
+                this.logFailedCategorization({ description: `Undefined product at index ${i}` }, new Error("Mismatch in product/result length"), result);
+                return {
+                    description: `Error: Product undefined at index ${i}`,
+                    category: "Uncategorized",
+                    subcategory: "Unknown",
+                    product_type: "Unknown"
+                };
             }
-            if (this.currentTaxonomyCacheName) {
-                inputData.existing_taxonomy_cache_name = this.currentTaxonomyCacheName;
+            try {
+                const validResult = this.validateCategorization(result, product);
+                const categorized = {
+                    ...product,
+                    category: validResult.category,
+                    subcategory: validResult.subcategory,
+                    product_type: validResult.product_type
+                };
+                // Secondary product types the combined categorize call already chose
+                if (Array.isArray(result.additional_categorizations)) {
+                    categorized.prefilled_additional_categorizations = result.additional_categorizations;
+                }
+                return categorized;
+            } catch (error) {
+                console.error(`Validation error for product: ${product.description}`, error);
+                this.logFailedCategorization(product, error, result);
+                return {
+                    ...product,
+                    category: "Uncategorized",
+                    subcategory: "Unknown",
+                    product_type: "Unknown"
+                };
             }
+        });
 
-            let outputData = '';
-            let errorData = '';
-
-            pythonProcess.stdin.write(JSON.stringify(inputData));
-            pythonProcess.stdin.end();
-
-            pythonProcess.stdout.on('data', (data) => {
-                outputData += data.toString();
-            });
-
-            pythonProcess.stderr.on('data', (data) => {
-                errorData += data.toString();
-                console.error('Python wrapper:', data.toString().trim());
-            });
-
-            return new Promise((resolve, reject) => {
-                pythonProcess.on('close', (code) => {
-                    if (code !== 0) {
-                        console.error(`Python process exited with code ${code}: ${errorData}`);
-                        try {
-                            const errOutput = JSON.parse(outputData || "{}");
-                            if (errOutput.taxonomy_cache_name) {
-                                this.currentTaxonomyCacheName = errOutput.taxonomy_cache_name;
-                                console.log(`Retrieved taxonomy_cache_name on error: ${this.currentTaxonomyCacheName}`);
-                            }
-                        } catch (parseErr) {
-                            // Ignore if output wasn't JSON
-                        }
-                        reject(new Error(`Python wrapper failed with code ${code}: ${errorData}`));
-                        return;
-                    }
+        const correctedProducts = categorizedProducts.map((product, i) => {
+            if (products[i]) {
+                return this.autoCorrectCategory(product, products[i]);
+            }
+            return product;
+        });
 
-                    try {
-                        const pythonOutput = JSON.parse(outputData);
-                        console.log(`[api_categorizer.js] Python output for batch: ${JSON.stringify(pythonOutput)}`);
+        return correctedProducts;
+    }
 
-                        if (pythonOutput.taxonomy_cache_name) {
-                            this.currentTaxonomyCacheName = pythonOutput.taxonomy_cache_name;
-                            console.log(`Updated taxonomy_cache_name: ${this.currentTaxonomyCacheName}`);
-                        }
+    async categorizeAllConcurrently(products, batchSize) {
+        this.setImageUrls(products);
+        console.log(`Sending ${products.length} products to Python wrapper for concurrent categorization`);
 
-                        if (pythonOutput.error) {
-                            console.error('Python script returned an error:', pythonOutput.error);
-                            reject(new Error(pythonOutput.error));
-                            return;
-                        }
+        const inputData = {
+            products: products,
+            taxonomy: this.categoryData,
+            options: { batch_size: batchSize },
+            combined: true
+        };
+        if (this.currentTaxonomyCacheName) {
+            inputData.existing_taxonomy_cache_name = this.currentTaxonomyCacheName;
+        }
 
-                        const categorizationResults = pythonOutput.categorizations || [];
-
-                        const categorizedProducts = categorizationResults.map((result, i) => {
-                            const product = products[i];
-                            if (!product) {
-                                console.error(`Product at index ${i} is undefined. Results length: ${categorizationResults.length}, Products length: ${products.length}`);
-                                this.logFailedCategorization({ description: `Undefined product at index ${i}` }, new Error("Mismatch in product/result length"), result);
-                                return {
-                                    description: `Error: Product undefined at index ${i}`,
-                                    category: "Uncategorized",
-                                    subcategory: "Unknown",
-                                    product_type: "Unknown"
-                                };
-                            }
-                            try {
-                                const validResult = this.validateCategorization(result, product);
-                                return {
-                                    ...product,
-                                    category: validResult.category,
-                                    subcategory: validResult.subcategory,
-                                    product_type: validResult.product_type
-                                };
-                            } catch (error) {
-                                console.error(`Validation error for product: ${product.description}`, error);
-                                this.logFailedCategorization(product, error, result);
-                                return {
-                                    ...product,
-                                    category: "Uncategorized",
-                                    subcategory: "Unknown",
-                                    product_type: "Unknown"
-                                };
-                            }
-                        });
+        const pythonOutput = await callWrapper('categorize_all', inputData);
+        if (pythonOutput.taxonomy_cache_name) {
+            this.currentTaxonomyCacheName = pythonOutput.taxonomy_cache_name;
+        }
+        if (pythonOutput.error) {
+            throw new Error(pythonOutput.error);
+        }
+        if (pythonOutput.stats) {
+            console.log(`[api_categorizer.js] Concurrent categorization stats: ${JSON.stringify(pythonOutput.stats)}`);
+        }
 
-                        const correctedProducts = categorizedProducts.map((product, i) => {
-                            if (products[i]) {
-                                return this.autoCorrectCategory(product, products[i]);
-                            }
-                            return product;
-                        });
+        const results = pythonOutput.categorizations || [];
+        const resolvedProducts = [];
+        const resolvedResults = [];
+        const unresolved = [];
+        products.forEach((product, i) => {
+            const result = results[i];
+            const accepted = result && !result.error && result.category && (
+                ACCEPTED_STATUSES.has(result.status) ||
+                this.isValidProductTypeInSubcategory(result.category, result.subcategory, result.product_type)
+            );
+            if (accepted) {
+                resolvedProducts.push(product);
+                resolvedResults.push(result);
+            } else {
+                unresolved.push(product);
+            }
+        });
 
-                        resolve(correctedProducts);
-                    } catch (error) {
-                        console.error('Error parsing Python output or processing results:', error);
-                        console.error('Raw Python output on parse error:', outputData);
-                        reject(error);
-                    }
-                });
-            });
-        } catch (error) {
-            console.error('Error calling Python wrapper:', error);
-            throw error;
-        }
+        console.log(`Concurrent categorization resolved ${resolvedProducts.length}/${products.length} products`);
+        return {
+            categorized: this.applyCategorizationResults(resolvedProducts, resolvedResults),
+            unresolved
+        };
     }
 
     autoCorrectCategory(result, product) {
@@ -751,6 +867,16 @@ class ProductCategorizer {
     async applyDualCategorization(products) {
         console.log('🚀 Starting dual categorization process for', products.length, 'products...');
 
+        // Product types the combined categorize call chose are internal: keep them
+        // aside so they reach neither dual_bridge.py nor the output, on every path.
+        const prefilledByProduct = new Map();
+        for (const p of products) {
+            if (p && 'prefilled_additional_categorizations' in p) {
+                prefilledByProduct.set(p, p.prefilled_additional_categorizations);
+                delete p.prefilled_additional_categorizations;
+            }
+        }
+
         return new Promise((resolve, reject) => {
             try {
                 const validProductsForDual = products.filter(p => p.category && p.subcategory && p.product_type && p.category !== "Uncategorized" && p.category !== "Error");
@@ -806,6 +932,7 @@ class ProductCategorizer {
                             const bridgeResult = bridgeResultsMap.get(originalProduct.productId || originalProduct.description);
                             if (bridgeResult && bridgeResult.additional_categorizations) {
                                 originalProduct.additional_categorizations = bridgeResult.additional_categorizations;
+                                this.applyPrefilledProductTypes(originalProduct, prefilledByProduct.get(originalProduct));
                                 console.log(`[API_CATEGORIZER DEBUG applyDualCategorization] Product "${originalProduct.description}" got additional_categorizations:`, JSON.stringify(originalProduct.additional_categorizations, null, 2));
 
                                 if (originalProduct.additional_categorizations.length > 0) {
@@ -864,6 +991,19 @@ class ProductCategorizer {
         });
     }
 
+    // Reuse product types chosen by the combined categorize call for additional
+    // categorizations that still need one, so they skip the product_types round trip.
+    applyPrefilledProductTypes(product, prefilled = []) {
+        for (const cat of product.additional_categorizations) {
+            if (cat.product_type) continue;
+            const match = prefilled.find(p => p.product_type && p.main_category === cat.main_category && p.subcategory === cat.subcategory);
+            if (match) {
+                cat.product_type = match.product_type;
+                console.log(`✨ Reused prefilled additional_cat product_type for ${product.description}: ${cat.main_category}/${cat.subcategory}/${cat.product_type}`);
+            }
+        }
+    }
+
     async batchDetermineProductTypes(products) { // products here are those that have additional_categorizations needing product_type
         console.log(`🔄 Batching product type determination for additional categories for ${products.length} products`);
 
@@ -956,10 +1096,6 @@ class ProductCategorizer {
     }
 
     async processBatchChunkForProductTypes(chunk) { // chunk contains items with { originalProductRef, additionalCatIndex, ... }
-        const pythonProcess = spawn(pythonExecutable, [wrapperScriptPath, '--mode', 'product_types']);
-        let outputData = '';
-        let errorData = '';
-
         const chunkForPython = chunk.map(item => ({
             id: item.id,
             description: item.description,
@@ -968,55 +1104,32 @@ class ProductCategorizer {
             availableProductTypes: item.availableProductTypes
         }));
 
-        pythonProcess.stdin.write(JSON.stringify(chunkForPython));
-        pythonProcess.stdin.end();
-
-        pythonProcess.stdout.on('data', (data) => { outputData += data.toString(); });
-        pythonProcess.stderr.on('data', (data) => {
-            errorData += data.toString();
-            console.error('Python wrapper (Product Types) stderr:', data.toString().trim());
-        });
+        const resultsFromPython = await callWrapper('product_types', chunkForPython);
+        if (!Array.isArray(resultsFromPython)) {
+            const message = resultsFromPython?.error || 'Unexpected product_types output';
+            console.error(`Python wrapper (Product Types) failed: ${message}`);
+            throw new Error(`Python wrapper (Product Types) failed: ${message}`);
+        }
 
-        return new Promise((resolve, reject) => {
-            pythonProcess.on('close', (code) => {
-                if (code !== 0) {
-                    console.error(`Python wrapper (Product Types) process exited with code ${code}: ${errorData}`);
-                    reject(new Error(`Python wrapper (Product Types) failed with code ${code}: ${errorData}`));
-                    return;
-                }
-                try {
-                    const resultsFromPython = JSON.parse(outputData);
-                    const responseMap = new Map();
-                    for (const response of resultsFromPython) {
-                        if (response.id) responseMap.set(response.id, response);
-                    }
+        const responseMap = new Map();
+        for (const response of resultsFromPython) {
+            if (response.id) responseMap.set(response.id, response);
+        }
 
-                    for (const item of chunk) {
-                        const pythonResponse = responseMap.get(item.id);
-                        const targetAdditionalCatEntry = item.originalProductRef.additional_categorizations[item.additionalCatIndex];
+        for (const item of chunk) {
+            const pythonResponse = responseMap.get(item.id);
+            const targetAdditionalCatEntry = item.originalProductRef.additional_categorizations[item.additionalCatIndex];
 
-                        if (pythonResponse && pythonResponse.product_type && item.availableProductTypes.includes(pythonResponse.product_type)) {
-                            targetAdditionalCatEntry.product_type = pythonResponse.product_type;
-                            console.log(`✅ Set additional_cat product_type for ${item.description} -> ${item.category}/${item.subcategory}: ${pythonResponse.product_type}`);
-                        } else {
-                            const fallbackType = item.availableProductTypes[0];
-                            targetAdditionalCatEntry.product_type = fallbackType;
-                            console.warn(`⚠️ Invalid/missing LLM response for additional_cat product_type: ${item.description} -> ${item.category}/${item.subcategory}. Using fallback: ${fallbackType}`);
-                            this.logFailedCategorization(item.originalProductRef, new Error("Invalid LLM product_type response"), { category: item.category, subcategory: item.subcategory, attempted_pt: pythonResponse?.product_type }, "processBatchChunkForProductTypes_fallback");
-                        }
-                    }
-                    resolve();
-                } catch (error) {
-                    console.error('Error parsing Python (Product Types) output:', error.message);
-                    console.error('Raw output from Python (Product Types):', outputData.substring(0, 500) + "...");
-                    reject(error);
-                }
-            });
-            pythonProcess.on('error', (err) => {
-                console.error('Failed to start Python wrapper (Product Types) process.', err);
-                reject(err);
-            });
-        });
+            if (pythonResponse && pythonResponse.product_type && item.availableProductTypes.includes(pythonResponse.product_type)) {
+                targetAdditionalCatEntry.product_type = pythonResponse.product_type;
+                console.log(`✅ Set additional_cat product_type for ${item.description} -> ${item.category}/${item.subcategory}: ${pythonResponse.product_type}`);
+            } else {
+                const fallbackType = item.availableProductTypes[0];
+                targetAdditionalCatEntry.product_type = fallbackType;
+                console.warn(`⚠️ Invalid/missing LLM response for additional_cat product_type: ${item.description} -> ${item.category}/${item.subcategory}. Using fallback: ${fallbackType}`);
+                this.logFailedCategorization(item.originalProductRef, new Error("Invalid LLM product_type response"), { category: item.category, subcategory: item.subcategory, attempted_pt: pythonResponse?.product_type }, "processBatchChunkForProductTypes_fallback");
+            }
+        }
     }
 
     async determineProductType(productText, category, subcategory) {
@@ -1044,9 +1157,6 @@ class ProductCategorizer {
         }
 
         try {
-            const pythonProcess = spawn(pythonExecutable, [wrapperScriptPath, '--mode', 'product_types']);
-
-
             // Prepare single item batch
             const batchItem = [{
                 id: "single_product",
@@ -1056,47 +1166,16 @@ class ProductCategorizer {
                 availableProductTypes: availableProductTypes
             }];
 
-            let outputData = '';
-            let errorData = '';
-
-            pythonProcess.stdin.write(JSON.stringify(batchItem));
-            pythonProcess.stdin.end();
+            const result = await callWrapper('product_types', batchItem);
 
-            pythonProcess.stdout.on('data', (data) => {
-                outputData += data.toString();
-            });
-
-            pythonProcess.stderr.on('data', (data) => {
-                errorData += data.toString();
-                console.error('Python wrapper:', data.toString());
-            });
-
-            return new Promise((resolve, reject) => {
-                pythonProcess.on('close', (code) => {
-                    if (code !== 0) {
-                        console.error(`Python process exited with code ${code}: ${errorData}`);
-                        // Return first available type as fallback
-                        resolve(availableProductTypes[0]);
-                        return;
-                    }
-
-                    try {
-                        // Parse the result - should be clean JSON
-                        const result = JSON.parse(outputData);
-
-                        if (result.length > 0 && result[0].product_type && availableProductTypes.includes(result[0].product_type)) {
-                            resolve(result[0].product_type);
-                        } else {
-                            // Return first available type as fallback
-                            resolve(availableProductTypes[0]);
-                        }
-                    } catch (error) {
-                        console.error('Error parsing Python output:', error);
-                        // Return first available type as fallback
-                        resolve(availableProductTypes[0]);
-                    }
-                });
-            });
+            if (Array.isArray(result) && result.length > 0 && result[0].product_type && availableProductTypes.includes(result[0].product_type)) {
+                return result[0].product_type;
+            }
+            if (result?.error) {
+                console.error(`Python wrapper returned an error: ${result.error}`);
+            }
+            // Return first available type as fallback
+            return availableProductTypes[0];
         } catch (error) {
             console.error(`Error in product type selection: ${error}`);
             // Return first available type as fallback
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Asyncio engine that categorizes a whole product list with several model
+requests in flight at once, within requests-per-minute and tokens-per-minute
+budgets, backing off on 429/503 responses and optionally adapting batch sizes
+to observed token usage.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from log_utils import log
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # only needed to recognise live API errors
+    google_exceptions = None
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Rough request size estimate used before usage_metadata is known
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+PROMPT_OVERHEAD_TOKENS = 600
+PRODUCT_TOKENS = 60
+
+RETRYABLE_STATUS = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "429", "503")
+
+
+def is_retryable_error(error):
+    """True for quota (429) and overload (503) errors from the API or a fake client"""
+    if getattr(error, "code", None) in (429, 503):
+        return True
+    if google_exceptions and isinstance(
+        error,
+        (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable),
+    ):
+        return True
+    return any(status in str(error) for status in RETRYABLE_STATUS)
+
+
+def estimate_tokens(products):
+    """Estimated prompt tokens for one categorization request"""
+    tokens = PROMPT_OVERHEAD_TOKENS
+    for product in products:
+        tokens += PRODUCT_TOKENS + len(str(product.get("description", ""))) // CHARS_PER_TOKEN
+        if product.get("image_url"):
+            tokens += IMAGE_TOKENS
+    return tokens
+
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if it is available now)"""
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def take(self, amount):
+        self.refill()
+        self.available -= amount
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) the difference once actual usage is known"""
+        self.available = min(self.capacity, self.available - delta)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets shared by all workers"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self, estimated_tokens):
+        async with self.lock:
+            while True:
+                delay = max(
+                    self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens)
+                )
+                if delay <= 0:
+                    break
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
+            self.requests.take(1)
+            self.tokens.take(min(estimated_tokens, self.tokens.capacity))
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        if actual_tokens:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+class BatchEngine:
+    """
+    Runs `categorize_fn(products, taxonomy, existing_taxonomy_cache_name,
+    max_output_tokens)` over batches of a product list with bounded concurrency.
+    categorize_fn is synchronous, raises on API errors and returns a dict with
+    "categorizations", "taxonomy_cache_name" and optionally "usage" (see
+    request_categorizations).
+    """
+
+    def __init__(
+        self,
+        categorize_fn,
+        concurrency=DEFAULT_CONCURRENCY,
+        requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+    ):
+        self.categorize_fn = categorize_fn
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    async def run_batch(
+        self, batch, taxonomy, limiter, stats, cache_name, executor, max_output_tokens=None
+    ):
+        estimated = estimate_tokens(batch)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire(estimated)
+            started = time.monotonic()
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    executor,
+                    self.categorize_fn,
+                    batch,
+                    taxonomy,
+                    cache_name["value"],
+                    max_output_tokens,
+                )
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                stats["retries"] += 1
+                delay = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * 2**attempt)
+                delay *= random.uniform(0.5, 1.0)
+                log(f"⏳ Retryable error ({str(e)}), backing off {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            stats["latencies"].append(time.monotonic() - started)
+            usage = result.get("usage") or {}
+            limiter.record_usage(estimated, usage.get("total_tokens"))
+            stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            stats["output_tokens"] += usage.get("output_tokens", 0)
+            stats["thoughts_tokens"] += usage.get("thoughts_tokens", 0)
+            if result.get("taxonomy_cache_name"):
+                cache_name["value"] = result["taxonomy_cache_name"]
+            return result
+
+    async def run(
+        self,
+        products,
+        taxonomy,
+        batch_size=DEFAULT_BATCH_SIZE,
+        existing_taxonomy_cache_name=None,
+        adaptive=False,
+    ):
+        """
+        Categorize every product. Returns {"categorizations": [...], "taxonomy_cache_name",
+        "stats"} with categorizations aligned to products; products that could not be
+        categorized get {"error": ...} entries.
+
+        With adaptive=True batch sizes start at batch_size and follow an
+        AdaptiveBatchSizer: batches grow while responses come back complete, and
+        a request that fails outright (e.g. an unparseable response) shrinks the
+        size and requeues its products. A truncated response, or one that still
+        has missing items or a high share of invalid ones after categorize_fn's
+        own follow-ups, only shrinks the size.
+        """
+        sizer = AdaptiveBatchSizer(batch_size, adaptive=adaptive)
+        categorizations = [None] * len(products)
+        limiter = RateLimiter(self.requests_per_minute, self.tokens_per_minute)
+        cache_name = {"value": existing_taxonomy_cache_name}
+        # Spans of (start index, products) still to be sent
+        pending = deque([(0, products)]) if products else deque()
+        stats = {
+            "retries": 0,
+            "failed_batches": 0,
+            "requeued_batches": 0,
+            "salvaged": 0,
+            "escalated": 0,
+            "cascade_fast_seconds": 0.0,
+            "cascade_pro_seconds": 0.0,
+            "latencies": [],
+            "batch_sizes": [],
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "thoughts_tokens": 0,
+        }
+
+        def take_batch():
+            start, span = pending.popleft()
+            size = sizer.next_size(span)
+            if size < len(span):
+                pending.appendleft((start + size, span[size:]))
+            return start, span[:size]
+
+        def fail(start, batch, message):
+            stats["failed_batches"] += 1
+            for i in range(len(batch)):
+                categorizations[start + i] = {"error": message}
+
+        async def worker():
+            while pending:
+                start, batch = take_batch()
+                stats["batch_sizes"].append(len(batch))
+                call_started = time.monotonic()
+                try:
+                    result = await self.run_batch(
+                        batch,
+                        taxonomy,
+                        limiter,
+                        stats,
+                        cache_name,
+                        executor,
+                        sizer.max_output_tokens(len(batch)) if adaptive else None,
+                    )
+                except Exception as e:
+                    log(f"❌ Batch of {len(batch)} starting at {start} failed: {str(e)}")
+                    if adaptive and len(batch) > 1 and not is_retryable_error(e):
+                        sizer.record_failure(len(batch))
+                        stats["requeued_batches"] += 1
+                        pending.appendleft((start, batch))
+                    else:
+                        fail(start, batch, str(e))
+                    continue
+
+                results = result.get("categorizations") or []
+                usage = result.get("usage") or {}
+                # categorize_fn aligns its results and re-requests bad items itself,
+                # so "missing" and "invalid" statuses are what a short or garbled
+                # response of a too-large batch leaves behind
+                statuses = [item.get("status") for item in results if isinstance(item, dict)]
+                missing = statuses.count("missing") + max(0, len(batch) - len(results))
+                invalid = statuses.count("invalid")
+                stats["salvaged"] += (result.get("salvage") or {}).get("salvaged", 0)
+                cascade = result.get("cascade") or {}
+                stats["escalated"] += cascade.get("escalated", 0)
+                stats["cascade_fast_seconds"] += cascade.get("fast_seconds", 0.0)
+                stats["cascade_pro_seconds"] += cascade.get("pro_seconds", 0.0)
+                if usage.get("finish_reason") == "MAX_TOKENS":
+                    # Missing items were already re-requested, but the batch was too big
+                    log(f"✂️ Response for {len(batch)} products was truncated, shrinking batches")
+                    sizer.record_failure(len(batch))
+                elif sizer.should_shrink(len(batch), missing, invalid):
+                    log(
+                        f"✂️ {missing} missing and {invalid} invalid of {len(batch)} products, "
+                        "shrinking batches"
+                    )
+                    sizer.record_failure(len(batch))
+                else:
+                    sizer.record_success(
+                        len(batch),
+                        (usage.get("output_tokens") or 0) + (usage.get("thoughts_tokens") or 0),
+                        time.monotonic() - call_started,
+                    )
+                for i in range(len(batch)):
+                    categorizations[start + i] = (
+                        results[i]
+                        if i < len(results)
+                        else {"error": "No categorization returned for product"}
+                    )
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        elapsed = time.monotonic() - started
+
+        latencies = sorted(stats.pop("latencies"))
+        stats.update(
+            {
+                "products": len(products),
+                "batches": len(stats["batch_sizes"]),
+                "batch_size": batch_size,
+                "adaptive": adaptive,
+                "final_batch_size": sizer.size,
+                "concurrency": self.concurrency,
+                "elapsed_seconds": round(elapsed, 3),
+                "products_per_second": round(len(products) / elapsed, 3) if elapsed else None,
+                "p50_batch_seconds": percentile(latencies, 50),
+                "p95_batch_seconds": percentile(latencies, 95),
+                "rate_limit_wait_seconds": round(limiter.waited_seconds, 3),
+                "cascade_fast_seconds": round(stats["cascade_fast_seconds"], 3),
+                "cascade_pro_seconds": round(stats["cascade_pro_seconds"], 3),
+            }
+        )
+        log(
+            f"🏁 Categorized {len(products)} products in {elapsed:.1f}s "
+            f"({stats['products_per_second']} products/s, {stats['retries']} retries, "
+            f"batch sizes {min(stats['batch_sizes'], default=0)}-{max(stats['batch_sizes'], default=0)})"
+        )
+        return {
+            "categorizations": categorizations,
+            "taxonomy_cache_name": cache_name["value"],
+            "stats": stats,
+        }
+
+
+class AdaptiveBatchSizer:
+    """
+    Chooses how many products go into the next request.
+
+    The size grows by GROW_STEP after each complete response and halves after a
+    truncated, short (items missing), largely invalid (INVALID_SHARE) or failed
+    one. It is also capped so the estimated prompt stays under MAX_INPUT_TOKENS,
+    the expected output (from the observed output and thinking tokens per
+    product) fits in MAX_OUTPUT_TOKENS, and the expected latency (from observed
+    seconds per product) stays under TARGET_BATCH_SECONDS.
+
+    Thinking tokens count against max_output_tokens, and one small batch can
+    think as much as a large one, so the learned output limit never drops below
+    THINKING_TOKENS plus MIN_OUTPUT_TOKENS.
+    """
+
+    MIN_SIZE = 1
+    MAX_SIZE = 100
+    GROW_STEP = 5
+    MAX_INPUT_TOKENS = 60_000
+    MAX_OUTPUT_TOKENS = 65_536
+    MIN_OUTPUT_TOKENS = 2_048
+    # Largest dynamic thinking budget (gemini-2.5-pro)
+    THINKING_TOKENS = 32_768
+    OUTPUT_SAFETY_FACTOR = 2.0
+    TARGET_BATCH_SECONDS = 90.0
+    # Weight of the newest observation in the moving averages
+    SMOOTHING = 0.3
+    # Shrink after a response leaving any item missing or this share invalid
+    INVALID_SHARE = 0.25
+
+    def __init__(self, initial_size=DEFAULT_BATCH_SIZE, adaptive=True):
+        self.size = initial_size
+        self.adaptive = adaptive
+        self.output_tokens_per_product = None
+        self.seconds_per_product = None
+
+    def next_size(self, remaining):
+        """Size for the next batch taken from the `remaining` products"""
+        size = min(self.size, len(remaining))
+        if not self.adaptive:
+            return size
+        while size > self.MIN_SIZE and estimate_tokens(remaining[:size]) > self.MAX_INPUT_TOKENS:
+            size -= 1
+        if self.output_tokens_per_product:
+            fits = int(
+                self.MAX_OUTPUT_TOKENS
+                / (self.output_tokens_per_product * self.OUTPUT_SAFETY_FACTOR)
+            )
+            size = min(size, max(self.MIN_SIZE, fits))
+        if self.seconds_per_product:
+            fits = int(self.TARGET_BATCH_SECONDS / self.seconds_per_product)
+            size = min(size, max(self.MIN_SIZE, fits))
+        return max(self.MIN_SIZE, size)
+
+    def max_output_tokens(self, batch_len):
+        """Output token limit for a batch, from observed output per product"""
+        if not self.output_tokens_per_product:
+            return self.MAX_OUTPUT_TOKENS
+        wanted = int(batch_len * self.output_tokens_per_product * self.OUTPUT_SAFETY_FACTOR)
+        floor = self.THINKING_TOKENS + self.MIN_OUTPUT_TOKENS
+        return max(floor, min(self.MAX_OUTPUT_TOKENS, wanted))
+
+    def smooth(self, current, observed):
+        if current is None:
+            return observed
+        return (1 - self.SMOOTHING) * current + self.SMOOTHING * observed
+
+    def record_success(self, batch_len, output_tokens, seconds):
+        """output_tokens includes the response's thinking tokens"""
+        if output_tokens:
+            self.output_tokens_per_product = self.smooth(
+                self.output_tokens_per_product, output_tokens / batch_len
+            )
+        self.seconds_per_product = self.smooth(self.seconds_per_product, seconds / batch_len)
+        if self.adaptive and batch_len >= self.size:
+            self.size = min(self.MAX_SIZE, self.size + self.GROW_STEP)
+
+    def should_shrink(self, batch_len, missing, invalid):
+        """Whether a response with this many unresolved items calls for smaller batches"""
+        if not self.adaptive or batch_len <= self.MIN_SIZE:
+            return False
+        return missing > 0 or invalid >= self.INVALID_SHARE * batch_len
+
+    def record_failure(self, batch_len):
+        self.size = max(self.MIN_SIZE, min(self.size, batch_len) // 2)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return round(sorted_values[index], 3)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Resumable bulk categorization of a JSONL product file (gemini_wrapper.py --mode bulk).
+
+Products are read from the input file in chunks. Each chunk goes through
+categorize_all, and its results are appended to the output JSONL files as
+they complete:
+- valid categorizations go to the results file, one product per line with
+  "id", the product's fields and its category/subcategory/product_type;
+- anything else goes to the failures file: the whole input product with its
+  "id", plus "error" and the "attempted" categorization.
+
+After every chunk a checkpoint records the ids that are done and the byte
+length of both output files, and it is written atomically. A restarted job
+truncates the outputs to the checkpointed lengths, so a chunk that was only
+half-written is not duplicated. It then skips the done ids and carries on.
+
+Failed products count as done; to retry them, run a job over the failures
+file (rows carrying both "error" and "attempted" are failure rows, and those
+two fields are dropped on input; other products keep all their fields). Products
+whose batch failed with a transient error (quota, overload, outage) are not
+written or checkpointed at all, so the next run of the same job retries them.
+"""
+
+import json
+import os
+import time
+
+from log_utils import log
+from taxonomy_utils import taxonomy_hash
+
+DEFAULT_CHUNK_SIZE = 500
+# Added to failure rows; stripped again from input rows that have both
+FAILURE_FIELDS = ("error", "attempted")
+
+
+def product_id(product, line_number):
+    """Stable id for a product: productId, upc or id, else its line in the input file"""
+    return str(
+        product.get("productId")
+        or product.get("upc")
+        or product.get("id")
+        or f"line:{line_number}"
+    )
+
+
+def default_paths(output_path):
+    stem = output_path[: -len(".jsonl")] if output_path.endswith(".jsonl") else output_path
+    return f"{stem}.failures.jsonl", f"{stem}.checkpoint.json"
+
+
+class Checkpoint:
+    """Done ids and committed output lengths of a bulk job, saved atomically"""
+
+    def __init__(self, path, input_path, taxonomy):
+        self.path = path
+        self.identity = {
+            "input": os.path.abspath(input_path),
+            "taxonomy_hash": taxonomy_hash(taxonomy),
+        }
+        self.done = set()
+        self.output_bytes = {}
+        self.stats = {"results": 0, "failures": 0, "chunks": 0}
+
+    def load(self):
+        """Restore a previous run's state; False if there was none"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            try:
+                state = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(
+                    f"Checkpoint {self.path} is unreadable ({str(e)}); "
+                    "delete it to start the job over"
+                ) from e
+        for key, value in self.identity.items():
+            if state.get(key) != value:
+                raise ValueError(
+                    f"Checkpoint {self.path} belongs to a different job ({key} differs); "
+                    "delete it or choose another output path"
+                )
+        self.done = set(state["done"])
+        self.output_bytes = state["output_bytes"]
+        self.stats = state["stats"]
+        return True
+
+    def save(self):
+        state = {
+            **self.identity,
+            "done": sorted(self.done),
+            "output_bytes": self.output_bytes,
+            "stats": self.stats,
+            "updated_at": time.time(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def open_output(path, committed_bytes):
+    """Open an output file for appending, dropping anything after committed_bytes"""
+    mode = "r+" if os.path.exists(path) else "w"
+    f = open(path, mode)
+    f.truncate(committed_bytes or 0)
+    f.seek(0, os.SEEK_END)
+    return f
+
+
+def read_pending(input_path, done):
+    """(id, product) pairs from the input JSONL that are not done yet"""
+    with open(input_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            product = json.loads(line)
+            if all(field in product for field in FAILURE_FIELDS):
+                # A failures file row: retry the product, not its last error
+                product = {k: v for k, v in product.items() if k not in FAILURE_FIELDS}
+            pid = product_id(product, line_number)
+            if pid not in done:
+                yield pid, product
+
+
+def chunks(pairs, size):
+    chunk = []
+    for pair in pairs:
+        chunk.append(pair)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_bulk_job(
+    input_path,
+    output_path,
+    taxonomy,
+    categorize,
+    is_valid,
+    failures_path=None,
+    checkpoint_path=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    is_transient=None,
+):
+    """
+    Categorize every product of input_path that the checkpoint does not list as
+    done. categorize(products, cache_name) returns a categorize_all result, and
+    is_valid(categorization) decides between the results and failures files.
+    Categorizations for which is_transient(categorization) is true are left
+    pending for the next run. Returns the job's running totals.
+    """
+    default_failures, default_checkpoint = default_paths(output_path)
+    failures_path = failures_path or default_failures
+    checkpoint = Checkpoint(checkpoint_path or default_checkpoint, input_path, taxonomy)
+    if checkpoint.load():
+        log(f"♻️ Resuming bulk job: {len(checkpoint.done)} products already done")
+
+    results_file = open_output(output_path, checkpoint.output_bytes.get("results"))
+    failures_file = open_output(failures_path, checkpoint.output_bytes.get("failures"))
+    cache_name = None
+    started = time.monotonic()
+    processed = 0
+    deferred = 0
+    try:
+        for chunk in chunks(read_pending(input_path, checkpoint.done), chunk_size):
+            result = categorize([product for _, product in chunk], cache_name)
+            cache_name = result.get("taxonomy_cache_name") or cache_name
+            for (pid, product), item in zip(chunk, result["categorizations"]):
+                item = {k: v for k, v in (item or {}).items() if k != "index"}
+                if is_transient and is_transient(item):
+                    deferred += 1
+                    continue
+                if is_valid(item):
+                    results_file.write(json.dumps({"id": pid, **product, **item}) + "\n")
+                    checkpoint.stats["results"] += 1
+                else:
+                    error = item.get("error") or (
+                        f"invalid categorization ({item.get('status', 'missing')})"
+                    )
+                    failures_file.write(
+                        json.dumps({"id": pid, **product, "error": error, "attempted": item})
+                        + "\n"
+                    )
+                    checkpoint.stats["failures"] += 1
+                checkpoint.done.add(pid)
+
+            for f in (results_file, failures_file):
+                f.flush()
+                os.fsync(f.fileno())
+            checkpoint.output_bytes = {
+                "results": results_file.tell(),
+                "failures": failures_file.tell(),
+            }
+            checkpoint.stats["chunks"] += 1
+            checkpoint.save()
+            processed += len(chunk)
+            if deferred:
+                log(f"⏸️ {deferred} products hit transient errors and stay pending for the next run")
+            elapsed = time.monotonic() - started
+            log(
+                f"💾 Checkpoint: {len(checkpoint.done)} done "
+                f"({checkpoint.stats['results']} ok, {checkpoint.stats['failures']} failed), "
+                f"{processed / max(elapsed, 1e-9):.1f} products/s this run"
+            )
+    finally:
+        results_file.close()
+        failures_file.close()
+
+    if deferred:
+        log(f"🏁 Bulk job stopped with {deferred} products pending; run it again to retry them")
+    else:
+        log(f"🏁 Bulk job complete: {len(checkpoint.done)} products")
+    return {
+        **checkpoint.stats,
+        "done": len(checkpoint.done),
+        "processed_this_run": processed,
+        "pending_transient": deferred,
+        "output": output_path,
+        "failures_output": failures_path,
+        "checkpoint": checkpoint.path,
+    }
@@ -14,14 +14,16 @@ logging.basicConfig(
 # Add parent directory to path to ensure imports work
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-# Import the dual categorization function
-from dual_categories import get_categorizations
-
 
 def process_products(products_json):
     try:
         products = json.loads(products_json)
         results = []
+        if not products:
+            return json.dumps(results)
+
+        # Imported here so trivial inputs do not pay for the rules module
+        from dual_categories import get_categorizations
 
         print(f"📝 Processing {len(products)} products in dual_bridge", file=sys.stderr)
 
@@ -1,9 +1,21 @@
+import argparse
 import json
 import os
 import logging
+import sys
+import time
+
+from taxonomy_utils import iter_paths
 
 logger = logging.getLogger("dual_categories")
 
+# categories.json, loaded once, and its (category, subcategory) -> subcategory index
+_categories = None
+_category_index = None
+
+# Compiled rules: (category, subcategory, product_type) -> additional categorizations
+_rule_table = None
+
 DUAL_CATEGORY_MAPPINGS = {
     # Beverages mappings
     "Beverages": {
@@ -266,20 +278,41 @@ MULTI_CATEGORY_MAPPINGS = {
 
 
 def load_categories():
-    """Load categories.json file to check available product types"""
+    """Load categories.json file to check available product types (read once per process)"""
+    global _categories
+    if _categories is not None:
+        return _categories
     try:
         categories_path = os.path.join(os.path.dirname(__file__), "categories.json")
         with open(categories_path, "r") as f:
-            return json.load(f)
+            _categories = json.load(f)
+        return _categories
     except Exception as e:
         logger.error(f"Error loading categories.json: {e}")
         return []
 
 
+def category_index():
+    """(category, subcategory) -> subcategory entry of categories.json"""
+    global _category_index
+    if _category_index is None:
+        index = {}
+        for cat in load_categories():
+            for sub in cat["subcategories"]:
+                index.setdefault((cat["name"], sub["name"]), sub)
+        _category_index = index
+    return _category_index
+
+
 def product_type_exists(category, subcategory, product_type, categories=None):
     """Check if a product_type exists in the target category/subcategory"""
     if categories is None:
-        categories = load_categories()
+        sub = category_index().get((category, subcategory))
+        if sub is None:
+            return False
+        if sub.get("gridOnly", False):
+            return product_type == subcategory
+        return product_type in sub.get("productTypes", [])
 
     for cat in categories:
         if cat["name"] == category:
@@ -448,10 +481,13 @@ def get_dual_categorization(category, subcategory, product_type):
     return None
 
 
-def get_categorizations(category, subcategory, product_type):
+def walk_categorizations(category, subcategory, product_type):
     """
-    Get all additional categorizations for a product.
+    Get all additional categorizations for a product by walking the mappings.
     Returns an array of categorizations (can be empty, single, or multiple).
+    get_categorizations answers from the compiled rule table instead; this is
+    the reference it is verified against (tests/python/test_dual_rule_table.py,
+    or python dual_categories.py --verify).
     """
     logger.info(
         f"🔍 Checking ALL categorizations for: {category}/{subcategory}/{product_type}"  # Changed log message slightly for clarity
@@ -561,3 +597,133 @@ def get_categorizations(category, subcategory, product_type):
         f"📋 Returning a total of {len(categorizations)} categorizations"
     )  # Changed log message
     return categorizations
+
+
+def compile_categorizations(category, subcategory, product_type):
+    """walk_categorizations' answer for one triple, worked out without logging"""
+    multi = MULTI_CATEGORY_MAPPINGS.get(category, {}).get(subcategory, {}).get(product_type)
+    if multi is not None and "additional_categories" in multi:
+        entries = []
+        for definition in multi["additional_categories"]:
+            entry = {
+                "main_category": definition["main_category"],
+                "subcategory": definition["subcategory"],
+            }
+            target = definition.get("product_type")
+            if target and product_type_exists(entry["main_category"], entry["subcategory"], target):
+                entry["product_type"] = target
+            entries.append(entry)
+        return entries
+
+    mapping = DUAL_CATEGORY_MAPPINGS.get(category, {}).get(subcategory)
+    if mapping is None:
+        return []
+    if subcategory == "Cheese":
+        # Cheese always leaves the product type to the LLM
+        return [{"main_category": mapping["dual_category"], "subcategory": "Cheese"}]
+
+    if "product_type_to_subcategory" in mapping:
+        targets = mapping["product_type_to_subcategory"]
+        if product_type in targets:
+            dual_subcategory = targets[product_type]
+            main_category = mapping.get("dual_category_overrides", {}).get(
+                product_type, mapping["dual_category"]
+            )
+        elif "ALL" in targets:
+            dual_subcategory = targets["ALL"]
+            main_category = mapping["dual_category"]
+        else:
+            return []
+        entry = {"main_category": main_category, "subcategory": dual_subcategory}
+        if product_type_exists(main_category, dual_subcategory, product_type):
+            entry["product_type"] = product_type
+        return [entry]
+
+    if "product_types" in mapping:
+        product_types = mapping["product_types"]
+        if "ALL" in product_types or product_type in product_types:
+            return [
+                {
+                    "main_category": mapping["dual_category"],
+                    "subcategory": mapping["dual_subcategory"],
+                }
+            ]
+    return []
+
+
+def rule_table():
+    """Additional categorizations of every categories.json path, compiled once"""
+    global _rule_table
+    if _rule_table is None:
+        _rule_table = {
+            path: compile_categorizations(*path) for path in iter_paths(load_categories())
+        }
+    return _rule_table
+
+
+def get_categorizations(category, subcategory, product_type):
+    """
+    Get all additional categorizations for a product.
+    Returns an array of categorizations (can be empty, single, or multiple).
+    """
+    entries = rule_table().get((category, subcategory, product_type))
+    if entries is None:
+        # Not a categories.json path (e.g. a model-invented one): worked out each
+        # time rather than added, so the table cannot grow in a long-lived process
+        entries = compile_categorizations(category, subcategory, product_type)
+    logger.debug(f"📋 {category}/{subcategory}/{product_type}: {len(entries)} categorizations")
+    return [dict(entry) for entry in entries]
+
+
+def verification_paths():
+    """Every categories.json path plus the triples the mappings name explicitly"""
+    paths = list(iter_paths(load_categories()))
+    for category, subcategories in MULTI_CATEGORY_MAPPINGS.items():
+        for subcategory, product_types in subcategories.items():
+            paths.extend((category, subcategory, pt) for pt in product_types)
+    for category, subcategories in DUAL_CATEGORY_MAPPINGS.items():
+        for subcategory, mapping in subcategories.items():
+            names = list(mapping.get("product_type_to_subcategory", {}))
+            names += list(mapping.get("product_types", []))
+            paths.extend((category, subcategory, pt) for pt in names + ["Unlisted Type"])
+    return list(dict.fromkeys(paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dual/multi category rules")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check the compiled rule table against walk_categorizations for every path",
+    )
+    args = parser.parse_args()
+    if not args.verify:
+        parser.error("nothing to do; pass --verify")
+
+    logger.setLevel(logging.WARNING)
+    paths = verification_paths()
+    started = time.perf_counter()
+    expected = [walk_categorizations(*path) for path in paths]
+    walk_seconds = time.perf_counter() - started
+    rule_table()
+    started = time.perf_counter()
+    actual = [get_categorizations(*path) for path in paths]
+    table_seconds = time.perf_counter() - started
+
+    mismatches = [
+        (path, want, got) for path, want, got in zip(paths, expected, actual) if want != got
+    ]
+    for path, want, got in mismatches:
+        print(f"❌ {' > '.join(path)}: expected {want}, got {got}", file=sys.stderr)
+    print(
+        f"{'❌' if mismatches else '✅'} {len(paths) - len(mismatches)}/{len(paths)} paths match "
+        f"({sum(1 for e in expected if e)} with additional categorizations); "
+        f"walk {walk_seconds / len(paths) * 1e6:.1f} µs/path, "
+        f"table {table_seconds / len(paths) * 1e6:.1f} µs/path",
+        file=sys.stderr,
+    )
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for google.genai.Client, for exercising batching, retry and
+caching logic without an API key or network access.
+
+FakeGeminiClient answers categorization prompts with valid taxonomy paths and
+product_types prompts with one of each item's options, after a configurable
+latency, and fails a configurable share of calls with 429/503 style errors.
+A configurable share of categorizations can be made invalid on purpose, and
+latency can differ per model and confidence is reported when the schema asks
+for it, so the fast/pro cascade can be exercised offline.
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from response_schemas import path_ids
+
+from taxonomy_utils import iter_paths
+
+
+class FakeAPIError(Exception):
+    """Mimics google.genai.errors.APIError closely enough for retry logic"""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+def prompt_text(contents):
+    """Concatenate the text parts of a generate_content contents argument"""
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(part for part in contents if isinstance(part, str))
+
+
+def stable_index(text, modulo):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % modulo
+
+
+class FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def list(self):
+        return []
+
+    def generate_content(self, model, contents, config=None):
+        self.client.before_call(model)
+        text = prompt_text(contents)
+        schema = (config or {}).get("response_schema")
+        if "PRODUCTS TO CATEGORIZE" in text:
+            answer = self.client.categorize_answer(text)
+            if isinstance(schema, dict) and "secondary" in schema["items"]["properties"]:
+                self.client.add_secondary_answers(text, answer)
+            if isinstance(schema, dict) and "confidence" in schema["items"]["properties"]:
+                self.client.add_confidence(answer)
+            if isinstance(schema, dict) and "path_id" in schema["items"]["properties"]:
+                ids = {path: path_id for path_id, path in path_ids(self.client.taxonomy).items()}
+                answer = [
+                    {
+                        "index": item.pop("index"),
+                        # Invalid answers become an id that does not exist
+                        "path_id": ids.get(
+                            (item.pop("category"), item.pop("subcategory"), item.pop("product_type")),
+                            0,
+                        ),
+                        **item,
+                    }
+                    for item in answer
+                ]
+            elif isinstance(schema, dict) and "path" in schema["items"]["properties"]:
+                answer = [
+                    {
+                        "index": item.pop("index"),
+                        "path": " > ".join(
+                            (
+                                item.pop("category"),
+                                item.pop("subcategory"),
+                                item.pop("product_type"),
+                            )
+                        ),
+                        **item,
+                    }
+                    for item in answer
+                ]
+        else:
+            answer = self.client.product_types_answer(text)
+            if isinstance(schema, dict) and schema.get("type") == "OBJECT":
+                answer = {item["id"]: item["product_type"] for item in answer}
+        return self.client.make_response(text, answer)
+
+    def generate_content_stream(self, model, contents, config=None):
+        """Yield the same answer as generate_content in small text chunks"""
+        response = self.generate_content(model, contents, config)
+        body = response.text
+        size = self.client.stream_chunk_chars
+        for start in range(0, len(body), size):
+            last = start + size >= len(body)
+            yield SimpleNamespace(
+                text=body[start : start + size],
+                candidates=response.candidates if last else None,
+                usage_metadata=response.usage_metadata if last else None,
+            )
+
+
+class FakeCaches:
+    def __init__(self, client):
+        self.client = client
+        self.caches = {}
+
+    def create(self, model, config=None):
+        name = f"cachedContents/fake-{len(self.caches) + 1}"
+        self.caches[name] = SimpleNamespace(name=name, model=model, expire_time=None)
+        return self.caches[name]
+
+    def get(self, name):
+        if name not in self.caches:
+            raise FakeAPIError(404, f"Cached content {name} not found")
+        return self.caches[name]
+
+    def update(self, name, config=None):
+        return self.get(name)
+
+
+class FakeGeminiClient:
+    """Deterministic (for a given seed) fake of the parts of genai.Client we use"""
+
+    def __init__(
+        self,
+        taxonomy,
+        latency_seconds=0.5,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        error_codes=(429, 503),
+        seed=0,
+        stream_chunk_chars=64,
+        invalid_rate=0.0,
+        latency_by_model=None,
+        low_confidence_rate=0.2,
+    ):
+        self.taxonomy = taxonomy
+        self.paths = list(iter_paths(taxonomy))
+        self.latency_seconds = latency_seconds
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.stream_chunk_chars = stream_chunk_chars
+        self.invalid_rate = invalid_rate
+        self.latency_by_model = latency_by_model or {}
+        self.low_confidence_rate = low_confidence_rate
+        self.calls_by_model = {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.models = FakeModels(self)
+        self.caches = FakeCaches(self)
+
+    def before_call(self, model):
+        with self.lock:
+            self.calls += 1
+            self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+            delay = self.latency_by_model.get(model, self.latency_seconds)
+            delay += self.random.uniform(0, self.latency_jitter)
+            fail = self.random.random() < self.error_rate
+            code = self.random.choice(self.error_codes) if fail else None
+            if fail:
+                self.errors += 1
+        time.sleep(delay)
+        if fail:
+            status = "RESOURCE_EXHAUSTED" if code == 429 else "UNAVAILABLE"
+            raise FakeAPIError(code, f"{status} (simulated)")
+
+    def categorize_answer(self, text):
+        descriptions = re.findall(r"^- Description: (.*)$", text, re.MULTILINE)
+        answer = []
+        for index, description in enumerate(descriptions, 1):
+            category, subcategory, product_type = self.paths[
+                stable_index(description, len(self.paths))
+            ]
+            with self.lock:
+                if self.random.random() < self.invalid_rate:
+                    product_type = "Not A Product Type"
+            answer.append(
+                {
+                    "index": index,
+                    "category": category,
+                    "subcategory": subcategory,
+                    "product_type": product_type,
+                }
+            )
+        return answer
+
+    def add_confidence(self, answer):
+        """Report low confidence for about low_confidence_rate of the items"""
+        for item in answer:
+            with self.lock:
+                low = self.random.random() < self.low_confidence_rate
+            item["confidence"] = 0.4 if low else 0.95
+
+    def add_secondary_answers(self, text, answer):
+        """Answer the SECONDARY PLACEMENTS targets triggered by each chosen path"""
+        targets = re.findall(
+            r"^- Target (.*?) \(options: (.*)\) when the path is under: (.*)$",
+            text,
+            re.MULTILINE,
+        )
+        for item in answer:
+            path = " > ".join((item["category"], item["subcategory"], item["product_type"]))
+            item["secondary"] = [
+                {"target": target, "product_type": options.split(", ")[0]}
+                for target, options, triggers in targets
+                if any(
+                    path == trigger or path.startswith(trigger + " > ")
+                    for trigger in triggers.split("; ")
+                )
+            ]
+
+    def product_types_answer(self, text):
+        ids = re.findall(r'^ID: "(.*)"$', text, re.MULTILINE)
+        options = re.findall(r"^Available product types: (.*)$", text, re.MULTILINE)
+        answer = []
+        for item_id, item_options in zip(ids, options):
+            choices = json.loads(item_options)
+            answer.append(
+                {
+                    "id": item_id,
+                    "product_type": choices[stable_index(item_id, len(choices))],
+                }
+            )
+        return answer
+
+    def make_response(self, text, answer):
+        body = json.dumps(answer)
+        prompt_tokens = len(text) // 4
+        output_tokens = len(body) // 4
+        return SimpleNamespace(
+            text=body,
+            parsed=answer,
+            candidates=[SimpleNamespace(finish_reason="STOP")],
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                cached_content_token_count=0,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Pluggable model backends for gemini_wrapper.py.
+
+- live:   google.genai.Client (needs GEMINI_API_KEY)
+- record: the live client, with every generate_content / generate_content_stream
+          request and its response (or API error) appended to a cassette file
+- replay: answers from a cassette, no network; requests that are not in the
+          cassette raise CassetteMissError, or are answered by the fake backend
+          with replay_miss="fake"
+- fake:   FakeGeminiClient synthesizing valid taxonomy answers with configurable
+          latency, error and invalid-answer rates (see fake_gemini.py)
+
+A cassette is a JSONL file, one {"key", "request", "response" | "error"} line
+per call. The key hashes the model, contents and config of the request (minus
+the cached_content name, which differs between runs), so replays are
+deterministic as long as the pipeline sends the same requests. Identical
+requests recorded several times are replayed in recorded order.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+from fake_gemini import FakeAPIError, FakeCaches, FakeGeminiClient, prompt_text
+from log_utils import log
+
+BACKENDS = ("live", "record", "replay", "fake")
+REPLAY_MISS_MODES = ("error", "fake")
+STREAM_CHUNK_CHARS = 64
+
+
+class CassetteMissError(LookupError):
+    """A replayed request is not in the cassette"""
+
+
+def canonical(value):
+    """JSON-serializable form of a request value, with bytes reduced to their hash"""
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def request_key(model, contents, config):
+    config = {k: v for k, v in (config or {}).items() if k != "cached_content"}
+    body = json.dumps(canonical([model, contents, config]), sort_keys=True)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def response_record(text, response):
+    usage = getattr(response, "usage_metadata", None)
+    candidates = getattr(response, "candidates", None) or []
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return {
+        "text": text,
+        "finish_reason": getattr(finish_reason, "name", finish_reason),
+        "usage": {
+            field: getattr(usage, field, None) or 0
+            for field in (
+                "prompt_token_count",
+                "candidates_token_count",
+                "cached_content_token_count",
+                "total_token_count",
+            )
+        },
+    }
+
+
+def parsed_json(text):
+    """What the SDK's parsed would hold for a dict-based schema, or None"""
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, dict) or (
+        isinstance(value, list) and all(isinstance(v, dict) for v in value)
+    ):
+        return value
+    return None
+
+
+def response_from_record(record):
+    return SimpleNamespace(
+        text=record["text"],
+        parsed=parsed_json(record["text"]),
+        candidates=[SimpleNamespace(finish_reason=record["finish_reason"])],
+        usage_metadata=SimpleNamespace(**record["usage"]),
+    )
+
+
+class Cassette:
+    """Append-only JSONL store of recorded calls"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+        self.positions = {}
+
+    def append(self, key, request, response=None, error=None):
+        entry = {"key": key, "request": request}
+        if error is not None:
+            entry["error"] = error
+        else:
+            entry["response"] = response
+        with self.lock:
+            self.entries.setdefault(key, []).append(entry)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def next(self, key):
+        """The next recorded entry for key (the last one repeats), or None"""
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                return None
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            return entries[min(position, len(entries) - 1)]
+
+
+def request_summary(model, contents, config):
+    """Human-readable part of a cassette entry (the key is what matches)"""
+    return {"model": model, "prompt_chars": len(prompt_text(contents))}
+
+
+class RecordingModels:
+    def __init__(self, models, cassette):
+        self.models = models
+        self.cassette = cassette
+
+    def list(self):
+        return self.models.list()
+
+    def generate_content(self, model, contents, config=None):
+        key = request_key(model, contents, config)
+        summary = request_summary(model, contents, config)
+        try:
+            response = self.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self.cassette.append(key, summary, error=error_record(e))
+            raise
+        self.cassette.append(key, summary, response_record(response.text, response))
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        key = request_key(model, contents, config)
+        summary = request_summary(model, contents, config)
+        parts = []
+        last = None
+        try:
+            for chunk in self.models.generate_content_stream(
+                model=model, contents=contents, config=config
+            ):
+                parts.append(getattr(chunk, "text", None) or "")
+                last = chunk
+                yield chunk
+        except Exception as e:
+            self.cassette.append(key, summary, error=error_record(e))
+            raise
+        self.cassette.append(key, summary, response_record("".join(parts), last))
+
+
+def error_record(error):
+    return {"code": getattr(error, "code", None), "message": str(error)}
+
+
+class RecordingClient:
+    """Live client whose model calls are appended to a cassette"""
+
+    def __init__(self, client, cassette_path):
+        self.client = client
+        self.cassette = Cassette(cassette_path)
+        self.models = RecordingModels(client.models, self.cassette)
+        self.caches = client.caches
+
+
+class ReplayModels:
+    def __init__(self, client):
+        self.client = client
+
+    def list(self):
+        return []
+
+    def lookup(self, model, contents, config):
+        entry = self.client.cassette.next(request_key(model, contents, config))
+        if entry is None:
+            return None
+        if "error" in entry:
+            raise FakeAPIError(entry["error"]["code"], entry["error"]["message"])
+        return entry["response"]
+
+    def generate_content(self, model, contents, config=None):
+        record = self.lookup(model, contents, config)
+        if record is not None:
+            return response_from_record(record)
+        return self.client.miss(model).generate_content(model, contents, config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        record = self.lookup(model, contents, config)
+        if record is None:
+            yield from self.client.miss(model).generate_content_stream(model, contents, config)
+            return
+        response = response_from_record(record)
+        text = record["text"]
+        for start in range(0, max(len(text), 1), STREAM_CHUNK_CHARS):
+            last = start + STREAM_CHUNK_CHARS >= len(text)
+            yield SimpleNamespace(
+                text=text[start : start + STREAM_CHUNK_CHARS],
+                candidates=response.candidates if last else None,
+                usage_metadata=response.usage_metadata if last else None,
+            )
+
+
+class ReplayClient:
+    """Serves recorded responses; misses go to fallback (a fake client) or raise"""
+
+    def __init__(self, cassette_path, fallback=None):
+        if not os.path.exists(cassette_path):
+            raise FileNotFoundError(f"Cassette {cassette_path} does not exist")
+        self.cassette = Cassette(cassette_path)
+        self.fallback = fallback
+        self.misses = 0
+        self.models = ReplayModels(self)
+        self.caches = FakeCaches(self)
+
+    def miss(self, model):
+        self.misses += 1
+        if self.fallback is None:
+            raise CassetteMissError(
+                f"Request for {model} is not in cassette {self.cassette.path}"
+            )
+        return self.fallback.models
+
+
+def create_client(
+    backend="live",
+    api_key=None,
+    cassette_path=None,
+    taxonomy=None,
+    replay_miss="error",
+    fake_options=None,
+):
+    """
+    Client for a backend. taxonomy is needed by the fake backend (and by replay
+    with replay_miss="fake"); fake_options are FakeGeminiClient keyword arguments.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    def fake():
+        if taxonomy is None:
+            raise ValueError("The fake backend needs a taxonomy")
+        return FakeGeminiClient(taxonomy, **(fake_options or {}))
+
+    if backend == "fake":
+        log("🧪 Using the fake Gemini backend")
+        return fake()
+    if backend == "replay":
+        if not cassette_path:
+            raise ValueError("The replay backend needs a cassette path")
+        log(f"📼 Replaying model calls from {cassette_path}")
+        return ReplayClient(cassette_path, fake() if replay_miss == "fake" else None)
+
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY environment variable not set")
+    from google import genai
+
+    client = genai.Client(api_key=api_key)
+    if backend == "record":
+        if not cassette_path:
+            raise ValueError("The record backend needs a cassette path")
+        log(f"⏺️ Recording model calls to {cassette_path}")
+        return RecordingClient(client, cassette_path)
+    return client
@@ -1,15 +1,51 @@
 #!/usr/bin/env python3
+"""
+Gemini categorization wrapper, run per batch by api_categorizer.js or as a
+--serve daemon.
+
+Startup is on the critical path when the JS side spawns this per batch, so
+heavy modules (requests, pydantic, google.genai, google.api_core, asyncio via
+batch_engine) and the optional stages (model backends, kNN, shortlisting,
+product-type chooser, secondary placements, telemetry, bulk jobs) are imported
+where they are first needed, and the model client is built on first use.
+tests/python/test_startup.py guards it; manual_task_scripts/startup_report.py
+measures it.
+"""
+import io
 import json
 import sys
 import os
-import requests
+import time
+import threading
+from types import SimpleNamespace
 import argparse
 import base64
-from typing import List, Dict, Any
-from pydantic import BaseModel
-from google import genai
+import copy
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 import logging
-from google.api_core import exceptions as google_exceptions
+from image_cache import ImageCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from image_prep import prepare_image, DEFAULT_MAX_EDGE, DEFAULT_QUALITY
+from log_utils import log
+from result_cache import (
+    ResultCache,
+    product_fingerprint,
+    product_type_question_key,
+    DEFAULT_DB_PATH,
+)
+from taxonomy_utils import taxonomy_hash, build_path_set, is_valid_categorization
+from taxonomy_cache import TaxonomyCacheManager, TAXONOMY_SYSTEM_INSTRUCTION, DEFAULT_STATE_PATH
+from product_clusters import cluster_products, spot_check_sample, DEFAULT_SPOT_CHECK_RATE
+from json_stream import JsonArrayStreamParser, parse_json_array
+from response_schemas import (
+    SCHEMA_MODES,
+    DEFAULT_SCHEMA_MODE,
+    categorization_schema,
+    decode_path_items,
+    id_table,
+    product_types_schema,
+)
 
 
 # Configure logging
@@ -18,59 +54,262 @@ logging.basicConfig(
 )
 logger = logging.getLogger("gemini_wrapper")
 
-# Configure API key
-api_key = os.environ.get("GEMINI_API_KEY")
-if not api_key:
-    logger.error("Error: GEMINI_API_KEY environment variable not set")
-    sys.exit(1)
-
-# Initialize Gemini client
-client = genai.Client(api_key=api_key)
+# Model backend (see gemini_backends.py): live, record, replay or fake. The
+# client is built on first use, so importing this module needs no API key.
+BACKEND = os.environ.get("GEMINI_BACKEND", "live")
+CASSETTE_PATH = os.environ.get("GEMINI_CASSETTE")
+REPLAY_MISS = "error"
+FAKE_OPTIONS = {}
+DEFAULT_TAXONOMY_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "categories.json"
+)
+client = None
 
-# Cache registry for taxonomy
-cache_registry = {}
+# Lifecycle of the taxonomy context cache, persisted across processes
+taxonomy_caches = None
 
 MODEL = "gemini-2.5-pro-preview-05-06"
 
+# Cascade: a faster model answers first with a self-reported confidence, and only
+# low-confidence or invalid items are escalated to MODEL
+CASCADE = False
+FAST_MODEL = "gemini-2.5-flash-preview-05-20"
+CASCADE_THRESHOLD = 0.8
+
+# Image prefetch: images for a batch are fetched concurrently over one pooled
+# session, and anything still outstanding at the batch deadline is dropped.
+# Fetches already running are not interrupted; they hold their worker until
+# they finish or hit the read timeout (manual_task_scripts/image_fetch_harness.py).
+IMAGE_FETCH_WORKERS = 8
+IMAGE_CONNECT_TIMEOUT_SECONDS = 5
+IMAGE_READ_TIMEOUT_SECONDS = 20
+IMAGE_BATCH_DEADLINE_SECONDS = 20
+# Timeouts of fetches still running at the batch deadline are cut to this
+IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS = 0.25
+
+_http_session = None
+_image_executor = None
+
+# Persistent cache of encoded images, configured from the command line in main()
+image_cache = None
+
+# Persistent categorization result cache, configured in main()
+result_cache = None
+
+# Per-call telemetry (JSONL records and/or a Prometheus textfile), configured in main()
+telemetry = None
+
+# Optional local shortlisting: when > 0, each batch only sees the subcategories
+# behind every product's top-K locally ranked taxonomy paths
+SHORTLIST_TOP_K = 0
+# Follow-up requests for items that came back invalid or missing
+SALVAGE_ROUNDS = 1
+
+# How tightly the response schema is tied to the taxonomy (see response_schemas).
+# Batch engine workers fall back to "free" concurrently, so changes take the lock.
+SCHEMA_MODE = DEFAULT_SCHEMA_MODE
+_schema_mode_lock = threading.Lock()
+_shortlisters = {}
+
+# Optional local kNN stage: products whose kNN confidence reaches the threshold
+# are answered without the model (0 disables it)
+KNN_THRESHOLD = 0
+# Labelled example files; None uses taxonomy_shortlist's training data
+KNN_EXAMPLES = None
+knn_classifier = None
+
+# Optional near-duplicate clustering for categorize_all: one model answer per
+# cluster of products this similar (0 disables it), confirmed by spot-checks
+CLUSTER_THRESHOLD = 0
+SPOT_CHECK_RATE = DEFAULT_SPOT_CHECK_RATE
+
+# Optional local product-type chooser for product_types requests: answers when
+# the best option's similarity beats the runner-up by this margin (0 disables it)
+PRODUCT_TYPE_MARGIN = 0
+product_type_chooser = None
+# Taxonomy of the latest categorize request, embedded by the chooser on first use
+product_type_taxonomy = None
+
+# Running totals for product_types deduplication, logged after every request
+product_type_stats = {
+    "requests": 0,
+    "items": 0,
+    "items_sent": 0,
+    "memo_hits": 0,
+    "model_calls": 0,
+    "model_calls_avoided": 0,
+    "local_answers": 0,
+}
+
+# Images are downscaled/recompressed before inlining; a max edge of 0 disables it
+IMAGE_MAX_EDGE = DEFAULT_MAX_EDGE
+IMAGE_QUALITY = DEFAULT_QUALITY
+
+
+@functools.lru_cache(maxsize=None)
+def product_type_result_model():
+    """Pydantic model for structured product_types output (pydantic loads on first use)"""
+    from pydantic import BaseModel
+
+    class ProductTypeResult(BaseModel):
+        id: str
+        product_type: str
+
+    return ProductTypeResult
+
+
+def get_http_session():
+    """Shared keep-alive HTTP session sized for the image fetch pool"""
+    global _http_session
+    if _http_session is None:
+        import requests
+
+        _http_session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=IMAGE_FETCH_WORKERS, pool_maxsize=IMAGE_FETCH_WORKERS
+        )
+        _http_session.mount("http://", adapter)
+        _http_session.mount("https://", adapter)
+    return _http_session
 
-# Define Pydantic models for structured output
-class ProductType(BaseModel):
-    category: str
-    subcategory: str
-    product_type: str
 
+def get_image_executor():
+    """Shared thread pool used to fetch images concurrently"""
+    global _image_executor
+    if _image_executor is None:
+        _image_executor = ThreadPoolExecutor(
+            max_workers=IMAGE_FETCH_WORKERS, thread_name_prefix="image-fetch"
+        )
+    return _image_executor
 
-class ProductTypeResult(BaseModel):
-    id: str
-    product_type: str
 
+def image_cache_key(url):
+    """Cache key for an image URL under the current image preparation settings"""
+    if not IMAGE_MAX_EDGE:
+        return url
+    return f"{url}#max{IMAGE_MAX_EDGE}q{IMAGE_QUALITY}"
 
-def log(message):
-    """Log messages to stderr to keep stdout clean for JSON output"""
-    print(message, file=sys.stderr)
 
+def load_image(url, session=None, deadline=None):
+    """
+    Load image from URL, downscale it and convert to base64, going through the image cache.
+    With a deadline (time.monotonic() value) the request timeouts end at the
+    deadline, or IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS after starting if it has passed.
+    """
+    cache_key = image_cache_key(url)
+    cached = image_cache.get(cache_key) if image_cache else None
+    if cached and image_cache.is_fresh(cached):
+        return {"mime_type": cached["mime_type"], "data": cached["data"]}
 
-def load_image(url):
-    """Load image from URL and convert to base64"""
     try:
-        response = requests.get(url, timeout=20)
+        session = session or get_http_session()
+        headers = image_cache.revalidation_headers(cached) if cached else {}
+        timeout = (IMAGE_CONNECT_TIMEOUT_SECONDS, IMAGE_READ_TIMEOUT_SECONDS)
+        if deadline is not None:
+            remaining = max(deadline - time.monotonic(), IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS)
+            timeout = tuple(min(seconds, remaining) for seconds in timeout)
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            image_cache.mark_revalidated(cache_key, cached)
+            return {"mime_type": cached["mime_type"], "data": cached["data"]}
         if not response.ok:
             log(f"Failed to load image: {url} (Status: {response.status_code})")
             return None
 
-        image_data = base64.b64encode(response.content).decode("utf-8")
-        content_type = response.headers.get("Content-Type", "image/jpeg")
-        return {"mime_type": content_type, "data": image_data}
+        content, content_type = prepare_image(
+            response.content, IMAGE_MAX_EDGE, IMAGE_QUALITY
+        )
+        image_data = base64.b64encode(content).decode("utf-8")
+        content_type = content_type or response.headers.get("Content-Type", "image/jpeg")
+        image = {"mime_type": content_type, "data": image_data}
+        if image_cache:
+            image_cache.put(
+                cache_key,
+                image,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        return image
     except Exception as e:
         log(f"Error loading image {url}: {str(e)}")
+        if cached:
+            log(f"♻️ Using stale cached image for {url}")
+            return {"mime_type": cached["mime_type"], "data": cached["data"]}
         return None
 
 
+def load_images(urls, deadline_seconds=IMAGE_BATCH_DEADLINE_SECONDS, session=None):
+    """
+    Load several images concurrently.
+    Returns a list aligned with urls; entries are None for missing URLs, failed
+    downloads and images that did not arrive before the batch deadline.
+    Queued fetches are cancelled at the deadline. Ones already running have their
+    timeouts capped at the deadline, so they give back their pool worker at most
+    IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS or so after it.
+    """
+    results = [None] * len(urls)
+    executor = get_image_executor()
+    deadline = time.monotonic() + deadline_seconds
+    futures = {
+        executor.submit(load_image, url, session, deadline): i
+        for i, url in enumerate(urls)
+        if url
+    }
+    if not futures:
+        return results
+
+    try:
+        for future in as_completed(futures, timeout=deadline_seconds):
+            results[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        late = [future for future in futures if not future.done()]
+        for future in late:
+            future.cancel()
+        log(
+            f"⏱️ Image deadline of {deadline_seconds}s reached, dropping {len(late)} images"
+        )
+
+    return results
+
+
+def get_client():
+    """The model client for BACKEND, created on first use"""
+    global client
+    if client is None:
+        import gemini_backends
+
+        taxonomy = None
+        if BACKEND == "fake" or (BACKEND == "replay" and REPLAY_MISS == "fake"):
+            with open(DEFAULT_TAXONOMY_PATH, "r") as f:
+                taxonomy = json.load(f)
+        client = gemini_backends.create_client(
+            BACKEND,
+            api_key=os.environ.get("GEMINI_API_KEY"),
+            cassette_path=CASSETTE_PATH,
+            taxonomy=taxonomy,
+            replay_miss=REPLAY_MISS,
+            fake_options=FAKE_OPTIONS,
+        )
+    return client
+
+
+def get_taxonomy_caches():
+    """
+    The TaxonomyCacheManager for the current client, created on first use. Only
+    the live backend shares the on-disk state; the others keep theirs in memory.
+    """
+    global taxonomy_caches
+    if taxonomy_caches is None:
+        state_path = DEFAULT_STATE_PATH if BACKEND == "live" else None
+        taxonomy_caches = TaxonomyCacheManager(get_client(), state_path)
+    return taxonomy_caches
+
+
 def list_models_with_capabilities():
     """List available models and their supported actions"""
     log("📋 Listing available models and their capabilities:")
     try:
-        for model in client.models.list():
+        for model in get_client().models.list():
             log(f"🔹 Model: {model.name}")
             if hasattr(model, "supported_actions"):
                 log(f"  ↳ Supported actions: {model.supported_actions}")
@@ -78,215 +317,1123 @@ def list_models_with_capabilities():
         log(f"❌ Error listing models: {str(e)}")
 
 
-def create_taxonomy_cache(taxonomy, existing_cache_name=None):
-    """Create or get cache for taxonomy"""
-    taxonomy_str = json.dumps(taxonomy)
+def create_taxonomy_cache(taxonomy, existing_cache_name=None, model=MODEL, id_coded=False):
+    """Create or get cache for taxonomy (as the path id table with id_coded)"""
+    return get_taxonomy_caches().get_cache_name(
+        model, taxonomy, existing_cache_name, id_coded=id_coded
+    )
+
+
+def get_knn_classifier():
+    """The local kNN classifier, built on first use; None if it cannot be built"""
+    global knn_classifier, KNN_THRESHOLD
+    if knn_classifier is None:
+        from knn_classifier import KnnClassifier
+        from taxonomy_shortlist import DEFAULT_TRAINING_DATA_PATH
 
-    if existing_cache_name:
         try:
-            log(f"🔍 Checking for existing cache: {existing_cache_name}")
-            cache = client.caches.get(name=existing_cache_name)
-            log(
-                f"✅ Successfully found and using existing taxonomy cache: {cache.name}"
-            )
-            return cache.name
-        except google_exceptions.NotFound:
-            log(
-                f"⚠️ Existing cache {existing_cache_name} not found or expired. Creating a new one."
-            )
+            knn_classifier = KnnClassifier.from_files(KNN_EXAMPLES or [DEFAULT_TRAINING_DATA_PATH])
+        except ImportError as e:
+            log(f"⚠️ kNN classifier disabled, missing dependency: {e}")
+            KNN_THRESHOLD = 0
         except Exception as e:
-            log(
-                f"❌ Error retrieving existing cache {existing_cache_name}: {str(e)}. Will attempt to create a new one."
-            )
+            log(f"⚠️ kNN classifier disabled, could not load it: {e}")
+            KNN_THRESHOLD = 0
+    return knn_classifier
+
 
+def classify_locally(products):
+    """kNN guesses for products, or None if the classifier fails (which disables it)"""
+    global KNN_THRESHOLD
     try:
-        log(f"🔍 Creating new cache with taxonomy ({len(taxonomy_str)} chars)")
-        log(f"🔧 Attempting to create new cache with model: {MODEL}")
-        cache = client.caches.create(
-            model=MODEL,
-            config={
-                "contents": taxonomy_str,
-                "system_instruction": "You are a product categorization expert that strictly follows the provided taxonomy. Always choose the most specific valid category for each product without inventing new categories.",
-                "ttl": "3600s",
-            },
-        )
-        log(f"✅ Successfully created new taxonomy cache: {cache.name}")
-        if hasattr(cache, "usage_metadata"):
-            log(f"📊 New cache usage metadata: {cache.usage_metadata}")
-        return cache.name
+        return get_knn_classifier().classify(products)
     except Exception as e:
-        log(f"❌ Error creating new cache: {str(e)}")
+        # The embedding model loads on first use: downloads and weights can fail
+        log(f"⚠️ kNN classifier disabled, classification failed: {e}")
+        KNN_THRESHOLD = 0
         return None
 
 
-def extract_json(text):
-    """Extract JSON from text response (fallback method)"""
-    try:
-        # First try to parse the entire response as JSON
-        return json.loads(text)
-    except json.JSONDecodeError:
-        log("🔍 Response wasn't valid JSON, trying to extract JSON...")
-
-        # Look for JSON array pattern
-        import re
-
-        json_match = re.search(r"\[\s*\{.*\}\s*\]", text, re.DOTALL)
-        if json_match:
-            try:
-                return json.loads(json_match.group(0))
-            except json.JSONDecodeError:
-                pass
-
-        # Try to find JSON in code blocks
-        code_blocks = re.findall(r"```(?:json)?\s*([\s\S]*?)```", text)
-        for block in code_blocks:
-            try:
-                return json.loads(block)
-            except json.JSONDecodeError:
-                continue
+def get_product_type_chooser(taxonomy=None):
+    """
+    The local product-type chooser (None when disabled), with the taxonomy's
+    product types embedded if one is given.
+    """
+    global product_type_chooser, PRODUCT_TYPE_MARGIN
+    if not PRODUCT_TYPE_MARGIN:
+        return None
+    if product_type_chooser is None:
+        from product_type_chooser import ProductTypeChooser
 
-        log(f"❌ Failed to extract JSON from response: {text[:200]}...")
-        raise ValueError("Could not extract JSON from response")
+        product_type_chooser = ProductTypeChooser(margin=PRODUCT_TYPE_MARGIN)
+    if taxonomy:
+        try:
+            product_type_chooser.precompute(taxonomy)
+        except ImportError as e:
+            log(f"⚠️ Local product-type chooser disabled, missing dependency: {e}")
+            PRODUCT_TYPE_MARGIN = 0
+            return None
+        except Exception as e:
+            log(f"⚠️ Local product-type chooser disabled, could not load it: {e}")
+            PRODUCT_TYPE_MARGIN = 0
+            return None
+    return product_type_chooser
 
 
-def categorize_products(products, taxonomy, existing_taxonomy_cache_name=None):
-    """Categorize products using Gemini API with structured output"""
-    log(f"🏷️ Categorizing {len(products)} products")
-    final_categorizations = []
-    used_cache_name = None
-
+def choose_product_types_locally(batch_items):
+    """{"id": product_type} for the items the local chooser is confident about"""
+    global PRODUCT_TYPE_MARGIN
+    if not PRODUCT_TYPE_MARGIN or not batch_items:
+        return {}
+    chooser = get_product_type_chooser(product_type_taxonomy)
+    if not chooser:
+        return {}
     try:
-        used_cache_name = create_taxonomy_cache(taxonomy, existing_taxonomy_cache_name)
-
-        prompt_text = f"""Categorize these grocery products. ONLY use exact categories, subcategories, and product types from the taxonomy below.
+        return chooser.choose(batch_items)
+    except ImportError as e:
+        log(f"⚠️ Local product-type chooser disabled, missing dependency: {e}")
+        PRODUCT_TYPE_MARGIN = 0
+        return {}
+    except Exception as e:
+        log(f"⚠️ Local product-type chooser disabled, choosing failed: {e}")
+        PRODUCT_TYPE_MARGIN = 0
+        return {}
+
+
+def get_shortlister(taxonomy):
+    """Shortlister for a taxonomy, built once per taxonomy version"""
+    key = taxonomy_hash(taxonomy)
+    if key not in _shortlisters:
+        from taxonomy_shortlist import TaxonomyShortlister
+
+        _shortlisters[key] = TaxonomyShortlister.from_files(taxonomy)
+    return _shortlisters[key]
+
+
+def rejected_answer(rejected):
+    """A rejected categorization as the model gave it, for the NOT VALID prompt line"""
+    if not rejected.get("category") and "path_id" in rejected:
+        return f"path_id {rejected['path_id']}"
+    if not rejected.get("category") and "path" in rejected:
+        return str(rejected["path"])
+    return f"{rejected.get('category')} → {rejected.get('subcategory')} → {rejected.get('product_type')}"
+
+
+def build_categorize_prompt(
+    products,
+    taxonomy,
+    taxonomy_in_cache,
+    pruned=False,
+    schema_mode="free",
+    secondary_section="",
+    with_confidence=False,
+    id_taxonomy=None,
+):
+    """
+    Build the categorization prompt. When the taxonomy is already in the context
+    cache it is referenced rather than inlined, so it is not sent twice.
+    schema_mode "path" asks for one "path" string per item instead of three fields;
+    "id" lists the taxonomy as a path id table (ids from id_taxonomy, the full
+    taxonomy, when taxonomy is pruned) and asks for one "path_id" per item.
+    secondary_section (see secondary_placements) also asks for secondary placements,
+    and with_confidence asks for a self-reported confidence per item.
+    """
+    if taxonomy_in_cache:
+        taxonomy_section = "Use the COMPLETE TAXONOMY provided in the cached context."
+    elif schema_mode == "id":
+        table = id_table(id_taxonomy or taxonomy, subset=taxonomy if pruned else None)
+        taxonomy_section = f"""{'CANDIDATE' if pruned else 'COMPLETE'} TAXONOMY PATHS (one line per "Category > Subcategory", then path_id=Product Type):
+{table}"""
+    elif pruned:
+        taxonomy_section = f"""CANDIDATE TAXONOMY (the part of the taxonomy that can apply to these products):
+{json.dumps(taxonomy, indent=1)}"""
+    else:
+        taxonomy_section = f"""COMPLETE TAXONOMY:
+{json.dumps(taxonomy, indent=1)}"""
+
+    prompt_text = f"""Categorize these grocery products. ONLY use exact categories, subcategories, and product types from the taxonomy below.
 CRITICAL: Do not invent or create new categories, subcategories, or product types.
 IMPORTANT: Pay close attention to the hierarchical structure of the taxonomy. Each subcategory belongs to ONLY ONE specific category, and each product type belongs to ONLY ONE specific subcategory. Verify the complete path (category → subcategory → product type) is valid before assigning it.
 
-COMPLETE TAXONOMY:
-{json.dumps(taxonomy, indent=1)}
+{taxonomy_section}
 
 PRODUCTS TO CATEGORIZE:
 """
-        for i, product in enumerate(products):
-            prompt_text += f"""
+    for i, product in enumerate(products):
+        prompt_text += f"""
 PRODUCT {i + 1}:
 - Description: {product.get('description', 'Unknown')}
 - Brand: {product.get('brand', 'Unknown')}
 - Size: {product.get('items', [{}])[0].get('size', 'Unknown') if product.get('items') else 'Unknown'}
 - Temperature: {product.get('temperature', {}).get('indicator', 'Unknown')}
 """
+        rejected = product.get("rejected_categorization")
+        if rejected:
+            prompt_text += f"""- NOT VALID (previous answer, not in the taxonomy): {rejected_answer(rejected)}
+"""
+    extra_fields = ""
+    if secondary_section:
+        prompt_text += "\n" + secondary_section
+        extra_fields += """- "secondary": array - {"target", "product_type"} objects for SECONDARY PLACEMENTS (usually empty)
+"""
+    if with_confidence:
+        extra_fields += """- "confidence": number - from 0 to 1, how sure you are that the path is correct
+"""
+
+    if schema_mode == "id":
         prompt_text += """
 RESPONSE FORMAT: You must respond ONLY with a JSON array with NO explanation text.
 Each item in the array must have EXACTLY these fields:
+- "index": integer - the PRODUCT number the item is for
+- "path_id": integer - the id of the chosen path from the taxonomy paths
+""" + extra_fields + """
+EXAMPLE CORRECT RESPONSE FORMAT:
+[
+  {
+    "index": 1,
+    "path_id": 3
+  }
+]
+"""
+        return prompt_text
+
+    if schema_mode == "path":
+        prompt_text += """
+RESPONSE FORMAT: You must respond ONLY with a JSON array with NO explanation text.
+Each item in the array must have EXACTLY these fields:
+- "index": integer - the PRODUCT number the item is for
+- "path": string - the full taxonomy path as "Category > Subcategory > Product Type"
+""" + extra_fields + """
+EXAMPLE CORRECT RESPONSE FORMAT:
+[
+  {
+    "index": 1,
+    "path": "Produce > Fresh Fruits > Apples"
+  }
+]
+"""
+        return prompt_text
+
+    prompt_text += """
+RESPONSE FORMAT: You must respond ONLY with a JSON array with NO explanation text.
+Each item in the array must have EXACTLY these fields:
+- "index": integer - the PRODUCT number the item is for
 - "category": string - one of the category names from the taxonomy
 - "subcategory": string - one of the subcategory names from the taxonomy
 - "product_type": string - one of the product types from the taxonomy
-
+""" + extra_fields + """
 EXAMPLE CORRECT RESPONSE FORMAT:
 [
   {
+    "index": 1,
     "category": "Produce",
     "subcategory": "Fresh Fruits",
     "product_type": "Apples"
   }
 ]
 """
-        multi_content = [prompt_text]
-        for i, product in enumerate(products):
-            image_url = product.get("image_url")
-            if image_url:
-                log(f"🖼️ Loading image for product {i+1}: {image_url}")
-                image_data = load_image(image_url)
-                if image_data:
-                    multi_content.append({"inline_data": image_data})
-                    log(f"✅ Added image for product {i+1}")
+    return prompt_text
 
-        config = {
-            "temperature": 0.1,
-            "max_output_tokens": 65536,
-            "response_mime_type": "application/json",
-            "response_schema": {
-                "type": "ARRAY",
-                "items": {
-                    "type": "OBJECT",
-                    "properties": {
-                        "category": {"type": "STRING"},
-                        "subcategory": {"type": "STRING"},
-                        "product_type": {"type": "STRING"},
-                    },
-                },
-            },
-        }
 
-        if used_cache_name:
-            config["cached_content"] = used_cache_name
-            log(f"💾 Using taxonomy cache: {used_cache_name}")
-        else:
-            log(f"⚠️ Proceeding without taxonomy cache.")
+def api_exception_types(*names):
+    """google.api_core exception classes by name, or none without the library (fake client)"""
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return ()
+    return tuple(getattr(google_exceptions, name) for name in names)
+
+
+def is_schema_rejected_error(error):
+    """True if an API error looks like the request (e.g. a large enum schema) was rejected"""
+    if isinstance(error, api_exception_types("InvalidArgument")):
+        return True
+    message = str(error)
+    return "INVALID_ARGUMENT" in message or (
+        "400" in message and "schema" in message.lower()
+    )
+
+
+def is_cache_missing_error(error):
+    """True if an API error says the cached content no longer exists"""
+    if isinstance(error, api_exception_types("NotFound")):
+        return True
+    message = str(error).lower()
+    return "cached" in message and ("not found" in message or "expired" in message)
+
+
+def extract_json(text):
+    """Extract JSON from text response (fallback method)"""
+    try:
+        # First try to parse the entire response as JSON
+        return json.loads(text)
+    except json.JSONDecodeError:
+        log("🔍 Response wasn't valid JSON, trying to extract JSON...")
+
+    # Scan for an array of objects, tolerating prose, code fences and truncation
+    try:
+        return parse_json_array(text)
+    except ValueError:
+        log(f"❌ Failed to extract JSON from response: {text[:200]}...")
+        raise ValueError("Could not extract JSON from response")
+
 
-        log(f"🔄 Sending categorization request to model: {MODEL}")
-        response = client.models.generate_content(
-            model=MODEL, contents=multi_content, config=config
+def categorize_products(
+    products,
+    taxonomy,
+    existing_taxonomy_cache_name=None,
+    request_fn=None,
+    on_item=None,
+    combined=False,
+):
+    """
+    Categorize products, answering from the result cache and the local kNN
+    classifier (when KNN_THRESHOLD is set) where possible and sending only the
+    rest to request_fn (a single model call by default). force_llm products
+    always go to the model.
+
+    With on_item, the model response is streamed and on_item(index, categorization,
+    valid) is called for each product as soon as its result is known, cache hits first.
+
+    With combined, the model also answers secondary placements and every valid
+    categorization gets its additional_categorizations (see secondary_placements).
+    """
+    request_fn = request_fn or categorize_with_model
+    request_kwargs = {"combined": True} if combined else {}
+    path_set = build_path_set(taxonomy)
+    rules = None
+    if combined:
+        from secondary_placements import secondary_rules
+
+        rules = secondary_rules(taxonomy)
+
+    def finish(item):
+        if combined and is_valid_categorization(item, path_set):
+            item["additional_categorizations"] = rules.additional_categorizations(item)
+        if isinstance(item, dict):
+            item.pop("secondary", None)
+        return item
+
+    def finish_all(result):
+        for item in result["categorizations"]:
+            finish(item)
+        return result
+
+    if on_item:
+
+        def stream_to(indexes):
+            def emit(j, item):
+                if j < len(indexes):
+                    item = finish(dict(item))
+                    on_item(indexes[j], item, is_valid_categorization(item, path_set))
+
+            return emit
+
+    answered = {}
+    if result_cache:
+        result_cache.use_taxonomy(taxonomy_hash(taxonomy))
+        fingerprints = [product_fingerprint(product) for product in products]
+        cached = result_cache.get_many(
+            [fp for fp, p in zip(fingerprints, products) if not p.get("force_llm")]
+        )
+        for i, (fp, product) in enumerate(zip(fingerprints, products)):
+            if not product.get("force_llm") and fp in cached:
+                answered[i] = {**cached[fp], "status": "cached"}
+        log(
+            f"💾 Result cache: {len(answered)} hits, {len(products) - len(answered)} misses"
         )
 
-        if hasattr(response, "usage_metadata"):
-            log(f"📊 Usage metadata: {response.usage_metadata}")
-            if hasattr(
-                response.usage_metadata, "token_count"
-            ):  # Check attribute existence
-                token_data = response.usage_metadata.token_count
-                log(
-                    f"📝 Token usage - Total: {getattr(token_data, 'total_tokens', 'N/A')}, Input: {getattr(token_data, 'input_tokens', 'N/A')}, Output: {getattr(token_data, 'output_tokens', 'N/A')}"
-                )
+    classifier = get_knn_classifier() if KNN_THRESHOLD else None
+    knn_resolved = 0
+    if classifier:
+        candidates = [
+            i
+            for i, product in enumerate(products)
+            if i not in answered and not product.get("force_llm")
+        ]
+        guesses = classify_locally([products[i] for i in candidates]) or []
+        for i, guess in zip(candidates, guesses):
             if (
-                hasattr(response.usage_metadata, "cached_content_token_count")
-                and response.usage_metadata.cached_content_token_count > 0
+                guess
+                and guess["confidence"] >= KNN_THRESHOLD
+                and is_valid_categorization(guess, path_set)
             ):
-                log(
-                    f"💰 Cache hit! {response.usage_metadata.cached_content_token_count} tokens (from cached_content_token_count) were served from cache"
-                )
+                answered[i] = {**guess, "status": "knn"}
+                knn_resolved += 1
+        log(f"🧭 kNN resolved {knn_resolved}/{len(candidates)} products locally")
+
+    miss_indexes = [i for i in range(len(products)) if i not in answered]
+    local_summary = {"cached": len(answered) - knn_resolved, "knn": knn_resolved}
+
+    if on_item:
+        for i in sorted(answered):
+            on_item(i, finish(dict(answered[i])), True)
+        request_kwargs["on_item"] = stream_to(miss_indexes)
+
+    if not miss_indexes:
+        return finish_all(
+            {
+                "categorizations": [answered[i] for i in range(len(products))],
+                "taxonomy_cache_name": existing_taxonomy_cache_name,
+                "locally_resolved": local_summary,
+            }
+        )
+
+    result = request_fn(
+        [products[i] for i in miss_indexes],
+        taxonomy,
+        existing_taxonomy_cache_name,
+        **request_kwargs,
+    )
+    result["locally_resolved"] = local_summary
+    fresh = result["categorizations"]
+    if result_cache and len(fresh) != len(miss_indexes):
+        log(
+            f"⚠️ Model returned {len(fresh)} results for {len(miss_indexes)} products, not caching this batch"
+        )
+    elif result_cache:
+        result_cache.put_many(
+            (fingerprints[i], item)
+            for i, item in zip(miss_indexes, fresh)
+            if is_valid_categorization(item, path_set)
+        )
+
+    if len(miss_indexes) == len(products):
+        return finish_all(result)
+
+    categorizations = [answered.get(i) for i in range(len(products))]
+    for j, i in enumerate(miss_indexes):
+        categorizations[i] = fresh[j] if j < len(fresh) else {}
+    result["categorizations"] = categorizations
+    return finish_all(result)
+
+
+def is_transient_failure(categorization):
+    """True for items of a batch that failed on quota/overload errors after all retries"""
+    from batch_engine import is_retryable_error
+
+    error = categorization.get("error")
+    return bool(error) and is_retryable_error(error)
+
+
+def log_token_usage(response):
+    usage = usage_summary(response)
+    log(
+        f"📝 Token usage - Total: {usage['total_tokens']}, Input: {usage['prompt_tokens']}, "
+        f"Output: {usage['output_tokens']}, Thinking: {usage['thoughts_tokens']}, "
+        f"Cached: {usage['cached_tokens']}"
+    )
+
+
+def record_call(
+    kind,
+    model,
+    products,
+    started,
+    response=None,
+    parse_path="none",
+    streamed=False,
+    image_count=0,
+    image_fetch_seconds=0.0,
+    error=None,
+):
+    """Write one telemetry record for a model call (no-op unless telemetry is configured)"""
+    if telemetry is None:
+        return
+    usage = usage_summary(response) if response is not None else {}
+    telemetry.record(
+        kind=kind,
+        model=model,
+        batch_size=len(products),
+        image_count=image_count,
+        image_fetch_seconds=round(image_fetch_seconds, 3),
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        thoughts_tokens=usage.get("thoughts_tokens", 0),
+        cached_tokens=usage.get("cached_tokens", 0),
+        total_tokens=usage.get("total_tokens", 0),
+        finish_reason=usage.get("finish_reason"),
+        parse_path=parse_path,
+        streamed=streamed,
+        wall_seconds=round(time.monotonic() - started, 3),
+        error=str(error) if error is not None else None,
+    )
+
 
+def usage_summary(response):
+    """
+    Token counts and finish reason from a generate_content response. Thinking
+    tokens are reported apart from output tokens, but count against
+    max_output_tokens.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    candidates = getattr(response, "candidates", None) or []
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", None) or 0,
+        "thoughts_tokens": getattr(usage, "thoughts_token_count", None) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+        "total_tokens": getattr(usage, "total_token_count", None) or 0,
+        "finish_reason": getattr(finish_reason, "name", finish_reason),
+    }
+
+
+def categorize_all(
+    products, taxonomy, existing_taxonomy_cache_name=None, options=None, combined=False
+):
+    """
+    Categorize a whole product list: cache misses are split into batches and run
+    through the asyncio BatchEngine with several requests in flight. Batch sizes
+    adapt to observed token usage unless options["adaptive"] is false, in which
+    case options["batch_size"] is used as is.
+
+    With a cluster threshold (options["cluster_threshold"], default
+    CLUSTER_THRESHOLD), near-duplicate products are categorized once per cluster
+    (see categorize_clustered).
+    """
+    import asyncio
+
+    import batch_engine
+
+    options = options or {}
+    stats = {}
+
+    def run_engine(miss_products, taxonomy, cache_name, combined=False):
+        engine = batch_engine.BatchEngine(
+            functools.partial(
+                request_cascade if CASCADE else request_with_salvage, combined=combined
+            ),
+            concurrency=options.get("concurrency", batch_engine.DEFAULT_CONCURRENCY),
+            requests_per_minute=options.get(
+                "requests_per_minute", batch_engine.DEFAULT_REQUESTS_PER_MINUTE
+            ),
+            tokens_per_minute=options.get(
+                "tokens_per_minute", batch_engine.DEFAULT_TOKENS_PER_MINUTE
+            ),
+        )
+        result = asyncio.run(
+            engine.run(
+                miss_products,
+                taxonomy,
+                options.get("batch_size", batch_engine.DEFAULT_BATCH_SIZE),
+                cache_name,
+                adaptive=options.get("adaptive", True),
+            )
+        )
+        # A clustered run can re-check inconsistent clusters in a second engine run
+        if stats:
+            stats.setdefault("additional_runs", []).append(result.pop("stats"))
+        else:
+            stats.update(result.pop("stats"))
+        return result
+
+    def categorize(subset, cache_name):
+        return categorize_products(
+            subset, taxonomy, cache_name, request_fn=run_engine, combined=combined
+        )
+
+    threshold = options.get("cluster_threshold", CLUSTER_THRESHOLD)
+    if threshold:
+        result = categorize_clustered(
+            products,
+            categorize,
+            existing_taxonomy_cache_name,
+            threshold,
+            options.get("spot_check_rate", SPOT_CHECK_RATE),
+            build_path_set(taxonomy),
+        )
+        stats["clusters"] = result.pop("cluster_stats")
+    else:
+        result = categorize(products, existing_taxonomy_cache_name)
+    result["stats"] = stats
+    return result
+
+
+def categorize_clustered(
+    products, categorize, existing_taxonomy_cache_name, threshold, spot_check_rate, path_set
+):
+    """
+    Categorize one representative per near-duplicate cluster plus a spot-check
+    sample of members with categorize(products, cache_name), and copy each
+    representative's answer to the rest of its cluster (status "clustered").
+    A cluster whose representative has no valid answer in path_set, or whose
+    spot-check disagrees with it, is not trusted: its remaining members are
+    categorized individually.
+    """
+    eligible = [i for i, p in enumerate(products) if not p.get("force_llm")]
+    clusters = [
+        [eligible[j] for j in cluster]
+        for cluster in cluster_products([products[i] for i in eligible], threshold)
+    ]
+    clusters += [[i] for i, p in enumerate(products) if p.get("force_llm")]
+    samples = spot_check_sample(clusters, spot_check_rate)
+
+    categorizations = [None] * len(products)
+    first = [cluster[0] for cluster in clusters] + samples
+    result = categorize([products[i] for i in first], existing_taxonomy_cache_name)
+    for i, item in zip(first, result["categorizations"]):
+        categorizations[i] = item
+
+    def path(item):
+        return tuple((item or {}).get(f) for f in ("category", "subcategory", "product_type"))
+
+    sampled = set(samples)
+    untrusted = []
+    unanswered = []
+    for cluster in clusters:
+        representative = categorizations[cluster[0]]
+        if len(cluster) > 1 and not is_valid_categorization(representative, path_set):
+            unanswered.append(cluster)
+            continue
+        checks = [i for i in cluster[1:] if i in sampled]
+        if any(path(categorizations[i]) != path(representative) for i in checks):
+            untrusted.append(cluster)
+            continue
+        for i in cluster[1:]:
+            if i not in sampled:
+                categorizations[i] = {**copy.deepcopy(representative), "status": "clustered"}
+
+    rest = [i for cluster in untrusted + unanswered for i in cluster[1:] if i not in sampled]
+    if rest:
+        log(
+            f"🔁 {len(untrusted)} clusters failed their spot-check and "
+            f"{len(unanswered)} have no valid representative answer, "
+            f"categorizing {len(rest)} members individually"
+        )
+        second = categorize([products[i] for i in rest], result.get("taxonomy_cache_name"))
+        for i, item in zip(rest, second["categorizations"]):
+            categorizations[i] = item
+
+    multi = [c for c in clusters if len(c) > 1]
+    cluster_stats = {
+        "clusters": len(clusters),
+        "multi_product_clusters": len(multi),
+        "products_sent": len(first) + len(rest),
+        "spot_checks": len(samples),
+        "inconsistent_clusters": len(untrusted),
+        "unanswered_clusters": len(unanswered),
+        "propagated": sum(
+            1 for item in categorizations if item and item.get("status") == "clustered"
+        ),
+    }
+    log(
+        f"🧩 Clustering: {len(products)} products in {len(clusters)} clusters, "
+        f"{cluster_stats['products_sent']} categorized, {cluster_stats['propagated']} propagated, "
+        f"{len(untrusted)}/{len(multi)} clusters inconsistent"
+    )
+    result["categorizations"] = [item if item is not None else {} for item in categorizations]
+    result["cluster_stats"] = cluster_stats
+    return result
+
+
+def categorize_with_model(
+    products, taxonomy, existing_taxonomy_cache_name=None, on_item=None, combined=False
+):
+    """Categorize products using Gemini API with structured output"""
+    try:
+        return (request_cascade if CASCADE else request_with_salvage)(
+            products,
+            taxonomy,
+            existing_taxonomy_cache_name,
+            on_item=on_item,
+            combined=combined,
+        )
+    except Exception as e:
+        log(f"❌ Error in categorize_products: {str(e)}")
+        return {
+            "categorizations": [],
+            "taxonomy_cache_name": get_taxonomy_caches().current_name(MODEL),
+        }
+
+
+def align_categorizations(count, items):
+    """
+    Place returned items at the product position given by their 1-based "index"
+    field, dropping the field. Items without a usable index fill the remaining
+    positions in order. Positions with no item are None.
+    """
+    aligned = [None] * count
+    unplaced = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item = dict(item)
+        index = item.pop("index", None)
+        if isinstance(index, int) and 1 <= index <= count and aligned[index - 1] is None:
+            aligned[index - 1] = item
+        else:
+            unplaced.append(item)
+    for i in range(count):
+        if aligned[i] is None and unplaced:
+            aligned[i] = unplaced.pop(0)
+    return aligned
+
+
+def add_usage(total, usage):
+    for key in ("prompt_tokens", "output_tokens", "thoughts_tokens", "cached_tokens", "total_tokens"):
+        total[key] = total.get(key, 0) + (usage.get(key) or 0)
+    total.setdefault("finish_reason", usage.get("finish_reason"))
+
+
+def request_with_salvage(
+    products,
+    taxonomy,
+    existing_taxonomy_cache_name=None,
+    max_output_tokens=None,
+    on_item=None,
+    combined=False,
+    model=None,
+    with_confidence=False,
+    salvage_rounds=None,
+):
+    """
+    request_categorizations plus per-item validation: valid items are kept, and
+    only the invalid or missing ones are sent again (up to salvage_rounds times,
+    SALVAGE_ROUNDS by default).
+    The merged categorizations are aligned with products and each has a "status"
+    of "ok", "salvaged", "invalid" or "missing". Errors in the first request
+    propagate; errors in follow-ups leave the affected items as they were.
+    """
+    path_set = build_path_set(taxonomy)
+    merged = [None] * len(products)
+    usage = {}
+    emitted = set()
+
+    def emit_valid(positions, status):
+        def emit(j, item):
+            position = positions[j] if j < len(positions) else None
+            index = item.get("index") if isinstance(item, dict) else None
+            if isinstance(index, int) and 1 <= index <= len(positions):
+                position = positions[index - 1]
+            if position is None or position in emitted:
+                return
+            if is_valid_categorization(item, path_set):
+                emitted.add(position)
+                item = {k: v for k, v in item.items() if k != "index"}
+                on_item(position, {**item, "status": status})
+
+        return emit if on_item else None
+
+    pending = list(range(len(products)))
+    cache_name = existing_taxonomy_cache_name
+    rounds = SALVAGE_ROUNDS if salvage_rounds is None else salvage_rounds
+    for attempt in range(rounds + 1):
+        batch = [products[i] for i in pending]
+        if attempt:
+            batch = [
+                {**product, "rejected_categorization": merged[i]} if merged[i] else product
+                for product, i in zip(batch, pending)
+            ]
+            log(f"🩹 Re-requesting {len(pending)} invalid or missing categorizations")
         try:
-            if hasattr(response, "parsed") and response.parsed:
-                parsed_results = response.parsed
-                log(f"✅ Successfully used structured output parsing")
-                if parsed_results:
-                    log(f"🔍 Debug - results type: {type(parsed_results)}")
-                    if len(parsed_results) > 0:
-                        log(f"🔍 Debug - first result type: {type(parsed_results[0])}")
-                        log(f"🔍 Debug - first result content: {parsed_results[0]}")
-                    if isinstance(parsed_results[0], dict):
-                        log(f"📋 Results are already dictionaries")
-                        final_categorizations = parsed_results
-                    else:
-                        dict_results = []
-                        for r_item in parsed_results:
-                            dict_results.append(
-                                {
-                                    "category": r_item.category,
-                                    "subcategory": r_item.subcategory,
-                                    "product_type": r_item.product_type,
-                                }
-                            )
-                        final_categorizations = dict_results
-        except Exception as parse_error:
-            log(
-                f"⚠️ Structured parsing failed, falling back to text extraction: {parse_error}"
+            result = request_categorizations(
+                batch,
+                taxonomy,
+                cache_name,
+                max_output_tokens=max_output_tokens,
+                on_item=emit_valid(pending, "salvaged" if attempt else "ok"),
+                combined=combined,
+                model=model,
+                with_confidence=with_confidence,
             )
-            final_categorizations = extract_json(response.text)
+        except Exception as e:
+            if not attempt:
+                raise
+            log(f"⚠️ Follow-up request failed, keeping {len(pending)} items unresolved: {str(e)}")
+            break
+
+        cache_name = result.get("taxonomy_cache_name") or cache_name
+        add_usage(usage, result.get("usage") or {})
+        still_pending = []
+        for i, item in zip(pending, align_categorizations(len(batch), result["categorizations"])):
+            if is_valid_categorization(item, path_set):
+                merged[i] = {**item, "status": "salvaged" if attempt else "ok"}
+            else:
+                if item:
+                    merged[i] = item
+                still_pending.append(i)
+        pending = still_pending
+        if not pending:
+            break
+
+    for i in pending:
+        merged[i] = {**merged[i], "status": "invalid"} if merged[i] else {"status": "missing"}
+    if on_item:
+        for i, item in enumerate(merged):
+            if i not in emitted:
+                on_item(i, item)
+
+    salvaged = sum(1 for item in merged if item["status"] == "salvaged")
+    if salvaged or pending:
+        log(f"🩹 Salvage: {salvaged} items recovered, {len(pending)} still invalid or missing")
+    return {
+        "categorizations": merged,
+        "taxonomy_cache_name": cache_name,
+        "usage": usage,
+        "salvage": {"salvaged": salvaged, "unresolved": len(pending)},
+    }
+
+
+def request_cascade(
+    products,
+    taxonomy,
+    existing_taxonomy_cache_name=None,
+    max_output_tokens=None,
+    on_item=None,
+    combined=False,
+):
+    """
+    Categorize with FAST_MODEL first and escalate to MODEL only the items that
+    came back invalid, missing or with a confidence below CASCADE_THRESHOLD.
+    Items carry a "tier" of "fast" or "pro", and the result has a "cascade"
+    summary with the escalation rate and the measured seconds of each tier.
+    Per-call latency is mostly fixed, so the saving over a MODEL-only run is
+    not extrapolated here; manual_task_scripts/cascade_harness.py measures it.
+    """
+    merged = [None] * len(products)
+    usage = {}
+
+    def accepted(item):
+        return item.get("status") == "ok" and (item.get("confidence") or 0) >= CASCADE_THRESHOLD
+
+    def emit_fast(position, item):
+        if accepted(item):
+            on_item(position, {**item, "tier": "fast"})
+
+    started = time.monotonic()
+    try:
+        fast = request_with_salvage(
+            products,
+            taxonomy,
+            None,
+            max_output_tokens=max_output_tokens,
+            on_item=emit_fast if on_item else None,
+            combined=combined,
+            model=FAST_MODEL,
+            with_confidence=True,
+            salvage_rounds=0,
+        )
+    except Exception as e:
+        from batch_engine import is_retryable_error
+
+        if is_retryable_error(e):
+            raise
+        log(f"⚠️ {FAST_MODEL} request failed ({str(e)}), escalating the whole batch")
+        fast = {"categorizations": [{"status": "missing"}] * len(products)}
+    fast_seconds = time.monotonic() - started
+    add_usage(usage, fast.get("usage") or {})
+
+    escalate = []
+    for i, item in enumerate(fast["categorizations"]):
+        if accepted(item):
+            merged[i] = {**item, "tier": "fast"}
+        else:
+            escalate.append(i)
+
+    pro_seconds = 0.0
+    cache_name = existing_taxonomy_cache_name
+    if escalate:
+        log(f"⬆️ Escalating {len(escalate)}/{len(products)} products to {MODEL}")
+
+        def emit_pro(j, item):
+            on_item(escalate[j], {**item, "tier": "pro"})
+
+        started = time.monotonic()
+        pro = request_with_salvage(
+            [products[i] for i in escalate],
+            taxonomy,
+            existing_taxonomy_cache_name,
+            max_output_tokens=max_output_tokens,
+            on_item=emit_pro if on_item else None,
+            combined=combined,
+        )
+        pro_seconds = time.monotonic() - started
+        add_usage(usage, pro.get("usage") or {})
+        cache_name = pro.get("taxonomy_cache_name") or cache_name
+        for i, item in zip(escalate, pro["categorizations"]):
+            merged[i] = {**item, "tier": "pro"}
+
+    cascade = {
+        "products": len(products),
+        "escalated": len(escalate),
+        "escalation_rate": round(len(escalate) / len(products), 3) if products else None,
+        "fast_seconds": round(fast_seconds, 3),
+        "pro_seconds": round(pro_seconds, 3),
+    }
+    log(
+        f"🪜 Cascade: {len(escalate)}/{len(products)} escalated, "
+        f"fast {fast_seconds:.1f}s + pro {pro_seconds:.1f}s"
+    )
+    return {
+        "categorizations": merged,
+        "taxonomy_cache_name": cache_name,
+        "usage": usage,
+        "cascade": cascade,
+    }
+
+
+def generate_streaming(contents, config, on_element, model=None):
+    """
+    Stream a generate_content call, calling on_element(index, element) for each
+    array element as soon as it is complete. Returns a response-like object whose
+    parsed attribute holds the elements.
+    """
+    parser = JsonArrayStreamParser()
+    elements = []
+    head = []
+    last_chunk = None
+    for chunk in get_client().models.generate_content_stream(
+        model=model or MODEL, contents=contents, config=config
+    ):
+        last_chunk = chunk
+        text = getattr(chunk, "text", None) or ""
+        if sum(len(part) for part in head) < 2000:
+            head.append(text)
+        for element in parser.feed(text):
+            on_element(len(elements), element)
+            elements.append(element)
+
+    if not parser.complete:
+        log(f"⚠️ Streamed response ended before the JSON array was closed")
+    return SimpleNamespace(
+        # Only the start of the text is kept, for error messages
+        text="".join(head),
+        parsed=elements,
+        candidates=getattr(last_chunk, "candidates", None),
+        usage_metadata=getattr(last_chunk, "usage_metadata", None),
+    )
+
+
+def request_categorizations(
+    products,
+    taxonomy,
+    existing_taxonomy_cache_name=None,
+    max_output_tokens=None,
+    on_item=None,
+    combined=False,
+    model=None,
+    with_confidence=False,
+):
+    """
+    Send one categorization request to the model. Unlike categorize_with_model,
+    API errors propagate so callers can retry; the result also carries token usage.
+    With on_item the response is streamed and on_item(index, categorization) is
+    called as each categorization arrives. With combined, items also carry a
+    "secondary" list answering the taxonomy's secondary placements. model
+    defaults to MODEL; with_confidence asks for a 0-1 "confidence" per item.
+    """
+    global SCHEMA_MODE
+    model = model or MODEL
+    log(f"🏷️ Categorizing {len(products)} products")
+    final_categorizations = []
+    used_cache_name = None
+    schema_mode = SCHEMA_MODE
+
+    pruned_taxonomy = None
+    if SHORTLIST_TOP_K:
+        pruned_taxonomy = get_shortlister(taxonomy).prune(products, SHORTLIST_TOP_K)
+
+    if pruned_taxonomy:
+        # The cache holds the full taxonomy, so a pruned prompt goes without it
+        log(
+            f"✂️ Shortlisted taxonomy to {sum(len(c['subcategories']) for c in pruned_taxonomy)} subcategories"
+        )
+    else:
+        # Cached content belongs to one model, so a caller's cache name only fits MODEL
+        used_cache_name = create_taxonomy_cache(
+            taxonomy,
+            existing_taxonomy_cache_name if model == MODEL else None,
+            model=model,
+            id_coded=schema_mode == "id",
+        )
+
+    secondary_section = ""
+    if combined:
+        from secondary_placements import secondary_rules, SECONDARY_SCHEMA
+
+        secondary_section = secondary_rules(taxonomy).prompt_section()
+
+    def prompt():
+        if pruned_taxonomy:
+            return build_categorize_prompt(
+                products,
+                pruned_taxonomy,
+                False,
+                pruned=True,
+                schema_mode=schema_mode,
+                secondary_section=secondary_section,
+                with_confidence=with_confidence,
+                id_taxonomy=taxonomy,
+            )
+        return build_categorize_prompt(
+            products,
+            taxonomy,
+            bool(used_cache_name),
+            schema_mode=schema_mode,
+            secondary_section=secondary_section,
+            with_confidence=with_confidence,
+        )
+
+    def response_schema():
+        schema = categorization_schema(schema_taxonomy, schema_mode)
+        if secondary_section:
+            schema["items"]["properties"]["secondary"] = SECONDARY_SCHEMA
+            schema["items"]["property_ordering"].append("secondary")
+        if with_confidence:
+            schema["items"]["properties"]["confidence"] = {"type": "NUMBER"}
+            schema["items"]["required"].append("confidence")
+            schema["items"]["property_ordering"].append("confidence")
+        return schema
+
+    # Enums only need to cover the taxonomy the model was shown
+    schema_taxonomy = pruned_taxonomy or taxonomy
+    multi_content = [prompt()]
+    image_urls = [product.get("image_url") for product in products]
+    call = {"kind": "categorize", "model": model, "products": products, "streamed": bool(on_item)}
+    if any(image_urls):
+        log(f"🖼️ Loading {sum(1 for u in image_urls if u)} images concurrently")
+        image_started = time.monotonic()
+        for i, image_data in enumerate(load_images(image_urls)):
+            if image_data:
+                multi_content.append(f"Image for PRODUCT {i + 1}:")
+                multi_content.append({"inline_data": image_data})
+                log(f"✅ Added image for product {i+1}")
+        call["image_fetch_seconds"] = time.monotonic() - image_started
+        call["image_count"] = (len(multi_content) - 1) // 2
+
+    config = {
+        "temperature": 0.1,
+        "max_output_tokens": max_output_tokens or 65536,
+        "response_mime_type": "application/json",
+        "response_schema": response_schema(),
+    }
+
+    if used_cache_name:
+        config["cached_content"] = used_cache_name
+        log(f"💾 Using taxonomy cache: {used_cache_name}")
+    elif pruned_taxonomy:
+        config["system_instruction"] = TAXONOMY_SYSTEM_INSTRUCTION
+    else:
+        log(f"⚠️ Proceeding without taxonomy cache.")
+
+    def on_element(index, element):
+        if schema_mode in ("path", "id"):
+            # Path ids always refer to the full taxonomy
+            element = decode_path_items([element], taxonomy)[0]
+        on_item(index, element)
+
+    def generate():
+        if on_item:
+            return generate_streaming(multi_content, config, on_element, model)
+        return get_client().models.generate_content(
+            model=model, contents=multi_content, config=config
+        )
+
+    log(f"🔄 Sending categorization request to model: {model}")
+    for attempt in range(3):
+        call["started"] = time.monotonic()
+        try:
+            response = generate()
+            break
+        except Exception as e:
+            record_call(**call, error=e)
+            if attempt < 2 and used_cache_name and is_cache_missing_error(e):
+                # The cache vanished between lookup and use: retry with the taxonomy inline
+                log(f"⚠️ Taxonomy cache {used_cache_name} is gone, retrying with inline taxonomy")
+                get_taxonomy_caches().invalidate(model, used_cache_name)
+                used_cache_name = None
+                del config["cached_content"]
+            elif attempt < 2 and schema_mode != "free" and is_schema_rejected_error(e):
+                # Stop sending enum schemas for the rest of this process
+                with _schema_mode_lock:
+                    if SCHEMA_MODE != "free":
+                        log(f"⚠️ {schema_mode} schema rejected ({str(e)}), falling back to free strings")
+                        SCHEMA_MODE = "free"
+                schema_mode = "free"
+                config["response_schema"] = response_schema()
+            else:
+                raise
+            multi_content[0] = prompt()
+
+    if hasattr(response, "usage_metadata"):
+        log(f"📊 Usage metadata: {response.usage_metadata}")
+        log_token_usage(response)
+        if (
+            hasattr(response.usage_metadata, "cached_content_token_count")
+            and response.usage_metadata.cached_content_token_count > 0
+        ):
             log(
-                f"✅ Successfully extracted JSON with {len(final_categorizations)} products"
+                f"💰 Cache hit! {response.usage_metadata.cached_content_token_count} tokens (from cached_content_token_count) were served from cache"
             )
 
-    except Exception as e:
-        log(f"❌ Error in categorize_products: {str(e)}")
+    try:
+        if hasattr(response, "parsed") and response.parsed:
+            parsed_results = response.parsed
+            log(f"✅ Successfully used structured output parsing")
+            if parsed_results:
+                log(f"🔍 Debug - results type: {type(parsed_results)}")
+                if len(parsed_results) > 0:
+                    log(f"🔍 Debug - first result type: {type(parsed_results[0])}")
+                    log(f"🔍 Debug - first result content: {parsed_results[0]}")
+                call["parse_path"] = "stream" if on_item else "structured"
+                if isinstance(parsed_results[0], dict):
+                    log(f"📋 Results are already dictionaries")
+                    final_categorizations = parsed_results
+                else:
+                    dict_results = []
+                    for r_item in parsed_results:
+                        dict_results.append(
+                            {
+                                "index": getattr(r_item, "index", None),
+                                "category": r_item.category,
+                                "subcategory": r_item.subcategory,
+                                "product_type": r_item.product_type,
+                            }
+                        )
+                    final_categorizations = dict_results
+    except Exception as parse_error:
+        log(
+            f"⚠️ Structured parsing failed, falling back to text extraction: {parse_error}"
+        )
+        call["parse_path"] = "extract_json"
+        try:
+            final_categorizations = extract_json(response.text)
+        except ValueError as e:
+            record_call(**call, response=response, error=e)
+            raise
+        log(
+            f"✅ Successfully extracted JSON with {len(final_categorizations)} products"
+        )
+
+    if not final_categorizations and not on_item and getattr(response, "text", None):
+        # Dict schemas are not always parsed by the SDK
+        call["parse_path"] = "extract_json"
+        try:
+            final_categorizations = extract_json(response.text)
+        except ValueError as e:
+            record_call(**call, response=response, error=e)
+            raise
+
+    if schema_mode in ("path", "id"):
+        final_categorizations = decode_path_items(final_categorizations, taxonomy)
+    record_call(**call, response=response)
 
     return {
         "categorizations": final_categorizations,
         "taxonomy_cache_name": used_cache_name,
+        "usage": usage_summary(response),
     }
 
 
+def keyed_product_types(results):
+    """Turn an {id: product_type} response into the [{"id", "product_type"}] list callers expect"""
+    return [
+        {"id": item_id, "product_type": product_type}
+        for item_id, product_type in results.items()
+    ]
+
+
 def determine_product_types(batch_items):
     """Determine product types for secondary categorization"""
     log(f"🔍 Determining product types for {len(batch_items)} items")
@@ -307,7 +1454,23 @@ Category: {item['category']} → {item['subcategory']}
 Available product types: {json.dumps(item['availableProductTypes'])}
 """
 
-        prompt += """
+        # Per-item enums need every item to have at least one option
+        keyed = SCHEMA_MODE != "free" and all(
+            item.get("availableProductTypes") for item in batch_items
+        )
+        if keyed:
+            prompt += """
+RESPONSE FORMAT: You must respond ONLY with a JSON object with NO explanation text.
+The object must have one key per item: the exact ID string provided for the item,
+mapped to the product type chosen from that item's available product types.
+
+EXAMPLE CORRECT RESPONSE FORMAT:
+{
+  "product_0_cat_0": "Apples"
+}
+"""
+        else:
+            prompt += """
 RESPONSE FORMAT: You must respond ONLY with a JSON array with NO explanation text.
 Each item in the array must have EXACTLY these fields:
 - "id": string - the exact ID string provided for the item
@@ -324,41 +1487,52 @@ EXAMPLE CORRECT RESPONSE FORMAT:
 
         # Generate with system instruction and structured output
         log(f"🔄 Sending product type determination request to model: {MODEL}")
-        response = client.models.generate_content(
-            model=MODEL,
-            contents=prompt,
-            config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json",
-                "response_schema": list[ProductTypeResult],  # Using built-in list
-                "system_instruction": "You are a product categorization expert. Your task is to choose the most appropriate product type for each product from the available options provided.",
-            },
-        )
+        config = {
+            "temperature": 0.1,
+            "response_mime_type": "application/json",
+            "response_schema": (
+                product_types_schema(batch_items)
+                if keyed
+                else list[product_type_result_model()]  # Using built-in list
+            ),
+            "system_instruction": "You are a product categorization expert. Your task is to choose the most appropriate product type for each product from the available options provided.",
+        }
+        call = {"kind": "product_types", "model": MODEL, "products": batch_items}
+        call["started"] = time.monotonic()
+        try:
+            response = get_client().models.generate_content(
+                model=MODEL,
+                contents=prompt,
+                config=config,
+            )
+        except Exception as e:
+            record_call(**call, error=e)
+            raise
 
         # Log token usage if available
         if hasattr(response, "usage_metadata"):
             log(f"📊 Usage metadata: {response.usage_metadata}")
-            if "token_count" in response.usage_metadata:
-                token_data = response.usage_metadata["token_count"]
-                log(
-                    f"📝 Token usage - Total: {token_data.get('total_tokens')}, Input: {token_data.get('input_tokens')}, Output: {token_data.get('output_tokens')}"
-                )
+            log_token_usage(response)
 
         # Try to parse structured output first
         try:
             if hasattr(response, "parsed") and response.parsed:
                 results = response.parsed
                 log(f"✅ Successfully used structured output parsing")
-
-                # Convert to dictionary format
-                dict_results = []
-                for result in results:
-                    dict_results.append(
-                        {
-                            "id": result.id,
-                            "product_type": result.product_type,
-                        }
-                    )
+                if isinstance(results, dict):
+                    dict_results = keyed_product_types(results)
+                else:
+                    # Convert to dictionary format
+                    dict_results = []
+                    for result in results:
+                        dict_results.append(
+                            {
+                                "id": result.id,
+                                "product_type": result.product_type,
+                            }
+                        )
+                # Recorded once parsing succeeded; a failure falls through to extract_json
+                record_call(**call, response=response, parse_path="structured")
                 return dict_results
         except Exception as parse_error:
             log(
@@ -366,8 +1540,15 @@ EXAMPLE CORRECT RESPONSE FORMAT:
             )
 
         # Fall back to text extraction
-        results = extract_json(response.text)
+        try:
+            results = extract_json(response.text)
+        except ValueError as e:
+            record_call(**call, response=response, parse_path="extract_json", error=e)
+            raise
+        record_call(**call, response=response, parse_path="extract_json")
         log(f"✅ Successfully extracted JSON with {len(results)} items")
+        if isinstance(results, dict):
+            return keyed_product_types(results)
         return results
 
     except Exception as e:
@@ -375,65 +1556,461 @@ EXAMPLE CORRECT RESPONSE FORMAT:
         raise
 
 
+def determine_product_types_deduped(batch_items):
+    """
+    determine_product_types with identical questions (same description, target
+    subcategory and options) asked once, answers fanned back out by id, and
+    answers memoized in the result cache so repeated runs skip the model.
+    """
+    keys = [product_type_question_key(item) for item in batch_items]
+    answers = result_cache.get_product_types(keys) if result_cache else {}
+    memo_hits = sum(1 for key in keys if key in answers)
+
+    representatives = {}
+    for key, item in zip(keys, batch_items):
+        if key not in answers and key not in representatives:
+            representatives[key] = item
+
+    local = choose_product_types_locally(list(representatives.values()))
+    for key, item in list(representatives.items()):
+        if str(item["id"]) in local:
+            answers[key] = local[str(item["id"])]
+            del representatives[key]
+
+    if representatives:
+        key_by_id = {str(item["id"]): key for key, item in representatives.items()}
+        fresh = {}
+        for result in determine_product_types(list(representatives.values())):
+            key = key_by_id.get(str(result.get("id")))
+            if key and result.get("product_type") in representatives[key]["availableProductTypes"]:
+                fresh[key] = result["product_type"]
+        answers.update(fresh)
+        if result_cache:
+            result_cache.put_product_types(fresh.items())
+
+    stats = product_type_stats
+    stats["requests"] += 1
+    stats["items"] += len(batch_items)
+    stats["items_sent"] += len(representatives)
+    stats["memo_hits"] += memo_hits
+    stats["local_answers"] += len(local)
+    stats["model_calls"] += 1 if representatives else 0
+    stats["model_calls_avoided"] += 0 if representatives else 1
+    log(
+        f"🧮 product_types: {len(batch_items)} items, {len(representatives)} sent to the model, "
+        f"{memo_hits} memo hits, {len(local)} answered locally, "
+        f"{len(batch_items) - len(representatives) - len(local) - memo_hits} duplicates; "
+        f"model calls avoided this run: {stats['model_calls_avoided']}/{stats['requests']}"
+    )
+
+    return [
+        {"id": item["id"], "product_type": answers[key]}
+        for key, item in zip(keys, batch_items)
+        if key in answers
+    ]
+
+
+def handle_request(mode, input_data, on_item=None):
+    """
+    Run a single categorize or product_types request and return its output.
+    on_item streams individual categorize results (see categorize_products).
+    """
+    global product_type_taxonomy
+    if mode in ("categorize", "categorize_all"):
+        if not isinstance(input_data, dict):
+            raise ValueError("Expected an object with products and taxonomy")
+        products = input_data.get("products", [])
+        taxonomy = input_data.get("taxonomy", {})
+        existing_taxonomy_cache_name = input_data.get("existing_taxonomy_cache_name")
+        log(
+            f"🐍 Python received existing_taxonomy_cache_name: {existing_taxonomy_cache_name}"
+        )
+
+        if not products:
+            raise ValueError("No products found in input")
+        if not taxonomy:
+            raise ValueError("No taxonomy found in input")
+
+        log(f"🚀 Processing {len(products)} products for categorization")
+        # The chooser embeds it when a product_types request first needs it
+        product_type_taxonomy = taxonomy
+        if mode == "categorize_all":
+            return categorize_all(
+                products,
+                taxonomy,
+                existing_taxonomy_cache_name,
+                input_data.get("options"),
+                combined=bool(input_data.get("combined")),
+            )
+        return categorize_products(
+            products,
+            taxonomy,
+            existing_taxonomy_cache_name,
+            on_item=on_item,
+            combined=bool(input_data.get("combined")),
+        )
+
+    if mode == "product_types":
+        if not isinstance(input_data, list):
+            raise ValueError("Expected a list of batch items for product_types mode")
+
+        log(f"🚀 Processing {len(input_data)} items for product type determination")
+        return determine_product_types_deduped(input_data)
+
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+def error_output_for(mode, input_data, error):
+    """Build the error payload returned to the JS side for a failed request"""
+    error_output = {"error": str(error)}
+    if mode in ("categorize", "categorize_all") and isinstance(input_data, dict):
+        error_output["taxonomy_cache_name"] = input_data.get(
+            "existing_taxonomy_cache_name"
+        )
+    return error_output
+
+
+def serve_stream(stream_in, stream_out):
+    """
+    Serve newline-delimited JSON requests until EOF.
+    Each request line is {"id": ..., "mode": "categorize" | "product_types", "input": ...}
+    where "input" is exactly what the one-shot mode reads from stdin. Each response
+    line is {"id": ..., "result": ...} where "result" is exactly what the one-shot
+    mode prints (including {"error": ...} payloads on failure).
+
+    A categorize request with "stream": true first gets one
+    {"id": ..., "item": {"index", "categorization", "valid"}} line per product as
+    results arrive, then the usual result line.
+    """
+    last_taxonomy = None
+
+    for line in stream_in:
+        if not line.strip():
+            continue
+
+        request_id = None
+        mode = None
+        input_data = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            mode = request.get("mode")
+            input_data = request.get("input")
+
+            # The taxonomy rarely changes between batches, so callers may send it
+            # once and omit it afterwards; the last one seen is reused.
+            if mode in ("categorize", "categorize_all") and isinstance(input_data, dict):
+                if input_data.get("taxonomy"):
+                    last_taxonomy = input_data["taxonomy"]
+                elif last_taxonomy:
+                    input_data["taxonomy"] = last_taxonomy
+
+            on_item = None
+            if request.get("stream") and mode == "categorize":
+
+                def on_item(index, categorization, valid, request_id=request_id):
+                    item = {"index": index, "categorization": categorization, "valid": valid}
+                    stream_out.write(json.dumps({"id": request_id, "item": item}) + "\n")
+                    stream_out.flush()
+
+            result = handle_request(mode, input_data, on_item)
+        except Exception as e:
+            log(f"❌ Error serving request {request_id}: {str(e)}")
+            result = error_output_for(mode, input_data, e)
+
+        stream_out.write(json.dumps({"id": request_id, "result": result}) + "\n")
+        stream_out.flush()
+
+
+def serve_socket(socket_path):
+    """Serve newline-delimited JSON requests on a Unix socket, one connection at a time"""
+    import socketserver
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            log("🔌 Client connected to wrapper socket")
+            reader = io.TextIOWrapper(self.rfile, encoding="utf-8")
+            writer = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            serve_stream(reader, writer)
+            log("🔌 Client disconnected from wrapper socket")
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, RequestHandler) as server:
+        log(f"🛰️ Serving on Unix socket {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
 def main():
+    global CASCADE, FAST_MODEL, CASCADE_THRESHOLD, KNN_THRESHOLD, KNN_EXAMPLES, PRODUCT_TYPE_MARGIN
+    global CLUSTER_THRESHOLD, SPOT_CHECK_RATE, BACKEND, CASSETTE_PATH, REPLAY_MISS, FAKE_OPTIONS
     parser = argparse.ArgumentParser(description="Process products for categorization")
     parser.add_argument(
         "--mode",
-        choices=["categorize", "product_types"],
-        required=True,
-        help="Mode of operation: categorize or determine product types",
+        choices=["categorize", "categorize_all", "product_types", "bulk"],
+        help="Mode of operation: categorize one batch, categorize a whole product list concurrently, determine product types, or run a resumable job over a JSONL file (see bulk_job.py)",
+    )
+    parser.add_argument("--input", help="bulk: products JSONL file")
+    parser.add_argument(
+        "--output", help="bulk: results JSONL file (started afresh unless a checkpoint is resumed)"
+    )
+    parser.add_argument(
+        "--failures-output",
+        help="bulk: failures JSONL file (default: <output>.failures.jsonl)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="bulk: checkpoint file (default: <output>.checkpoint.json); an existing one is resumed",
+    )
+    parser.add_argument(
+        "--taxonomy",
+        default=DEFAULT_TAXONOMY_PATH,
+        help="bulk: taxonomy JSON file",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="bulk: products categorized between checkpoints (default: bulk_job.DEFAULT_CHUNK_SIZE)",
+    )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="bulk: also fill in additional_categorizations (see secondary_placements)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("live", "record", "replay", "fake"),
+        default=BACKEND,
+        help="Model backend: the live API, live with calls recorded to --cassette, replayed from --cassette, or a synthetic fake (env GEMINI_BACKEND)",
+    )
+    parser.add_argument(
+        "--cassette",
+        default=CASSETTE_PATH,
+        help="Cassette JSONL file for the record and replay backends (env GEMINI_CASSETTE)",
+    )
+    parser.add_argument(
+        "--replay-miss",
+        choices=("error", "fake"),
+        default=REPLAY_MISS,
+        help="replay: fail on requests missing from the cassette, or answer them with the fake backend",
+    )
+    parser.add_argument(
+        "--fake-latency", type=float, default=0.5, help="fake: seconds per call"
+    )
+    parser.add_argument(
+        "--fake-error-rate", type=float, default=0.0, help="fake: share of calls failing with 429/503"
+    )
+    parser.add_argument(
+        "--fake-invalid-rate", type=float, default=0.0, help="fake: share of invalid categorizations"
+    )
+    parser.add_argument("--fake-seed", type=int, default=0, help="fake: random seed")
+    parser.add_argument(
+        "--telemetry-file",
+        default=os.environ.get("TELEMETRY_FILE"),
+        help="Append one JSON record per model call to this file (env TELEMETRY_FILE)",
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        default=os.environ.get("PROMETHEUS_TEXTFILE"),
+        help="Keep model call counters in this Prometheus textfile (env PROMETHEUS_TEXTFILE)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Stay alive and serve newline-delimited JSON requests on stdin",
+    )
+    parser.add_argument(
+        "--socket",
+        help="With --serve, listen on this Unix socket path instead of stdin",
+    )
+    parser.add_argument(
+        "--image-cache-dir",
+        default=os.environ.get("IMAGE_CACHE_DIR", DEFAULT_CACHE_DIR),
+        help="Directory for the persistent image cache",
+    )
+    parser.add_argument(
+        "--image-cache-max-mb",
+        type=int,
+        default=int(os.environ.get("IMAGE_CACHE_MAX_MB", DEFAULT_MAX_BYTES // 2**20)),
+        help="Size cap for the image cache; least recently used images are evicted",
+    )
+    parser.add_argument(
+        "--no-image-cache",
+        action="store_true",
+        help="Always download images instead of using the persistent cache",
+    )
+    parser.add_argument(
+        "--image-max-edge",
+        type=int,
+        default=int(os.environ.get("IMAGE_MAX_EDGE", DEFAULT_MAX_EDGE)),
+        help="Downscale images so their longest edge is at most this many pixels (0 sends originals)",
+    )
+    parser.add_argument(
+        "--image-quality",
+        type=int,
+        default=int(os.environ.get("IMAGE_QUALITY", DEFAULT_QUALITY)),
+        help="JPEG quality used when recompressing downscaled images",
+    )
+    parser.add_argument(
+        "--result-cache-db",
+        default=os.environ.get("RESULT_CACHE_DB", DEFAULT_DB_PATH),
+        help="SQLite file caching categorizations by product fingerprint and taxonomy",
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        action="store_true",
+        help="Send every product to the model instead of reusing cached categorizations",
+    )
+    parser.add_argument(
+        "--schema-mode",
+        choices=SCHEMA_MODES,
+        default=os.environ.get("SCHEMA_MODE", DEFAULT_SCHEMA_MODE),
+        help="Constrain responses to the taxonomy: one enum of valid paths, integer path ids from a compact id table, an enum per field, or free strings",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        default=os.environ.get("CASCADE", "").lower() in ("1", "true", "yes"),
+        help="Categorize with --fast-model first and escalate only uncertain or invalid items",
+    )
+    parser.add_argument(
+        "--fast-model",
+        default=os.environ.get("FAST_MODEL", FAST_MODEL),
+        help="First-tier model used by --cascade",
+    )
+    parser.add_argument(
+        "--cascade-threshold",
+        type=float,
+        default=float(os.environ.get("CASCADE_THRESHOLD", CASCADE_THRESHOLD)),
+        help="Escalate first-tier answers whose self-reported confidence is below this",
+    )
+    parser.add_argument(
+        "--knn-threshold",
+        type=float,
+        default=float(os.environ.get("KNN_THRESHOLD", 0)),
+        help="Answer products locally when the kNN classifier's confidence reaches this (0 disables; knn_classifier.DEFAULT_THRESHOLD is a reasonable start)",
+    )
+    parser.add_argument(
+        "--cluster-threshold",
+        type=float,
+        default=float(os.environ.get("CLUSTER_THRESHOLD", 0)),
+        help="categorize_all: categorize near-duplicate products (Jaccard similarity of description + brand words at or above this) once per cluster (0 disables; 0.6 is a reasonable start)",
+    )
+    parser.add_argument(
+        "--spot-check-rate",
+        type=float,
+        default=float(os.environ.get("SPOT_CHECK_RATE", DEFAULT_SPOT_CHECK_RATE)),
+        help="Share of cluster members also categorized individually to confirm their cluster",
+    )
+    parser.add_argument(
+        "--product-type-margin",
+        type=float,
+        default=float(os.environ.get("PRODUCT_TYPE_MARGIN", 0)),
+        help="Answer product_types locally when the best option's embedding similarity beats the runner-up by this margin (0 disables; product_type_chooser.DEFAULT_MARGIN is a reasonable start)",
+    )
+    parser.add_argument(
+        "--knn-examples",
+        nargs="+",
+        help="Labelled examples for the kNN classifier (training_data.json and/or categorized product files; default: training_data.json)",
+    )
+    parser.add_argument(
+        "--shortlist-top-k",
+        type=int,
+        default=int(os.environ.get("SHORTLIST_TOP_K", 0)),
+        help="Send only the subcategories behind each product's top-K local matches (0 sends the full taxonomy)",
     )
     args = parser.parse_args()
 
+    global image_cache, result_cache, IMAGE_MAX_EDGE, IMAGE_QUALITY, SHORTLIST_TOP_K, SCHEMA_MODE
+    global telemetry
+    BACKEND = args.backend
+    CASSETTE_PATH = args.cassette
+    REPLAY_MISS = args.replay_miss
+    FAKE_OPTIONS = {
+        "latency_seconds": args.fake_latency,
+        "error_rate": args.fake_error_rate,
+        "invalid_rate": args.fake_invalid_rate,
+        "seed": args.fake_seed,
+    }
+    if BACKEND in ("live", "record") and not os.environ.get("GEMINI_API_KEY"):
+        logger.error("Error: GEMINI_API_KEY environment variable not set")
+        sys.exit(1)
+    if BACKEND in ("record", "replay") and not CASSETTE_PATH:
+        parser.error(f"--backend {BACKEND} needs --cassette")
+    CASCADE = args.cascade
+    KNN_THRESHOLD = args.knn_threshold
+    KNN_EXAMPLES = args.knn_examples
+    PRODUCT_TYPE_MARGIN = args.product_type_margin
+    CLUSTER_THRESHOLD = args.cluster_threshold
+    SPOT_CHECK_RATE = args.spot_check_rate
+    FAST_MODEL = args.fast_model
+    CASCADE_THRESHOLD = args.cascade_threshold
+    SHORTLIST_TOP_K = args.shortlist_top_k
+    SCHEMA_MODE = args.schema_mode
+    if not args.no_result_cache:
+        result_cache = ResultCache(args.result_cache_db)
+    IMAGE_MAX_EDGE = args.image_max_edge
+    IMAGE_QUALITY = args.image_quality
+    if not args.no_image_cache:
+        image_cache = ImageCache(args.image_cache_dir, args.image_cache_max_mb * 2**20)
+    if args.telemetry_file or args.prometheus_textfile:
+        from telemetry import Telemetry
+
+        telemetry = Telemetry(args.telemetry_file, args.prometheus_textfile)
+
+    if args.serve:
+        log(f"🛰️ Wrapper daemon started (model: {MODEL})")
+        if args.socket:
+            serve_socket(args.socket)
+        else:
+            serve_stream(sys.stdin, sys.stdout)
+        return
+
+    if not args.mode:
+        parser.error("--mode is required unless --serve is given")
+
+    if args.mode == "bulk":
+        if not (args.input and args.output):
+            parser.error("--mode bulk needs --input and --output")
+        with open(args.taxonomy, "r") as f:
+            taxonomy = json.load(f)
+        path_set = build_path_set(taxonomy)
+        import bulk_job
+
+        summary = bulk_job.run_bulk_job(
+            args.input,
+            args.output,
+            taxonomy,
+            lambda products, cache_name: categorize_all(
+                products, taxonomy, cache_name, combined=args.combined
+            ),
+            lambda item: is_valid_categorization(item, path_set),
+            failures_path=args.failures_output,
+            checkpoint_path=args.checkpoint,
+            chunk_size=args.chunk_size or bulk_job.DEFAULT_CHUNK_SIZE,
+            is_transient=is_transient_failure,
+        )
+        print(json.dumps(summary))
+        return
+
+    input_data = None
     try:
         # Read JSON from stdin
         input_text = sys.stdin.read()
         input_data = json.loads(input_text)
 
-        if args.mode == "categorize":
-            products = input_data.get("products", [])
-            taxonomy = input_data.get("taxonomy", {})
-            existing_taxonomy_cache_name = input_data.get(
-                "existing_taxonomy_cache_name"
-            )
-            log(
-                f"🐍 Python received existing_taxonomy_cache_name: {existing_taxonomy_cache_name}"
-            )
-
-            if not products:
-                raise ValueError("No products found in input")
-            if not taxonomy:
-                raise ValueError("No taxonomy found in input")
-
-            log(f"🚀 Processing {len(products)} products for categorization")
-            result = categorize_products(
-                products, taxonomy, existing_taxonomy_cache_name
-            )
-
-        else:  # product_types
-            if not isinstance(input_data, list):
-                raise ValueError(
-                    "Expected a list of batch items for product_types mode"
-                )
-
-            log(f"🚀 Processing {len(input_data)} items for product type determination")
-            result = determine_product_types(input_data)
+        result = handle_request(args.mode, input_data)
 
         # Output the result as JSON
         print(json.dumps(result))
 
     except Exception as e:
         log(f"❌ Error in main: {str(e)}")
-        error_output = {"error": str(e)}
-        if (
-            args.mode == "categorize"
-            and "input_data" in locals()
-            and isinstance(input_data, dict)
-        ):
-            error_output["taxonomy_cache_name"] = input_data.get(
-                "existing_taxonomy_cache_name"
-            )
-        print(json.dumps(error_output))
+        print(json.dumps(error_output_for(args.mode, input_data, e)))
         sys.exit(1)
 
 
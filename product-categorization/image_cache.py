@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import threading
+import time
+
+from log_utils import log
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".image_cache"
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Eviction frees space down to this share of max_bytes, so it runs now and then
+# rather than on every put once the cache is full
+EVICT_TO_FRACTION = 0.9
+# Entries younger than this are served without asking the server again
+DEFAULT_FRESH_SECONDS = 7 * 24 * 3600
+
+
+class ImageCache:
+    """
+    Persistent on-disk cache of already base64-encoded product images.
+
+    Each URL maps to one JSON file named by the SHA-256 of the URL, holding the
+    encoded payload, its MIME type and the ETag/Last-Modified validators. File
+    mtimes track recency, and once the cache grows past max_bytes the least
+    recently used entries are evicted down to 90% of it.
+    """
+
+    def __init__(
+        self,
+        cache_dir=DEFAULT_CACHE_DIR,
+        max_bytes=DEFAULT_MAX_BYTES,
+        fresh_seconds=DEFAULT_FRESH_SECONDS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, url):
+        """Return the cached entry for url (and mark it recently used), or None"""
+        path = self.path_for(url)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("fetched_at", 0) < self.fresh_seconds
+
+    def revalidation_headers(self, entry):
+        """Conditional request headers for a stale entry"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url, image, etag=None, last_modified=None):
+        """Store an encoded image ({"mime_type", "data"}) for url"""
+        entry = {
+            "url": url,
+            "mime_type": image["mime_type"],
+            "data": image["data"],
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        self.write_entry(url, entry)
+
+    def mark_revalidated(self, url, entry):
+        """Record that the server confirmed a cached entry is still current"""
+        entry = dict(entry, fetched_at=time.time())
+        self.write_entry(url, entry)
+        return entry
+
+    def write_entry(self, url, entry):
+        path = self.path_for(url)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with self.lock:
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                with open(tmp_path, "w") as f:
+                    json.dump(entry, f)
+                os.replace(tmp_path, path)
+                new_size = os.path.getsize(path)
+                if self.total_bytes is not None:
+                    self.total_bytes += new_size - old_size
+                self.evict_if_needed()
+        except OSError as e:
+            log(f"⚠️ Could not write image cache entry for {url}: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def evict_if_needed(self):
+        """
+        Once the cache exceeds max_bytes, drop least recently used entries until
+        it is under the low-water mark, so the directory scan is not repeated on
+        every following put (lock held)
+        """
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, _, size in self.scan())
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        target = self.max_bytes * EVICT_TO_FRACTION
+        evicted = 0
+        for path, _, size in sorted(self.scan(), key=lambda item: item[1]):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            evicted += 1
+        log(f"🧹 Evicted {evicted} images from image cache")
+
+    def scan(self):
+        """Yield (path, mtime, size) for every cache entry"""
+        with os.scandir(self.cache_dir) as entries:
+            for item in entries:
+                if item.name.endswith(".json"):
+                    stat = item.stat()
+                    yield item.path, stat.st_mtime, stat.st_size
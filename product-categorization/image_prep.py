@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import io
+
+# Gemini bills an image as 258 tokens per 768x768 tile, so keeping the longest
+# edge at 768 holds every product photo to a single tile.
+DEFAULT_MAX_EDGE = 768
+DEFAULT_QUALITY = 85
+
+_pil_image = False
+
+
+def pil_image():
+    """PIL.Image, imported on first use (it is slow to import); None without Pillow"""
+    global _pil_image
+    if _pil_image is False:
+        try:
+            from PIL import Image as _pil_image
+        except ImportError:  # Pillow is optional; images are then sent as downloaded
+            _pil_image = None
+    return _pil_image
+
+
+def prepare_image(content, max_edge=DEFAULT_MAX_EDGE, quality=DEFAULT_QUALITY):
+    """
+    Downscale an image so its longest edge is at most max_edge, recompress it as
+    JPEG at the given quality and drop EXIF/ICC metadata.
+    Returns (bytes, mime_type), or (content, None) when the image is left as-is
+    (Pillow missing, max_edge of 0, an image Pillow cannot read, or a small image
+    that recompression would only make larger).
+    """
+    Image = pil_image() if max_edge else None
+    if Image is None:
+        return content, None
+
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.load()
+            resized = max(image.size) > max_edge
+            if resized:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            # Saving without exif/icc_profile arguments strips the metadata
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+    except Exception:
+        return content, None
+
+    prepared = output.getvalue()
+    if not resized and len(prepared) >= len(content):
+        return content, None
+    return prepared, "image/jpeg"
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Incremental parser for the JSON arrays of objects the model returns.
+
+Text can be fed in as it streams in; each array element is decoded as soon as
+its closing brace arrives, so callers can act on results before the response
+is complete. Each character is looked at once, and only the element currently
+being read is held in memory. An element that is not valid JSON is logged and
+skipped, so the rest of the array still comes through and the caller can
+re-request the missing index.
+"""
+
+import json
+
+from log_utils import log
+
+SEARCHING = "searching"
+BETWEEN_ELEMENTS = "between_elements"
+IN_ELEMENT = "in_element"
+DONE = "done"
+
+
+class JsonArrayStreamParser:
+    """
+    Yields the objects of the first top-level JSON array of objects in a text
+    stream. Leading prose, code fences and a missing closing bracket (e.g. a
+    truncated response) are tolerated.
+    """
+
+    def __init__(self):
+        self.state = SEARCHING
+        self.parts = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.count = 0
+        self.skipped = 0
+
+    @property
+    def complete(self):
+        """True once the array's closing bracket has been seen"""
+        return self.state == DONE
+
+    def feed(self, chunk):
+        """Consume the next piece of text and return the elements it completed"""
+        elements = []
+        start = None
+        for i, char in enumerate(chunk):
+            if self.state == IN_ELEMENT:
+                if start is None:
+                    start = i
+                if self.in_string:
+                    if self.escaped:
+                        self.escaped = False
+                    elif char == "\\":
+                        self.escaped = True
+                    elif char == '"':
+                        self.in_string = False
+                elif char == '"':
+                    self.in_string = True
+                elif char in "{[":
+                    self.depth += 1
+                elif char in "}]":
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.parts.append(chunk[start : i + 1])
+                        element = self.decode_element()
+                        if element is not None:
+                            elements.append(element)
+                        start = None
+            elif self.state == BETWEEN_ELEMENTS:
+                if char == "{":
+                    self.state = IN_ELEMENT
+                    self.depth = 1
+                    start = i
+                elif char == "]":
+                    self.state = DONE
+                elif not (char.isspace() or char == ","):
+                    # Not an array of objects (e.g. "[see below]"): keep looking,
+                    # unless elements were already found
+                    self.state = SEARCHING if self.count == 0 else DONE
+            elif self.state == SEARCHING:
+                if char == "[":
+                    self.state = BETWEEN_ELEMENTS
+            else:
+                break
+
+        if self.state == IN_ELEMENT and start is not None:
+            self.parts.append(chunk[start:])
+        return elements
+
+    def decode_element(self):
+        """The element just read, or None if it is not valid JSON"""
+        text = "".join(self.parts)
+        self.parts = []
+        self.state = BETWEEN_ELEMENTS
+        self.count += 1
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            self.skipped += 1
+            log(f"⚠️ Skipping malformed array element #{self.count}: {e}")
+            return None
+
+
+def parse_json_array(text):
+    """
+    Objects of the first JSON array of objects in text. Raises ValueError if
+    there is none (or none of its elements parse); a truncated array yields the
+    elements that were complete, and malformed elements are skipped.
+    """
+    parser = JsonArrayStreamParser()
+    elements = parser.feed(text)
+    if not elements and (parser.skipped or not parser.complete):
+        raise ValueError("No JSON array of objects found")
+    return elements
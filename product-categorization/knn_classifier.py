@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Local nearest-neighbour categorizer used ahead of the model.
+
+Labelled examples (training_data.json from category_converter.py plus any
+categorized product files) are embedded once with a sentence-transformers
+model and cached on disk. An incoming product is embedded the same way, its
+K most similar examples vote for their taxonomy path weighted by similarity,
+and the winning path's share of the vote is its confidence. Products above a
+threshold can be resolved without calling Gemini.
+
+sentence-transformers and numpy are only imported when a classifier is built.
+
+Run directly to measure precision and LLM calls avoided per threshold:
+    python knn_classifier.py --eval reported_categorizations.jsonl --thresholds 0.6 0.7 0.8 0.9
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+
+from log_utils import log
+from taxonomy_shortlist import DEFAULT_TRAINING_DATA_PATH, load_labelled_products, product_text
+from result_cache import normalize_text
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_K = 10
+DEFAULT_THRESHOLD = 0.9
+# Below this cosine similarity the nearest example is too far away to trust
+MIN_SIMILARITY = 0.5
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".knn_index_cache"
+)
+
+
+_encoders = {}
+
+
+def get_encoder(model_name=DEFAULT_EMBEDDING_MODEL):
+    """A sentence-transformers model, loaded once per process"""
+    if model_name not in _encoders:
+        from sentence_transformers import SentenceTransformer
+
+        log(f"🧠 Loading embedding model {model_name}")
+        _encoders[model_name] = SentenceTransformer(model_name)
+    return _encoders[model_name]
+
+
+def embed_texts(encoder, texts):
+    """Unit-length float32 embeddings, one row per text"""
+    import numpy as np
+
+    vectors = np.asarray(
+        encoder.encode(
+            [normalize_text(text) for text in texts],
+            batch_size=64,
+            show_progress_bar=False,
+        ),
+        dtype=np.float32,
+    )
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def load_examples(path):
+    """
+    Labelled {"text", "category", "subcategory", "product_type"} examples from
+    training_data.json or from a JSON array of categorized products.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    examples = []
+    for entry in data:
+        if not (entry.get("category") and entry.get("subcategory")):
+            continue
+        text = entry.get("text") or product_text(entry)
+        examples.append(
+            {
+                "text": text,
+                "category": entry["category"],
+                "subcategory": entry["subcategory"],
+                "product_type": entry.get("product_type") or entry["subcategory"],
+            }
+        )
+    return examples
+
+
+class KnnClassifier:
+    """Similarity-weighted kNN vote over embedded labelled examples"""
+
+    def __init__(
+        self,
+        examples,
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        k=DEFAULT_K,
+        index_dir=DEFAULT_INDEX_DIR,
+        encoder=None,
+    ):
+        unique = {}
+        for example in examples:
+            path = (example["category"], example["subcategory"], example["product_type"])
+            unique.setdefault((normalize_text(example["text"]), path), example["text"])
+        self.texts = list(unique.values())
+        self.labels = [path for _, path in unique]
+        self.model_name = model_name
+        self.k = k
+        self.index_dir = index_dir
+        self._encoder = encoder
+        self.embeddings = self.load_or_build_index()
+
+    @classmethod
+    def from_files(cls, paths=(DEFAULT_TRAINING_DATA_PATH,), **kwargs):
+        examples = []
+        for path in paths:
+            if path and os.path.exists(path):
+                examples.extend(load_examples(path))
+        log(f"📚 Loaded {len(examples)} labelled examples for kNN")
+        return cls(examples, **kwargs)
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = get_encoder(self.model_name)
+        return self._encoder
+
+    def embed(self, texts):
+        return embed_texts(self.encoder, texts)
+
+    def load_or_build_index(self):
+        import numpy as np
+
+        digest = hashlib.sha256(
+            json.dumps([self.model_name, self.texts]).encode("utf-8")
+        ).hexdigest()
+        path = os.path.join(self.index_dir, f"{digest}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+        log(f"🧮 Embedding {len(self.texts)} kNN examples")
+        embeddings = self.embed(self.texts) if self.texts else np.zeros((0, 1), np.float32)
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            np.save(path, embeddings)
+        except OSError as e:
+            log(f"⚠️ Could not cache kNN index: {e}")
+        return embeddings
+
+    def classify(self, products):
+        """
+        One {"category", "subcategory", "product_type", "confidence"} guess per
+        product; confidence is the winning path's share of the similarity vote,
+        or 0 when even the nearest example is below MIN_SIMILARITY.
+        """
+        import numpy as np
+
+        if not products or not self.labels:
+            return [None] * len(products)
+        similarities = self.embed([product_text(p) for p in products]) @ self.embeddings.T
+        k = min(self.k, len(self.labels))
+        guesses = []
+        for row in similarities:
+            nearest = np.argpartition(-row, k - 1)[:k]
+            votes = {}
+            for i in nearest:
+                votes[self.labels[i]] = votes.get(self.labels[i], 0.0) + max(float(row[i]), 0.0)
+            best = max(votes, key=votes.get)
+            total = sum(votes.values())
+            confidence = votes[best] / total if total else 0.0
+            if float(row[nearest].max()) < MIN_SIMILARITY:
+                confidence = 0.0
+            guesses.append(
+                {
+                    "category": best[0],
+                    "subcategory": best[1],
+                    "product_type": best[2],
+                    "confidence": round(confidence, 4),
+                }
+            )
+        return guesses
+
+
+def evaluate(classifier, labelled, thresholds, batch_size=20):
+    """Precision of locally resolved products and LLM calls avoided, per threshold"""
+    guesses = classifier.classify([product for product, _ in labelled])
+    total = len(labelled)
+    baseline_calls = math.ceil(total / batch_size)
+    report = []
+    for threshold in thresholds:
+        resolved = correct = correct_subcategory = 0
+        for (product, truth), guess in zip(labelled, guesses):
+            if not guess or guess["confidence"] < threshold:
+                continue
+            resolved += 1
+            path = (guess["category"], guess["subcategory"], guess["product_type"])
+            correct += path == tuple(truth)
+            correct_subcategory += path[:2] == tuple(truth[:2])
+        remaining_calls = math.ceil((total - resolved) / batch_size)
+        report.append(
+            {
+                "threshold": threshold,
+                "products": total,
+                "resolved_locally": resolved,
+                "coverage": resolved / total if total else None,
+                "precision": correct / resolved if resolved else None,
+                "subcategory_precision": correct_subcategory / resolved if resolved else None,
+                "llm_calls_avoided_share": (
+                    (baseline_calls - remaining_calls) / baseline_calls if baseline_calls else None
+                ),
+            }
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the local kNN categorizer")
+    parser.add_argument("--eval", required=True, help="Labelled products (.jsonl reports or .json array)")
+    parser.add_argument(
+        "--examples",
+        nargs="+",
+        default=[DEFAULT_TRAINING_DATA_PATH],
+        help="training_data.json and/or categorized product JSON files to index",
+    )
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95])
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    labelled = load_labelled_products(args.eval)
+    # Keep evaluated products out of the index so they are not scored against
+    # themselves (training_data.json embeds report names after category names)
+    held_out = tuple(
+        {normalize_text(product.get("description")) for product, _ in labelled} - {""}
+    )
+    examples = []
+    for path in args.examples:
+        examples.extend(load_examples(path))
+    kept = [e for e in examples if not normalize_text(e["text"]).endswith(held_out)]
+    log(f"📚 Indexing {len(kept)} examples ({len(examples) - len(kept)} held out)")
+
+    classifier = KnnClassifier(kept, model_name=args.model, k=args.k)
+    print(json.dumps(evaluate(classifier, labelled, args.thresholds, args.batch_size), indent=2))
+
+
+if __name__ == "__main__":
+    main()
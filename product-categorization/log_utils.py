@@ -0,0 +1,8 @@
+"""Logging shared by the categorization scripts"""
+
+import sys
+
+
+def log(message):
+    """Log messages to stderr to keep stdout clean for JSON output"""
+    print(message, file=sys.stderr)
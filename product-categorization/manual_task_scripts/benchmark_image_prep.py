@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare the inlined image payload per categorization batch with and without
+image preparation (downscale + recompress + metadata strip).
+
+Usage: python benchmark_image_prep.py <image_dir> [--batch-size 20] [--max-edge 768] [--quality 85]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_prep import prepare_image, DEFAULT_MAX_EDGE, DEFAULT_QUALITY
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def encode_batch(images, max_edge, quality):
+    """Return (payload bytes, seconds) for base64-encoding one batch of images"""
+    start = time.perf_counter()
+    payload_bytes = 0
+    for content in images:
+        if max_edge:
+            content, _ = prepare_image(content, max_edge, quality)
+        payload_bytes += len(base64.b64encode(content))
+    return payload_bytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preparation")
+    parser.add_argument("image_dir", help="Directory of sample product images")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE)
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.image_dir, name)
+        for name in os.listdir(args.image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"No images found in {args.image_dir}")
+        return
+
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+
+    batches = [
+        images[i : i + args.batch_size]
+        for i in range(0, len(images), args.batch_size)
+    ]
+    print(f"Loaded {len(images)} images into {len(batches)} batches of {args.batch_size}")
+
+    report = {}
+    for label, max_edge in (("original", 0), ("prepared", args.max_edge)):
+        sizes, times = [], []
+        for batch in batches:
+            payload_bytes, seconds = encode_batch(batch, max_edge, args.quality)
+            sizes.append(payload_bytes)
+            times.append(seconds)
+        report[label] = {
+            "avg_payload_bytes_per_batch": sum(sizes) / len(sizes),
+            "avg_encode_ms_per_batch": 1000 * sum(times) / len(times),
+        }
+        print(
+            f"{label:>9}: {report[label]['avg_payload_bytes_per_batch'] / 1024:,.1f} KiB/batch, "
+            f"{report[label]['avg_encode_ms_per_batch']:,.1f} ms/batch"
+        )
+
+    ratio = (
+        report["prepared"]["avg_payload_bytes_per_batch"]
+        / report["original"]["avg_payload_bytes_per_batch"]
+    )
+    print(f"Prepared payload is {ratio:.1%} of the original")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
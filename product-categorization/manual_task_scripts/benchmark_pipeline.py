@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark of categorize -> dual -> product_types, written
+as a JSON report to diff between releases.
+
+For every catalog size, batch size, concurrency and image setting it runs:
+- gemini_wrapper.categorize_all (the batch engine over categorize_products)
+- dual_bridge.process_products on the categorized products
+- gemini_wrapper.determine_product_types_deduped for the additional
+  categorizations still missing a product type, in batches like the JS side
+
+and reports products/second, p50/p95 batch latency, bytes and tokens sent per
+product, model calls and per-stage seconds. Images, when on, are synthetic
+JPEGs served by an in-process HTTP stand-in, so downscaling and encoding are
+measured without network access.
+
+By default (--backend fake) every model answer and latency is simulated by
+FakeGeminiClient, and the report's meta says so ("synthetic_answers": true):
+the numbers show pipeline overhead and how it scales with batch size and
+concurrency, not live API throughput or answer quality. For a run on real
+answers, record a catalog once against the live API and replay it:
+
+    python benchmark_pipeline.py --backend record --cassette catalog.cassette.jsonl \
+        --catalog products.jsonl --sizes 1000 --batch-sizes 20 --concurrency 4 \
+        --images off --requests-per-minute 60
+    python benchmark_pipeline.py --backend replay --cassette catalog.cassette.jsonl \
+        --catalog products.jsonl --sizes 1000 --batch-sizes 20 --concurrency 4 --images off
+
+The record run needs GEMINI_API_KEY and its report measures the live API. The
+replay run sends nothing over the network and answers from the cassette
+(recorded answers, no API latency); any request that was not recorded fails
+its batch and is counted in "replay_misses". Use the same catalog, sizes,
+batch sizes and image setting for both, since requests are matched by content.
+
+Usage: python benchmark_pipeline.py [--sizes 1000 10000 30000] [--catalog products.jsonl ...]
+                                    [--batch-sizes 20 50] [--concurrency 4 8] [--images off on]
+                                    [--latency 0.05] [--error-rate 0] [--output report.json]
+                                    [--backend fake|record|replay] [--cassette PATH]
+                                    [--no-synthetic-catalog]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dual_bridge
+import gemini_backends
+import gemini_wrapper
+from fake_gemini import FakeGeminiClient, prompt_text
+from taxonomy_cache import TaxonomyCacheManager
+from taxonomy_utils import iter_paths
+
+PRODUCT_TYPES_BATCH_SIZE = 50
+BRANDS = ["Kroger", "Simple Truth", "Private Selection", "Heritage Farm", "Home Chef"]
+SIZES = ["8 oz", "16 oz", "1 lb", "12 ct", "64 fl oz", "2 lb"]
+
+
+class CountingModels:
+    """Passes calls through to the fake while counting bytes and tokens sent"""
+
+    def __init__(self, models, totals):
+        self.models = models
+        self.totals = totals
+        self.lock = threading.Lock()
+
+    def count_request(self, contents, config):
+        sent = len(prompt_text(contents).encode("utf-8"))
+        if not isinstance(contents, str):
+            for part in contents:
+                if isinstance(part, dict) and "inline_data" in part:
+                    sent += len(part["inline_data"]["data"])
+        # Response schemas are billed as input too
+        schema = (config or {}).get("response_schema")
+        if schema is not None:
+            sent += len(json.dumps(schema, separators=(",", ":")).encode("utf-8"))
+        with self.lock:
+            self.totals["calls"] += 1
+            self.totals["bytes_sent"] += sent
+
+    def count_usage(self, usage):
+        if usage is None:
+            return
+        with self.lock:
+            self.totals["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+            self.totals["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+    def list(self):
+        return self.models.list()
+
+    def generate_content(self, model, contents, config=None):
+        self.count_request(contents, config)
+        response = self.models.generate_content(model=model, contents=contents, config=config)
+        self.count_usage(getattr(response, "usage_metadata", None))
+        return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.count_request(contents, config)
+        for chunk in self.models.generate_content_stream(
+            model=model, contents=contents, config=config
+        ):
+            self.count_usage(getattr(chunk, "usage_metadata", None))
+            yield chunk
+
+
+class ImageSession:
+    """Stands in for the HTTP session: every URL returns the same JPEG"""
+
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url, headers=None, timeout=None):
+        return SimpleNamespace(
+            status_code=200, ok=True, content=self.content, headers={"Content-Type": "image/jpeg"}
+        )
+
+
+def synthetic_jpeg(edge=1200, seed=0):
+    """A product-photo-sized JPEG: a gradient background with a few coloured boxes"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((edge, edge)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(edge), rng.randrange(edge)
+        size = rng.randrange(20, edge // 4)
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle([x, y, x + size, y + size], fill=colour)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def synthetic_catalog(taxonomy, size, seed=0):
+    """Products named after random product types, with brand and size variants"""
+    rng = random.Random(seed)
+    paths = list(iter_paths(taxonomy))
+    products = []
+    for i in range(size):
+        _, subcategory, product_type = rng.choice(paths)
+        brand = rng.choice(BRANDS)
+        products.append(
+            {
+                "productId": f"bench-{i}",
+                "description": f"{brand} {product_type} {subcategory} {rng.choice(SIZES)}",
+                "brand": brand,
+                "items": [{"size": rng.choice(SIZES)}],
+            }
+        )
+    return products
+
+
+def load_catalog(path):
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def sized(products, size):
+    """The first size products, cycling through the catalog if it is smaller"""
+    return [dict(products[i % len(products)]) for i in range(size)]
+
+
+def product_types_items(products, taxonomy):
+    """determine_product_types items for additional categorizations without a product type"""
+    options = {
+        (category["name"], subcategory["name"]): subcategory.get("productTypes") or []
+        for category in taxonomy
+        for subcategory in category.get("subcategories", [])
+    }
+    items = []
+    for i, product in enumerate(products):
+        for j, entry in enumerate(product.get("additional_categorizations") or []):
+            available = options.get((entry["main_category"], entry["subcategory"]))
+            if not entry.get("product_type") and available:
+                items.append(
+                    {
+                        "id": f"product_{i}_cat_{j}",
+                        "description": product.get("description", ""),
+                        "category": entry["main_category"],
+                        "subcategory": entry["subcategory"],
+                        "availableProductTypes": available,
+                    }
+                )
+    return items
+
+
+def run(taxonomy, products, batch_size, concurrency, images, args, jpeg):
+    totals = {"calls": 0, "bytes_sent": 0, "prompt_tokens": 0, "output_tokens": 0}
+    if args.backend == "fake":
+        client = FakeGeminiClient(
+            taxonomy,
+            latency_seconds=args.latency,
+            latency_jitter=args.jitter,
+            error_rate=args.error_rate,
+            seed=args.seed,
+        )
+    else:
+        client = gemini_backends.create_client(
+            args.backend, api_key=os.environ.get("GEMINI_API_KEY"), cassette_path=args.cassette
+        )
+    gemini_wrapper.client = SimpleNamespace(
+        models=CountingModels(client.models, totals), caches=client.caches
+    )
+    gemini_wrapper.taxonomy_caches = TaxonomyCacheManager(
+        gemini_wrapper.client, os.path.join(args.state_dir, "taxonomy_cache_state.json")
+    )
+    gemini_wrapper.result_cache = None
+    gemini_wrapper.image_cache = None
+    gemini_wrapper._http_session = ImageSession(jpeg) if images else None
+
+    products = [
+        {**p, "image_url": f"https://bench.invalid/{i}.jpg"} if images else p
+        for i, p in enumerate(products)
+    ]
+    timings = {}
+
+    started = time.monotonic()
+    result = gemini_wrapper.categorize_all(
+        products,
+        taxonomy,
+        options={
+            "batch_size": batch_size,
+            "concurrency": concurrency,
+            "adaptive": False,
+            "requests_per_minute": args.requests_per_minute,
+        },
+    )
+    timings["categorize"] = time.monotonic() - started
+    engine_stats = result["stats"]
+
+    categorized = [
+        {**product, **item}
+        for product, item in zip(products, result["categorizations"])
+        if item and item.get("category")
+    ]
+    started = time.monotonic()
+    with contextlib.redirect_stderr(io.StringIO()):
+        dual = json.loads(dual_bridge.process_products(json.dumps(categorized)))
+    timings["dual"] = time.monotonic() - started
+
+    items = product_types_items(dual, taxonomy)
+    answered = errors = 0
+    calls_before = totals["calls"]
+    started = time.monotonic()
+    for start in range(0, len(items), PRODUCT_TYPES_BATCH_SIZE):
+        try:
+            answered += len(
+                gemini_wrapper.determine_product_types_deduped(
+                    items[start : start + PRODUCT_TYPES_BATCH_SIZE]
+                )
+            )
+        except Exception:
+            errors += 1
+    timings["product_types"] = time.monotonic() - started
+
+    elapsed = sum(timings.values())
+    count = len(products)
+    replay_misses = {"replay_misses": client.misses} if args.backend == "replay" else {}
+    return {
+        "products": count,
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "images": images,
+        "seconds": round(elapsed, 3),
+        "products_per_second": round(count / elapsed, 2) if elapsed else None,
+        "stage_seconds": {k: round(v, 3) for k, v in timings.items()},
+        "p50_batch_seconds": engine_stats.get("p50_batch_seconds"),
+        "p95_batch_seconds": engine_stats.get("p95_batch_seconds"),
+        "retries": engine_stats.get("retries"),
+        "failed_batches": engine_stats.get("failed_batches"),
+        "categorized": len(categorized),
+        "bytes_sent_per_product": round(totals["bytes_sent"] / count, 1),
+        "prompt_tokens_per_product": round(totals["prompt_tokens"] / count, 1),
+        "output_tokens_per_product": round(totals["output_tokens"] / count, 1),
+        "model_calls": totals["calls"],
+        "product_types": {
+            "items": len(items),
+            "answered": answered,
+            "model_calls": totals["calls"] - calls_before,
+            "failed_batches": errors,
+        },
+        **replay_misses,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end categorization throughput benchmark")
+    parser.add_argument("--categories", default=gemini_wrapper.DEFAULT_TAXONOMY_PATH)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 30000])
+    parser.add_argument(
+        "--catalog",
+        nargs="*",
+        default=[],
+        help="Recorded product files (.json array or .jsonl) benchmarked next to the synthetic catalog",
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[20, 50])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--images", choices=["off", "on"], nargs="+", default=["off", "on"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per model call")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--requests-per-minute", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report here instead of stdout")
+    parser.add_argument(
+        "--backend",
+        choices=["fake", "record", "replay"],
+        default="fake",
+        help="fake: simulated answers and latency; record: live API, saved to --cassette; "
+        "replay: answers from --cassette, no network",
+    )
+    parser.add_argument("--cassette", help="Cassette file for --backend record/replay")
+    parser.add_argument(
+        "--no-synthetic-catalog",
+        dest="synthetic_catalog",
+        action="store_false",
+        help="Only benchmark the --catalog files",
+    )
+    args = parser.parse_args()
+    if args.backend != "fake" and not args.cassette:
+        parser.error(f"--backend {args.backend} needs --cassette")
+    if not args.synthetic_catalog and not args.catalog:
+        parser.error("--no-synthetic-catalog needs at least one --catalog")
+
+    # The pipeline logs per product; keep the benchmark's own output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    gemini_wrapper.log = lambda message: None
+
+    with open(args.categories, "r") as f:
+        taxonomy = json.load(f)
+    catalogs = {}
+    if args.synthetic_catalog:
+        catalogs["synthetic"] = synthetic_catalog(taxonomy, max(args.sizes), args.seed)
+    for path in args.catalog:
+        catalogs[os.path.basename(path)] = load_catalog(path)
+    jpeg = synthetic_jpeg(seed=args.seed) if "on" in args.images else None
+
+    args.state_dir = tempfile.mkdtemp(prefix="benchmark_pipeline_")
+    runs = []
+    for name, catalog in catalogs.items():
+        for size in args.sizes:
+            for batch_size in args.batch_sizes:
+                for concurrency in args.concurrency:
+                    for images in args.images:
+                        print(
+                            f"▶️ {name} {size} products, batch {batch_size}, "
+                            f"concurrency {concurrency}, images {images}",
+                            file=sys.stderr,
+                        )
+                        outcome = run(
+                            taxonomy,
+                            sized(catalog, size),
+                            batch_size,
+                            concurrency,
+                            images == "on",
+                            args,
+                            jpeg,
+                        )
+                        runs.append({"catalog": name, **outcome})
+                        print(f"   {outcome['products_per_second']} products/s", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "backend": args.backend,
+            # Fake answers and latencies: compare these runs with each other, not with the API
+            "synthetic_answers": args.backend == "fake",
+            **(
+                {
+                    "latency_seconds": args.latency,
+                    "jitter_seconds": args.jitter,
+                    "error_rate": args.error_rate,
+                }
+                if args.backend == "fake"
+                else {"cassette": args.cassette}
+            ),
+            "seed": args.seed,
+        },
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
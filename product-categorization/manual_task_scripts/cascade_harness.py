@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Run categorize_all against the offline fake client with and without the
+fast/pro cascade and compare wall time, escalation rate and calls per model.
+
+Everything the cascade decides on is synthetic: per-model latencies, the share
+of low-confidence answers and invalid answers are the command-line rates, and
+the report's meta says so. The output shows how the cascade behaves for given
+rates (e.g. the break-even escalation rate), not what it saves on the live API.
+A recorded catalog run (benchmark_pipeline.py --backend record/replay)
+replays real answers but no latencies, so it cannot stand in here.
+
+Usage: python cascade_harness.py [--products 200] [--fast-latency 0.3] [--pro-latency 1.5]
+                                 [--low-confidence-rate 0.2] [--invalid-rate 0.05]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_wrapper
+from fake_gemini import FakeGeminiClient
+from taxonomy_cache import TaxonomyCacheManager
+
+
+def run(taxonomy, products, args, cascade):
+    client = FakeGeminiClient(
+        taxonomy,
+        latency_seconds=args.pro_latency,
+        latency_by_model={gemini_wrapper.FAST_MODEL: args.fast_latency},
+        invalid_rate=args.invalid_rate,
+        low_confidence_rate=args.low_confidence_rate,
+        seed=args.seed,
+    )
+    gemini_wrapper.client = client
+    gemini_wrapper.taxonomy_caches = TaxonomyCacheManager(
+        client, os.path.join(tempfile.mkdtemp(), "state.json")
+    )
+    gemini_wrapper.result_cache = None
+    gemini_wrapper.CASCADE = cascade
+    gemini_wrapper.CASCADE_THRESHOLD = args.threshold
+
+    started = time.monotonic()
+    result = gemini_wrapper.categorize_all(
+        products, taxonomy, options={"batch_size": args.batch_size, "adaptive": False}
+    )
+    elapsed = time.monotonic() - started
+    tiers = {}
+    for item in result["categorizations"]:
+        tiers[item.get("tier", "pro")] = tiers.get(item.get("tier", "pro"), 0) + 1
+    return {
+        "seconds": round(elapsed, 3),
+        "escalated": result["stats"]["escalated"] if cascade else len(products),
+        "escalation_rate": round(result["stats"]["escalated"] / len(products), 3) if cascade else 1.0,
+        "tier_seconds": (
+            {
+                "fast": result["stats"]["cascade_fast_seconds"],
+                "pro": result["stats"]["cascade_pro_seconds"],
+            }
+            if cascade
+            else None
+        ),
+        "answered_by_tier": tiers,
+        "calls_by_model": client.calls_by_model,
+        "invalid": sum(1 for item in result["categorizations"] if item.get("status") in ("invalid", "missing")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline cascade harness")
+    parser.add_argument("--categories", default="categories.json")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--fast-latency", type=float, default=0.3)
+    parser.add_argument("--pro-latency", type=float, default=1.5)
+    parser.add_argument("--low-confidence-rate", type=float, default=0.2)
+    parser.add_argument("--invalid-rate", type=float, default=0.05)
+    parser.add_argument("--threshold", type=float, default=gemini_wrapper.CASCADE_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.categories, "r") as f:
+        taxonomy = json.load(f)
+    products = [
+        {"description": f"Sample product {i}", "brand": "Harness"}
+        for i in range(args.products)
+    ]
+
+    report = {
+        "meta": {
+            "backend": "fake",
+            "synthetic_answers": True,
+            "fast_latency_seconds": args.fast_latency,
+            "pro_latency_seconds": args.pro_latency,
+            "low_confidence_rate": args.low_confidence_rate,
+            "invalid_rate": args.invalid_rate,
+            "seed": args.seed,
+        },
+        "pro_only": run(taxonomy, products, args, cascade=False),
+        "cascade": run(taxonomy, products, args, cascade=True),
+    }
+    report["seconds_saved"] = round(
+        report["pro_only"]["seconds"] - report["cascade"]["seconds"], 3
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
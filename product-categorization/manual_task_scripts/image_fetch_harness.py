@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Exercise gemini_wrapper.load_images against a local HTTP stand-in: concurrency
+of the fetch pool, the batch deadline and failed downloads, with no network.
+
+The stand-in serves a small JPEG at /image/<n>?delay=<seconds> and 404s at
+/missing/<n>, and tracks how many requests are in flight. One batch mixes fast,
+slow (slower than the deadline) and missing images; the report checks that:
+- no more than IMAGE_FETCH_WORKERS requests were ever in flight;
+- load_images returned at the deadline, with the slow and missing images None;
+- fast images all arrived;
+- fetches still running at the deadline gave their pool worker back within
+  LATE_FETCH_SLACK_SECONDS of load_images returning (their timeouts are capped
+  at the deadline).
+
+The stand-in keeps sleeping through the slow requests after the client gives
+up on them, so how long it stays busy says nothing about the fetch pool; the
+pool is measured on the client side by wrapping the session in a
+CountingSession.
+
+Neither Pillow nor requests is needed: without Pillow the stand-in serves bare
+JPEG start/end markers (prepare_image passes them through untouched), and
+without requests load_images gets a small urllib-based session. The report
+says which session was used.
+
+Usage: python image_fetch_harness.py [--fast 24] [--slow 4] [--missing 2]
+                                     [--delay 0.2] [--slow-delay 3] [--deadline 1.5]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gemini_wrapper
+
+# How long after load_images returns the fetches cut off by the deadline may still run
+LATE_FETCH_SLACK_SECONDS = gemini_wrapper.IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS + 0.5
+
+
+def small_jpeg():
+    try:
+        from PIL import Image
+    except ImportError:
+        # Start and end of image markers; nothing decodes them without Pillow
+        return b"\xff\xd8\xff\xd9"
+
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class UrllibSession:
+    """The part of requests.Session that load_image uses, over urllib"""
+
+    def get(self, url, headers=None, timeout=None):
+        request = urllib.request.Request(url, headers=headers or {})
+        # urllib has a single timeout for connecting and for each read
+        timeout = max(timeout) if isinstance(timeout, tuple) else timeout
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                status, content, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, content, response_headers = e.code, e.read(), e.headers
+        return SimpleNamespace(
+            status_code=status, ok=status < 400, content=content, headers=dict(response_headers)
+        )
+
+
+class CountingSession:
+    """Wraps a session to track how many get() calls are running"""
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.session.get(url, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def wait_idle(self, timeout):
+        started = time.monotonic()
+        while self.in_flight and time.monotonic() - started < timeout:
+            time.sleep(0.01)
+        return time.monotonic() - started
+
+
+def fetch_session():
+    """gemini_wrapper's pooled requests session, or a UrllibSession without requests"""
+    try:
+        return "requests", gemini_wrapper.get_http_session()
+    except ImportError:
+        return "urllib", UrllibSession()
+
+
+class StandIn:
+    """Local image server that records in-flight and peak concurrent requests"""
+
+    def __init__(self, jpeg):
+        self.jpeg = jpeg
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.enter()
+                try:
+                    url = urlparse(self.path)
+                    time.sleep(float(parse_qs(url.query).get("delay", ["0"])[0]))
+                    if url.path.startswith("/missing/"):
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "image/jpeg")
+                    self.send_header("Content-Length", str(len(stand_in.jpeg)))
+                    self.end_headers()
+                    self.wfile.write(stand_in.jpeg)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    stand_in.leave()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+def fetch_batch(stand_in, session, fast, slow, missing, delay, slow_delay, deadline):
+    """
+    Run load_images over one mixed batch against stand_in and return the report:
+    timings, in-flight counts and the checks listed in the module docstring
+    """
+    # Slow images first, so they hold workers while the fast ones queue behind them
+    urls = (
+        [f"{stand_in.base_url}/image/slow{i}?delay={slow_delay}" for i in range(slow)]
+        + [f"{stand_in.base_url}/image/{i}?delay={delay}" for i in range(fast)]
+        + [f"{stand_in.base_url}/missing/{i}" for i in range(missing)]
+        + [None]
+    )
+    counting = CountingSession(session)
+    started = time.monotonic()
+    images = gemini_wrapper.load_images(urls, deadline_seconds=deadline, session=counting)
+    elapsed = time.monotonic() - started
+    still_running = counting.in_flight
+    busy_after = counting.wait_idle(slow_delay + gemini_wrapper.IMAGE_READ_TIMEOUT_SECONDS)
+
+    checks = {
+        "peak_in_flight_within_pool": stand_in.peak <= gemini_wrapper.IMAGE_FETCH_WORKERS,
+        "returned_by_deadline": elapsed < deadline + 0.5,
+        "slow_images_dropped": all(image is None for image in images[:slow]),
+        "missing_images_none": all(image is None for image in images[slow + fast :]),
+        "fast_images_loaded": all(image is not None for image in images[slow : slow + fast]),
+        "late_fetches_bounded": busy_after < LATE_FETCH_SLACK_SECONDS,
+    }
+    return {
+        "workers": gemini_wrapper.IMAGE_FETCH_WORKERS,
+        "peak_in_flight": stand_in.peak,
+        "load_images_seconds": round(elapsed, 3),
+        "deadline_seconds": deadline,
+        "loaded": sum(1 for image in images if image),
+        "fetches_in_flight_after_return": still_running,
+        "fetch_pool_busy_after_return_seconds": round(busy_after, 3),
+        "checks": checks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image fetch harness against a local HTTP stand-in")
+    parser.add_argument("--fast", type=int, default=24, help="Images that arrive in --delay")
+    parser.add_argument("--slow", type=int, default=4, help="Images slower than the deadline")
+    parser.add_argument("--missing", type=int, default=2, help="URLs that return 404")
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--deadline", type=float, default=1.5)
+    args = parser.parse_args()
+
+    gemini_wrapper.log = lambda message: None
+    gemini_wrapper.image_cache = None
+    stand_in = StandIn(small_jpeg())
+    session_kind, session = fetch_session()
+    report = fetch_batch(
+        stand_in,
+        session,
+        args.fast,
+        args.slow,
+        args.missing,
+        args.delay,
+        args.slow_delay,
+        args.deadline,
+    )
+    print(json.dumps({"session": session_kind, **report}, indent=2))
+    stand_in.server.shutdown()
+
+    failed = [name for name, ok in report["checks"].items() if not ok]
+    for name in failed:
+        print(f"❌ {name}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+    print("✅ Image fetching behaves as expected", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Cold-start report for the Python entry points the JS side spawns per batch.
+
+For each entry point it measures, in fresh interpreters:
+- the import time of the module, parsed from `python -X importtime`, with the
+  slowest top-level imports;
+- the wall time of a trivial invocation (an empty batch), best of --runs.
+
+With --budget-ms, exits with status 1 if any trivial invocation is slower
+than the budget (DEFAULT_BUDGET_MS when no value is given).
+tests/python/test_startup.py enforces the same budget and checks that the
+deferred modules stay out of a plain import and a trivial invocation.
+
+Usage: python startup_report.py [--runs 5] [--top 10] [--budget-ms [250]]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A trivial gemini_wrapper invocation took ~535 ms with eager imports and
+# ~150 ms with deferred ones (dual_bridge ~60 ms). Importing requests, pydantic
+# and google.api_core at startup cost ~300 ms together, so 250 ms leaves room
+# for a slower machine and still fails if they come back.
+DEFAULT_BUDGET_MS = 250
+
+# name -> (module, argv, stdin) for a trivial invocation that touches no network
+ENTRY_POINTS = {
+    "gemini_wrapper": (
+        "gemini_wrapper",
+        ["--mode", "product_types", "--backend", "fake", "--no-result-cache", "--no-image-cache"],
+        "[]",
+    ),
+    "dual_bridge": ("dual_bridge", [], "[]"),
+}
+
+
+def import_times(module):
+    """(total microseconds, [(cumulative us, name)] of module's direct imports)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    direct = []
+    pending = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, raw_name = line[len("import time:") :].split("|")
+        name = raw_name.strip()
+        # Children are listed before their parent, indented two spaces per level
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        if depth == 1:
+            pending.append((int(cumulative), name))
+        elif depth == 0:
+            if name == module:
+                total, direct = int(cumulative), pending
+            pending = []
+    return total, sorted(direct, reverse=True)
+
+
+def invocation_seconds(module, argv, stdin, runs):
+    """Best wall time of running the entry point script on stdin"""
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    best = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, f"{module}.py"), *argv],
+            cwd=ROOT,
+            input=stdin,
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time report for the Python entry points")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        nargs="?",
+        const=DEFAULT_BUDGET_MS,
+        help=f"Fail if a trivial invocation takes longer (default when given without a value: {DEFAULT_BUDGET_MS})",
+    )
+    args = parser.parse_args()
+
+    report = {}
+    for name, (module, argv, stdin) in ENTRY_POINTS.items():
+        total_us, top_level = import_times(module)
+        report[name] = {
+            "import_ms": round(total_us / 1000, 1),
+            "invocation_ms": round(invocation_seconds(module, argv, stdin, args.runs) * 1000, 1),
+            "slowest_imports": [
+                {"module": imported, "cumulative_ms": round(us / 1000, 1)}
+                for us, imported in top_level[: args.top]
+            ],
+        }
+    print(json.dumps(report, indent=2))
+
+    if args.budget_ms is not None:
+        over = {
+            name: entry["invocation_ms"]
+            for name, entry in report.items()
+            if entry["invocation_ms"] > args.budget_ms
+        }
+        for name, ms in over.items():
+            print(f"❌ {name} took {ms} ms, budget is {args.budget_ms} ms", file=sys.stderr)
+        if over:
+            sys.exit(1)
+        print(f"✅ All entry points start within {args.budget_ms} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
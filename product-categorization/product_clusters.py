@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate clustering of products ahead of categorization.
+
+Catalog feeds list many variants of one product line (flavors, sizes, pack
+counts) that always land on the same taxonomy path. Products are reduced to
+word shingles of description + brand with size and count tokens dropped,
+MinHash signatures are bucketed with LSH, and a product joins the first
+cluster whose representative it matches with Jaccard similarity at or above
+the threshold (compared against the representative only, so clusters do not
+chain into unrelated products). Only representatives, plus a spot-check
+sample of members, need to go to the model.
+
+Pure Python; no extra dependencies.
+"""
+
+import hashlib
+import random
+import re
+
+from result_cache import normalize_text
+
+DEFAULT_THRESHOLD = 0.6
+NUM_PERMUTATIONS = 96
+# 24 bands of 4 rows: pairs at Jaccard 0.6 become candidates ~96% of the time
+BANDS = 24
+# Share of cluster members categorized individually to confirm the cluster
+DEFAULT_SPOT_CHECK_RATE = 0.05
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Sizes, counts and other numbers distinguish variants, not product lines
+_VARIANT_TOKEN = re.compile(
+    r"^\d+([.,/]\d+)?(oz|fl|lb|lbs|g|kg|ml|l|ct|pk|pack|count|gal|qt|pt)?$"
+)
+_VARIANT_WORDS = {"oz", "fl", "lb", "lbs", "ct", "pk", "pack", "count", "gal", "qt", "pt", "ml"}
+
+
+def shingles(product):
+    """Set of word tokens of description + brand, without size/count tokens"""
+    text = normalize_text(f"{product.get('brand') or ''} {product.get('description') or ''}")
+    tokens = re.findall(r"[a-z0-9][a-z0-9.,/%'&-]*", text)
+    return {
+        token
+        for token in tokens
+        if not _VARIANT_TOKEN.match(token) and token not in _VARIANT_WORDS
+    }
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures from NUM_PERMUTATIONS universal hash functions"""
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        rng = random.Random(seed)
+        self.params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_permutations)
+        ]
+
+    def signature(self, tokens):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=4).digest(), "big")
+            for t in tokens
+        ] or [0]
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.params
+        ]
+
+
+def cluster_products(products, threshold=DEFAULT_THRESHOLD, bands=BANDS):
+    """
+    Group near-duplicate products. Returns a list of clusters, each a list of
+    product indexes whose first entry is the cluster's representative; every
+    index appears in exactly one cluster, in input order of representatives.
+    """
+    hasher = MinHasher()
+    rows = len(hasher.params) // bands
+    buckets = {}
+    clusters = []
+    representative_shingles = []
+    for i, product in enumerate(products):
+        tokens = shingles(product)
+        signature = hasher.signature(tokens)
+        keys = [(band, tuple(signature[band * rows : (band + 1) * rows])) for band in range(bands)]
+
+        candidates = dict.fromkeys(c for key in keys for c in buckets.get(key, ()))
+        match = next(
+            (c for c in candidates if jaccard(tokens, representative_shingles[c]) >= threshold),
+            None,
+        )
+        if match is not None:
+            clusters[match].append(i)
+            continue
+
+        clusters.append([i])
+        representative_shingles.append(tokens)
+        for key in keys:
+            buckets.setdefault(key, []).append(len(clusters) - 1)
+    return clusters
+
+
+def spot_check_sample(clusters, rate=DEFAULT_SPOT_CHECK_RATE, seed=0):
+    """
+    Member indexes (never representatives) to categorize individually: about
+    rate of the members of multi-product clusters, at least one per such
+    cluster when rate > 0.
+    """
+    rng = random.Random(seed)
+    sample = []
+    if rate <= 0:
+        return sample
+    for cluster in clusters:
+        members = cluster[1:]
+        if members:
+            count = max(1, round(len(members) * rate))
+            sample.extend(sorted(rng.sample(members, min(count, len(members)))))
+    return sample
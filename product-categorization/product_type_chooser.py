@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Local product-type chooser for additional categorizations.
+
+determine_product_types asks the model to pick one of a subcategory's product
+types for a product. Most of those questions are easy (a cheddar going to
+Deli > Cheese), so the product text is embedded and compared with embeddings
+of the candidate product-type names; when the best option beats the runner-up
+by at least the margin it is answered locally and only ambiguous items go to
+the model.
+
+Product-type embeddings are computed once per taxonomy version and cached on
+disk; options not seen in a precomputed taxonomy are embedded on first use.
+"""
+
+import hashlib
+import os
+
+from knn_classifier import DEFAULT_EMBEDDING_MODEL, DEFAULT_INDEX_DIR, embed_texts, get_encoder
+from log_utils import log
+from taxonomy_utils import iter_paths, cached_taxonomy_hash
+
+# Cosine-similarity gap between the best and second-best option needed to
+# answer locally
+DEFAULT_MARGIN = 0.08
+
+
+def option_text(subcategory, product_type):
+    """Text embedded for a candidate; the subcategory disambiguates names like "Other" """
+    return f"{product_type} ({subcategory})"
+
+
+class ProductTypeChooser:
+    """Picks product types by embedding similarity when the choice is clear"""
+
+    def __init__(
+        self,
+        margin=DEFAULT_MARGIN,
+        model_name=DEFAULT_EMBEDDING_MODEL,
+        index_dir=DEFAULT_INDEX_DIR,
+        encoder=None,
+    ):
+        self.margin = margin
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self._encoder = encoder
+        self.vectors = {}
+        self.taxonomies = set()
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = get_encoder(self.model_name)
+        return self._encoder
+
+    def precompute(self, taxonomy):
+        """Embed every product type of a taxonomy, once per taxonomy version"""
+        import numpy as np
+
+        version = cached_taxonomy_hash(taxonomy)
+        if version in self.taxonomies:
+            return
+        keys = [(subcategory, product_type) for _, subcategory, product_type in iter_paths(taxonomy)]
+        keys = list(dict.fromkeys(keys))
+        model_key = hashlib.sha256(self.model_name.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(self.index_dir, f"product-types-{model_key}-{version}.npy")
+        if os.path.exists(path):
+            vectors = np.load(path)
+        else:
+            log(f"🧮 Embedding {len(keys)} product types for taxonomy {version[:12]}")
+            vectors = embed_texts(self.encoder, [option_text(*key) for key in keys])
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                np.save(path, vectors)
+            except OSError as e:
+                log(f"⚠️ Could not cache product type embeddings: {e}")
+        self.vectors.update(zip(keys, vectors))
+        self.taxonomies.add(version)
+
+    def option_vectors(self, subcategory, options):
+        import numpy as np
+
+        missing = [o for o in dict.fromkeys(options) if (subcategory, o) not in self.vectors]
+        if missing:
+            vectors = embed_texts(self.encoder, [option_text(subcategory, o) for o in missing])
+            self.vectors.update(((subcategory, o), v) for o, v in zip(missing, vectors))
+        return np.stack([self.vectors[(subcategory, o)] for o in options])
+
+    def choose(self, batch_items):
+        """
+        {"id": product_type} for the product_types items that can be answered
+        locally: single-option items and items whose best option wins by at
+        least the margin.
+        """
+        answers = {}
+        scored = []
+        for item in batch_items:
+            options = [str(o) for o in item.get("availableProductTypes") or []]
+            if len(set(options)) == 1:
+                answers[str(item["id"])] = options[0]
+            elif options:
+                scored.append((item, options))
+        if not scored:
+            return answers
+
+        products = embed_texts(self.encoder, [item.get("description") or "" for item, _ in scored])
+        for (item, options), product in zip(scored, products):
+            similarities = self.option_vectors(item.get("subcategory"), options) @ product
+            ranked = sorted(zip(similarities.tolist(), options), reverse=True)
+            if ranked[0][0] - ranked[1][0] >= self.margin:
+                answers[str(item["id"])] = ranked[0][1]
+        return answers
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Structured-output schemas built from the taxonomy, so the model can only
+answer with values that exist in it.
+
+Schema modes for categorization:
+- "path":   each item carries one "path" string from an enum of every valid
+            "Category > Subcategory > Product Type" triple (exactly the valid
+            combinations, but the schema is larger than the taxonomy itself)
+- "fields": category, subcategory and product_type each get their own enum
+            (valid names, but not necessarily a valid combination; the
+            default, as the smallest schema that still enumerates the taxonomy,
+            since response schemas count as input tokens on every call)
+- "id":     each item carries one integer "path_id"; the prompt lists the
+            taxonomy as a compact id table instead of JSON (fewest tokens, but
+            ids are not enum-constrained and are only checked when decoding)
+- "free":   plain strings, the original schema
+
+Path ids number the valid paths from 1 in taxonomy order (categories.json
+order), so the same taxonomy always gets the same ids, and a pruned taxonomy
+keeps the ids of the full one.
+"""
+
+from taxonomy_utils import iter_paths, cached_taxonomy_hash
+
+SCHEMA_MODES = ("path", "id", "fields", "free")
+DEFAULT_SCHEMA_MODE = "fields"
+PATH_SEPARATOR = " > "
+
+_path_lookups = {}
+_path_ids = {}
+
+
+def format_path(category, subcategory, product_type):
+    return PATH_SEPARATOR.join((category, subcategory, product_type))
+
+
+def path_lookup(taxonomy):
+    """{"Category > Subcategory > Product Type": (category, subcategory, product_type)}"""
+    key = cached_taxonomy_hash(taxonomy)
+    if key not in _path_lookups:
+        _path_lookups[key] = {format_path(*path): path for path in iter_paths(taxonomy)}
+    return _path_lookups[key]
+
+
+def path_ids(taxonomy):
+    """{path_id: (category, subcategory, product_type)}, ids from 1 in taxonomy order"""
+    key = cached_taxonomy_hash(taxonomy)
+    if key not in _path_ids:
+        _path_ids[key] = dict(enumerate(iter_paths(taxonomy), start=1))
+    return _path_ids[key]
+
+
+def id_table(taxonomy, subset=None):
+    """
+    Compact path id table, one line per subcategory:
+        Produce > Fresh Fruits: 17=Apples; 18=Bananas
+    With subset (a pruned copy of taxonomy) only its paths are listed, still
+    numbered with taxonomy's ids.
+    """
+    ids = {path: path_id for path_id, path in path_ids(taxonomy).items()}
+    listed = iter_paths(subset) if subset is not None else iter_paths(taxonomy)
+    rows = {}
+    for path in listed:
+        rows.setdefault(path[:2], []).append(f"{ids[path]}={path[2]}")
+    return "\n".join(
+        f"{PATH_SEPARATOR.join(key)}: {'; '.join(entries)}" for key, entries in rows.items()
+    )
+
+
+def unique(values):
+    return list(dict.fromkeys(values))
+
+
+def categorization_schema(taxonomy, mode=DEFAULT_SCHEMA_MODE):
+    """response_schema for a categorization request in the given mode"""
+    if mode == "id":
+        # Gemini enums are string-only, so ids are checked when decoding
+        properties = {
+            "index": {"type": "INTEGER"},
+            "path_id": {"type": "INTEGER"},
+        }
+    elif mode == "path":
+        properties = {
+            "index": {"type": "INTEGER"},
+            "path": {"type": "STRING", "enum": list(path_lookup(taxonomy))},
+        }
+    else:
+        properties = {
+            "index": {"type": "INTEGER"},
+            "category": {"type": "STRING"},
+            "subcategory": {"type": "STRING"},
+            "product_type": {"type": "STRING"},
+        }
+        if mode == "fields":
+            paths = list(iter_paths(taxonomy))
+            for i, field in enumerate(("category", "subcategory", "product_type")):
+                properties[field]["enum"] = unique(path[i] for path in paths)
+
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": properties,
+            "required": list(properties),
+            "property_ordering": list(properties),
+        },
+    }
+
+
+def decode_path_items(items, taxonomy):
+    """
+    Turn {"index", "path"} or {"index", "path_id"} items into {"index",
+    "category", "subcategory", "product_type"} dicts, keeping any other fields.
+    An unknown path or id decodes to empty fields so it fails validation like
+    any other invalid answer, and keeps the raw "path" or "path_id" the model
+    gave so a follow-up prompt can show it. Path ids are looked up in taxonomy,
+    which must be the full taxonomy the ids were assigned from.
+    """
+    lookup = path_lookup(taxonomy)
+    ids = path_ids(taxonomy)
+    decoded = []
+    for item in items:
+        if isinstance(item, dict) and "path_id" in item:
+            path_id = item["path_id"]
+            if isinstance(path_id, str) and path_id.strip().isdigit():
+                path_id = int(path_id)
+            path = ids.get(path_id) if isinstance(path_id, int) else None
+            key = "path_id"
+        elif isinstance(item, dict) and "path" in item:
+            path = lookup.get(item["path"])
+            key = "path"
+        else:
+            decoded.append(item)
+            continue
+        category, subcategory, product_type = path or ("", "", "")
+        extra = {k: v for k, v in item.items() if k not in ("index", key) or (k == key and not path)}
+        decoded.append(
+            {
+                "index": item.get("index"),
+                "category": category,
+                "subcategory": subcategory,
+                "product_type": product_type,
+                **extra,
+            }
+        )
+    return decoded
+
+
+def product_types_schema(batch_items):
+    """
+    response_schema for determine_product_types: an object keyed by item id whose
+    values are restricted to that item's availableProductTypes.
+    """
+    properties = {}
+    for item in batch_items:
+        options = unique(str(option) for option in item["availableProductTypes"])
+        properties[str(item["id"])] = {"type": "STRING", "enum": options}
+    return {
+        "type": "OBJECT",
+        "properties": properties,
+        "required": list(properties),
+        "property_ordering": list(properties),
+    }
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from log_utils import log
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "categorization_cache.sqlite3"
+)
+
+
+def normalize_text(value):
+    """Lowercase, drop trademark symbols and collapse whitespace"""
+    value = re.sub(r"[®™©]", "", str(value or ""))
+    return " ".join(value.lower().split())
+
+
+def product_type_question_key(item):
+    """Hash of a product_types question: product, target subcategory and its options"""
+    parts = [
+        normalize_text(item.get("description")),
+        normalize_text(item.get("category")),
+        normalize_text(item.get("subcategory")),
+        "\x1f".join(sorted(normalize_text(o) for o in item.get("availableProductTypes") or [])),
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def product_fingerprint(product):
+    """Hash of the product fields that the categorization prompt actually uses"""
+    items = product.get("items") or [{}]
+    parts = [
+        normalize_text(product.get("description")),
+        normalize_text(product.get("brand")),
+        normalize_text(items[0].get("size")),
+        normalize_text((product.get("temperature") or {}).get("indicator")),
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite-backed store of validated categorizations keyed by product fingerprint
+    and taxonomy hash. Rows for any other taxonomy are purged the first time a
+    new taxonomy hash is seen, so editing categories.json invalidates the cache.
+
+    It also memoizes product_types answers by question key. Those keys include
+    the offered options, so they stay valid across taxonomy changes.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.current_taxonomy_hash = None
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS categorizations (
+                fingerprint TEXT NOT NULL,
+                taxonomy_hash TEXT NOT NULL,
+                category TEXT NOT NULL,
+                subcategory TEXT NOT NULL,
+                product_type TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (fingerprint, taxonomy_hash)
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS product_type_answers (
+                question_key TEXT PRIMARY KEY,
+                product_type TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )"""
+        )
+        self.conn.commit()
+
+    def use_taxonomy(self, current_hash):
+        """Switch to a taxonomy hash, dropping rows cached under any other one"""
+        if current_hash == self.current_taxonomy_hash:
+            return
+        with self.lock:
+            deleted = self.conn.execute(
+                "DELETE FROM categorizations WHERE taxonomy_hash != ?", (current_hash,)
+            ).rowcount
+            self.conn.commit()
+        if deleted:
+            log(f"🧹 Taxonomy changed, dropped {deleted} cached categorizations")
+        self.current_taxonomy_hash = current_hash
+
+    def get_many(self, fingerprints):
+        """Return {fingerprint: categorization} for the fingerprints that are cached"""
+        found = {}
+        unique = list(set(fingerprints))
+        with self.lock:
+            for i in range(0, len(unique), 500):
+                chunk = unique[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"""SELECT fingerprint, category, subcategory, product_type
+                    FROM categorizations
+                    WHERE taxonomy_hash = ? AND fingerprint IN ({placeholders})""",
+                    [self.current_taxonomy_hash, *chunk],
+                )
+                for fingerprint, category, subcategory, product_type in rows:
+                    found[fingerprint] = {
+                        "category": category,
+                        "subcategory": subcategory,
+                        "product_type": product_type,
+                    }
+        return found
+
+    def put_many(self, entries):
+        """Store (fingerprint, categorization) pairs under the current taxonomy"""
+        now = time.time()
+        rows = [
+            (
+                fingerprint,
+                self.current_taxonomy_hash,
+                item["category"],
+                item["subcategory"],
+                item["product_type"],
+                now,
+            )
+            for fingerprint, item in entries
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO categorizations VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.commit()
+
+    def get_product_types(self, question_keys):
+        """Return {question_key: product_type} for the questions answered before"""
+        found = {}
+        unique = list(set(question_keys))
+        with self.lock:
+            for i in range(0, len(unique), 500):
+                chunk = unique[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"""SELECT question_key, product_type FROM product_type_answers
+                    WHERE question_key IN ({placeholders})""",
+                    chunk,
+                )
+                found.update(rows)
+        return found
+
+    def put_product_types(self, answers):
+        """Store (question_key, product_type) pairs"""
+        now = time.time()
+        rows = [(key, product_type, now) for key, product_type in answers]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO product_type_answers VALUES (?, ?, ?)", rows
+            )
+            self.conn.commit()
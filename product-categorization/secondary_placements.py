@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Secondary (additional) placements chosen in the same model call as the primary
+categorization.
+
+The dual/multi category rules in dual_categories.py are known up front, so for
+every taxonomy path we can tell which additional placements it triggers and
+which of those need the model to pick a product type (e.g. every cheese also
+going to Deli > Cheese). The combined categorize mode lists those targets in
+the prompt, lets the model answer them in a "secondary" field next to the
+primary path, and builds additional_categorizations locally, so no separate
+product_types round trip is needed for them.
+"""
+
+from dual_categories import get_categorizations
+from taxonomy_utils import iter_paths, cached_taxonomy_hash
+
+_rules = {}
+
+
+def target_label(category, subcategory):
+    return f"{category} > {subcategory}"
+
+
+class SecondaryRules:
+    """Which taxonomy paths trigger additional placements that need a model-chosen product type"""
+
+    def __init__(self, taxonomy):
+        self.options = {}
+        for category in taxonomy:
+            for subcategory in category.get("subcategories", []):
+                self.options[target_label(category["name"], subcategory["name"])] = list(
+                    subcategory.get("productTypes") or []
+                )
+
+        self.triggers = {}
+        for path in iter_paths(taxonomy):
+            for entry in get_categorizations(*path):
+                label = target_label(entry["main_category"], entry["subcategory"])
+                if not entry.get("product_type") and self.options.get(label):
+                    self.triggers.setdefault(label, []).append(path)
+        self.all_paths = {}
+        for path in iter_paths(taxonomy):
+            self.all_paths.setdefault(path[:2], []).append(path)
+
+    def trigger_labels(self, label):
+        """Human-readable list of primary paths that trigger a target"""
+        paths = self.triggers[label]
+        by_subcategory = {}
+        for path in paths:
+            by_subcategory.setdefault(path[:2], []).append(path)
+        labels = []
+        for key, group in by_subcategory.items():
+            if len(group) == len(self.all_paths[key]):
+                labels.append(target_label(*key))
+            else:
+                labels.extend(" > ".join(path) for path in group)
+        return labels
+
+    def prompt_section(self):
+        """Prompt text describing the secondary placements, or "" if there are none"""
+        if not self.triggers:
+            return ""
+        lines = [
+            "SECONDARY PLACEMENTS: Some products are also listed in a second subcategory.",
+            'If the path you choose is one of the triggers below, add an item to "secondary" with',
+            'that "target" and a "product_type" chosen from its options. Otherwise leave "secondary" empty.',
+        ]
+        for label in sorted(self.triggers):
+            lines.append(
+                f"- Target {label} (options: {', '.join(self.options[label])}) "
+                f"when the path is under: {'; '.join(self.trigger_labels(label))}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def additional_categorizations(self, item):
+        """
+        additional_categorizations for a categorized item, exactly as dual_bridge.py
+        would build them, with product types filled in from the item's "secondary"
+        answers where those are valid options.
+        """
+        answers = {}
+        for answer in item.get("secondary") or []:
+            if isinstance(answer, dict):
+                answers[answer.get("target")] = answer.get("product_type")
+
+        entries = get_categorizations(
+            item["category"], item["subcategory"], item["product_type"]
+        )
+        for entry in entries:
+            if entry.get("product_type"):
+                continue
+            label = target_label(entry["main_category"], entry["subcategory"])
+            if answers.get(label) in self.options.get(label, ()):
+                entry["product_type"] = answers[label]
+        return entries
+
+
+def secondary_rules(taxonomy):
+    """SecondaryRules for a taxonomy, built once per taxonomy"""
+    key = cached_taxonomy_hash(taxonomy)
+    if key not in _rules:
+        _rules[key] = SecondaryRules(taxonomy)
+    return _rules[key]
+
+
+SECONDARY_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "target": {"type": "STRING"},
+            "product_type": {"type": "STRING"},
+        },
+        "required": ["target", "product_type"],
+    },
+}
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import threading
+import time
+
+from log_utils import log
+from response_schemas import id_table
+
+DEFAULT_STATE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".taxonomy_cache_state.json"
+)
+CACHE_TTL_SECONDS = 3600
+# Refresh the cache this long before it expires so no request races the TTL
+CACHE_REFRESH_MARGIN_SECONDS = 300
+
+TAXONOMY_SYSTEM_INSTRUCTION = "You are a product categorization expert that strictly follows the provided taxonomy. Always choose the most specific valid category for each product without inventing new categories."
+
+
+def taxonomy_cache_contents(taxonomy, id_coded=False):
+    """
+    The exact text stored in the cached content for a taxonomy: its JSON, or
+    with id_coded the path id table used by the "id" schema mode.
+    """
+    if id_coded:
+        return (
+            'COMPLETE TAXONOMY PATHS (one line per "Category > Subcategory", then path_id=Product Type):\n'
+            + id_table(taxonomy)
+        )
+    return "COMPLETE TAXONOMY:\n" + json.dumps(taxonomy)
+
+
+class TaxonomyCacheManager:
+    """
+    Owns the lifecycle of the Gemini cached content holding the taxonomy.
+
+    The cache name, a hash of the cached text and the expiry time are kept per
+    model in a small JSON state file, so every process (one-shot or --serve)
+    can reuse a live cache without a caches.get round-trip. Caches close to
+    their TTL get their TTL extended, and a taxonomy change creates a new cache.
+    With state_path=None the state is kept in memory only (for the fake and
+    replay backends, whose cache names must not reach the live state file).
+    """
+
+    def __init__(self, client, state_path=DEFAULT_STATE_PATH, ttl_seconds=CACHE_TTL_SECONDS):
+        self.client = client
+        self.state_path = state_path
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.state = {}
+        self.state = self.load_state()
+
+    def load_state(self):
+        if self.state_path is None:
+            return self.state
+        try:
+            with open(self.state_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        if self.state_path is None:
+            return
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            log(f"⚠️ Could not persist taxonomy cache state: {e}")
+
+    def record(self, model, name, content_hash, expires_at):
+        self.state[model] = {
+            "name": name,
+            "content_hash": content_hash,
+            "expires_at": expires_at,
+        }
+        self.save_state()
+
+    def current_name(self, model):
+        """Name of the cache currently tracked for a model, if any"""
+        entry = self.state.get(model)
+        return entry["name"] if entry else None
+
+    def invalidate(self, model, name=None):
+        """Forget the cache for a model, e.g. after the API reports it missing"""
+        with self.lock:
+            entry = self.state.get(model)
+            if entry and (name is None or entry["name"] == name):
+                del self.state[model]
+                self.save_state()
+
+    def get_cache_name(self, model, taxonomy, existing_cache_name=None, id_coded=False):
+        """
+        Return the name of a live cache holding this taxonomy for model, refreshing
+        or creating one as needed. Returns None if no cache could be obtained.
+        """
+        contents = taxonomy_cache_contents(taxonomy, id_coded)
+        content_hash = hashlib.sha256(contents.encode("utf-8")).hexdigest()
+
+        with self.lock:
+            # Another process may have refreshed the cache since we last looked
+            self.state = self.load_state()
+            entry = self.state.get(model)
+            now = time.time()
+
+            if entry and entry["content_hash"] == content_hash and now < entry["expires_at"]:
+                if now < entry["expires_at"] - CACHE_REFRESH_MARGIN_SECONDS:
+                    return entry["name"]
+                if self.extend(model, entry):
+                    return entry["name"]
+
+            if existing_cache_name and not entry:
+                adopted = self.adopt(model, existing_cache_name, content_hash)
+                if adopted:
+                    return adopted
+
+            return self.create(model, contents, content_hash)
+
+    def extend(self, model, entry):
+        """Push an existing cache's expiry out by another TTL"""
+        try:
+            log(f"⏳ Extending taxonomy cache TTL: {entry['name']}")
+            self.client.caches.update(
+                name=entry["name"], config={"ttl": f"{self.ttl_seconds}s"}
+            )
+            self.record(model, entry["name"], entry["content_hash"], time.time() + self.ttl_seconds)
+            entry["expires_at"] = self.state[model]["expires_at"]
+            return True
+        except Exception as e:
+            log(f"⚠️ Could not extend taxonomy cache {entry['name']}: {str(e)}")
+            return False
+
+    def adopt(self, model, cache_name, content_hash):
+        """Start tracking a cache name handed in by the caller, if it still exists"""
+        try:
+            log(f"🔍 Checking for existing cache: {cache_name}")
+            cache = self.client.caches.get(name=cache_name)
+        except Exception as e:
+            log(f"⚠️ Existing cache {cache_name} not usable ({str(e)}). Creating a new one.")
+            return None
+
+        expire_time = getattr(cache, "expire_time", None)
+        expires_at = expire_time.timestamp() if expire_time else time.time() + self.ttl_seconds
+        log(f"✅ Successfully found and using existing taxonomy cache: {cache.name}")
+        self.record(model, cache.name, content_hash, expires_at)
+        return cache.name
+
+    def create(self, model, contents, content_hash):
+        try:
+            log(f"🔍 Creating new cache with taxonomy ({len(contents)} chars)")
+            log(f"🔧 Attempting to create new cache with model: {model}")
+            cache = self.client.caches.create(
+                model=model,
+                config={
+                    "contents": contents,
+                    "system_instruction": TAXONOMY_SYSTEM_INSTRUCTION,
+                    "ttl": f"{self.ttl_seconds}s",
+                },
+            )
+            log(f"✅ Successfully created new taxonomy cache: {cache.name}")
+            if hasattr(cache, "usage_metadata"):
+                log(f"📊 New cache usage metadata: {cache.usage_metadata}")
+            self.record(model, cache.name, content_hash, time.time() + self.ttl_seconds)
+            return cache.name
+        except Exception as e:
+            log(f"❌ Error creating new cache: {str(e)}")
+            return None
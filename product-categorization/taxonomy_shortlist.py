@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Local shortlisting of candidate taxonomy paths, used to prune the taxonomy sent
+with each categorization batch.
+
+Every valid category -> subcategory -> product_type path is described by its own
+names plus any training examples from training_data.json (built by
+category_converter.py). Products are scored against those descriptions with an
+IDF-weighted token overlap, the top-K paths per product are kept, and the
+subcategories they belong to are sent in full so the model still sees every
+sibling product type.
+
+Run directly to measure recall on reported_categorizations.jsonl:
+    python taxonomy_shortlist.py --eval reported_categorizations.jsonl --top-k 5 10 20 40
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from collections import defaultdict
+
+from log_utils import log
+from taxonomy_utils import iter_paths
+
+DEFAULT_TRAINING_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "training_data.json"
+)
+DEFAULT_TOP_K = 20
+
+STOPWORDS = {"and", "or", "the", "of", "with", "for", "in", "a", "&", "oz", "ct", "lb"}
+
+
+def tokenize(text):
+    """Lowercase word tokens with a naive plural strip"""
+    tokens = []
+    for token in re.findall(r"[a-z]+", str(text or "").lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def product_text(product):
+    """Text used to describe a product for shortlisting"""
+    parts = [
+        product.get("description") or product.get("name"),
+        product.get("brand"),
+        " ".join(product.get("categories") or []),
+    ]
+    return " ".join(str(part) for part in parts if part)
+
+
+class TaxonomyShortlister:
+    """IDF-weighted token index from product text to taxonomy paths"""
+
+    def __init__(self, taxonomy, training_examples=None):
+        self.taxonomy = taxonomy
+        self.paths = list(iter_paths(taxonomy))
+        path_index = {path: i for i, path in enumerate(self.paths)}
+
+        documents = [tokenize(" ".join(path)) for path in self.paths]
+        for example in training_examples or []:
+            key = (
+                example.get("category"),
+                example.get("subcategory"),
+                example.get("product_type"),
+            )
+            if key in path_index:
+                documents[path_index[key]].extend(tokenize(example.get("text")))
+
+        document_frequency = defaultdict(int)
+        for tokens in documents:
+            for token in set(tokens):
+                document_frequency[token] += 1
+
+        total = len(documents)
+        self.idf = {
+            token: math.log((total + 1) / (count + 0.5))
+            for token, count in document_frequency.items()
+        }
+        # token -> [(path index, weight)], weights normalized per path document
+        self.postings = defaultdict(list)
+        for i, tokens in enumerate(documents):
+            unique = set(tokens)
+            norm = math.sqrt(sum(self.idf[t] ** 2 for t in unique)) or 1.0
+            for token in unique:
+                self.postings[token].append((i, self.idf[token] / norm))
+
+    @classmethod
+    def from_files(cls, taxonomy, training_data_path=DEFAULT_TRAINING_DATA_PATH):
+        """Build a shortlister, using training_data.json when it exists"""
+        training_examples = []
+        if training_data_path and os.path.exists(training_data_path):
+            with open(training_data_path, "r") as f:
+                training_examples = json.load(f)
+            log(f"📚 Loaded {len(training_examples)} shortlist training examples")
+        return cls(taxonomy, training_examples)
+
+    def rank(self, text, top_k=DEFAULT_TOP_K):
+        """Return the top_k paths for a piece of product text, best first"""
+        scores = defaultdict(float)
+        for token in set(tokenize(text)):
+            for i, weight in self.postings.get(token, ()):
+                scores[i] += self.idf[token] * weight
+        ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [self.paths[i] for i in ranked]
+
+    def candidate_subcategories(self, products, top_k=DEFAULT_TOP_K):
+        """
+        Union of (category, subcategory) pairs behind each product's top_k paths.
+        Returns None if any product matched nothing, since then no subtree is safe.
+        """
+        selected = set()
+        for product in products:
+            ranked = self.rank(product_text(product), top_k)
+            if not ranked:
+                return None
+            for category, subcategory, _ in ranked:
+                selected.add((category, subcategory))
+        return selected
+
+    def prune(self, products, top_k=DEFAULT_TOP_K):
+        """
+        Taxonomy restricted to the candidate subcategories for a batch of products,
+        or None when the full taxonomy should be sent instead.
+        """
+        selected = self.candidate_subcategories(products, top_k)
+        if selected is None:
+            return None
+        pruned = []
+        for category in self.taxonomy:
+            subcategories = [
+                sub
+                for sub in category["subcategories"]
+                if (category["name"], sub["name"]) in selected
+            ]
+            if subcategories:
+                pruned.append({"name": category["name"], "subcategories": subcategories})
+        return pruned
+
+
+def load_labelled_products(path):
+    """
+    Read (product, true path) pairs from reported_categorizations.jsonl, or from a
+    JSON array of already categorized products.
+    """
+    labelled = []
+    if path.endswith(".jsonl"):
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                report = json.loads(line)
+                # A rejected report means the current categorization was right
+                truth = (
+                    report.get("currentCategory")
+                    if report.get("status") == "rejected"
+                    else report.get("suggestedCategory")
+                )
+                product = report.get("product", {})
+                labelled.append(
+                    (
+                        {"description": product.get("name"), "brand": product.get("brand")},
+                        (truth["category"], truth["subcategory"], truth["product_type"]),
+                    )
+                )
+    else:
+        with open(path, "r") as f:
+            for product in json.load(f):
+                if product.get("category") and product.get("subcategory"):
+                    labelled.append(
+                        (
+                            product,
+                            (
+                                product["category"],
+                                product["subcategory"],
+                                product.get("product_type"),
+                            ),
+                        )
+                    )
+    return labelled
+
+
+def evaluate(shortlister, labelled, top_ks):
+    """Recall of the true path after pruning, and pruned size, for each K"""
+    report = []
+    path_count = len(shortlister.paths)
+    for top_k in top_ks:
+        hits = 0
+        pruned_paths = 0
+        fallbacks = 0
+        for product, truth in labelled:
+            selected = shortlister.candidate_subcategories([product], top_k)
+            if selected is None:
+                # The batch falls back to the full taxonomy, so the path survives
+                hits += 1
+                pruned_paths += path_count
+                fallbacks += 1
+                continue
+            if (truth[0], truth[1]) in selected:
+                hits += 1
+            pruned_paths += sum(
+                1 for path in shortlister.paths if (path[0], path[1]) in selected
+            )
+        report.append(
+            {
+                "top_k": top_k,
+                "products": len(labelled),
+                "recall": hits / len(labelled) if labelled else None,
+                "avg_paths_sent": pruned_paths / len(labelled) if labelled else None,
+                "full_taxonomy_fallbacks": fallbacks,
+                "total_paths": path_count,
+            }
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate taxonomy shortlisting recall")
+    parser.add_argument("--eval", required=True, help="Labelled products (.jsonl reports or .json array)")
+    parser.add_argument("--categories", default="categories.json")
+    parser.add_argument("--training-data", default=None, help="Optional training_data.json to index")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 10, 20, 40])
+    args = parser.parse_args()
+
+    with open(args.categories, "r") as f:
+        taxonomy = json.load(f)
+    # training_data.json contains the approved reports themselves, so it is only
+    # indexed when asked for explicitly to avoid scoring against the answers.
+    shortlister = TaxonomyShortlister.from_files(taxonomy, args.training_data)
+    labelled = load_labelled_products(args.eval)
+    print(json.dumps(evaluate(shortlister, labelled, args.top_k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# taxonomy_hash of the last few taxonomy objects seen, by identity
+RECENT_TAXONOMIES = 8
+_recent_hashes = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def taxonomy_hash(taxonomy):
+    """Stable hash of a taxonomy (the categories.json structure)"""
+    canonical = json.dumps(taxonomy, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cached_taxonomy_hash(taxonomy):
+    """
+    taxonomy_hash memoized per taxonomy object, for per-item and per-batch
+    lookups. The object must not be mutated after it is first hashed.
+    """
+    with _recent_lock:
+        entry = _recent_hashes.get(id(taxonomy))
+        if entry is not None and entry[0] is taxonomy:
+            _recent_hashes.move_to_end(id(taxonomy))
+            return entry[1]
+    key = taxonomy_hash(taxonomy)
+    with _recent_lock:
+        # Holding the object keeps its id from being reused while it is listed
+        _recent_hashes[id(taxonomy)] = (taxonomy, key)
+        while len(_recent_hashes) > RECENT_TAXONOMIES:
+            _recent_hashes.popitem(last=False)
+    return key
+
+
+def iter_paths(taxonomy):
+    """
+    Yield every valid (category, subcategory, product_type) triple in taxonomy order.
+    gridOnly subcategories (and ones without product types) use the subcategory
+    name as their product type, matching validateCategorization on the JS side.
+    """
+    for category in taxonomy:
+        for subcategory in category.get("subcategories", []):
+            product_types = subcategory.get("productTypes") or []
+            if subcategory.get("gridOnly") or not product_types:
+                yield category["name"], subcategory["name"], subcategory["name"]
+            else:
+                for product_type in product_types:
+                    yield category["name"], subcategory["name"], product_type
+
+
+def build_path_set(taxonomy):
+    """Set of all valid (category, subcategory, product_type) triples"""
+    return set(iter_paths(taxonomy))
+
+
+def is_valid_categorization(item, path_set):
+    """Check a {"category", "subcategory", "product_type"} dict against a path set"""
+    if not isinstance(item, dict):
+        return False
+    return (
+        item.get("category"),
+        item.get("subcategory"),
+        item.get("product_type"),
+    ) in path_set
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Structured per-call telemetry for model requests.
+
+Every categorize / product_types model call is recorded as one JSON line:
+    {"ts", "kind", "model", "batch_size", "image_count", "image_fetch_seconds",
+     "prompt_tokens", "output_tokens", "thoughts_tokens", "cached_tokens", "total_tokens",
+     "finish_reason", "parse_path", "streamed", "wall_seconds", "error"}
+parse_path says how the answer was read: "structured" (SDK-parsed output),
+"stream" (incremental parser), "extract_json" (text fallback) or "none".
+
+Running totals can also be exported as a Prometheus textfile (for the node
+exporter's textfile collector), rewritten atomically after every call. The
+totals are kept in a "<textfile>.state.json" sidecar, updated under a file
+lock, so the per-batch processes the JS side spawns add up instead of
+overwriting each other.
+
+Aggregate a telemetry file:
+    python telemetry.py aggregate telemetry.jsonl [--by kind model]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+
+from log_utils import log
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_FIELDS = ("prompt_tokens", "output_tokens", "thoughts_tokens", "cached_tokens", "total_tokens")
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes may race on the state file
+    fcntl = None
+
+
+class Telemetry:
+    """Appends call records to a JSONL file and keeps Prometheus counters"""
+
+    def __init__(self, path=None, prometheus_path=None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def record(self, **fields):
+        record = {"ts": round(time.time(), 3), **fields}
+        with self.lock:
+            if self.path:
+                try:
+                    with open(self.path, "a") as f:
+                        f.write(json.dumps(record) + "\n")
+                except OSError as e:
+                    log(f"⚠️ Could not write telemetry: {e}")
+            if self.prometheus_path:
+                try:
+                    with self.state_lock():
+                        self.load_state()
+                        self.count(record)
+                        self.save_state()
+                        self.write_prometheus()
+                except OSError as e:
+                    log(f"⚠️ Could not update Prometheus textfile: {e}")
+        return record
+
+    @contextlib.contextmanager
+    def state_lock(self):
+        with open(f"{self.prometheus_path}.lock", "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def load_state(self):
+        try:
+            with open(f"{self.prometheus_path}.state.json", "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.series = {(e["kind"], e["model"]): e["series"] for e in entries}
+
+    def save_state(self):
+        entries = [
+            {"kind": kind, "model": model, "series": series}
+            for (kind, model), series in self.series.items()
+        ]
+        state_path = f"{self.prometheus_path}.state.json"
+        with open(f"{state_path}.tmp", "w") as f:
+            json.dump(entries, f)
+        os.replace(f"{state_path}.tmp", state_path)
+
+    def count(self, record):
+        labels = (record.get("kind") or "", record.get("model") or "")
+        series = self.series.setdefault(
+            labels,
+            {
+                "calls": 0,
+                "errors": 0,
+                "products": 0,
+                "images": 0,
+                "image_fetch_seconds": 0.0,
+                "wall_seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "parse_paths": {},
+                **{field: 0 for field in TOKEN_FIELDS},
+            },
+        )
+        series["calls"] += 1
+        series["errors"] += 1 if record.get("error") else 0
+        series["products"] += record.get("batch_size") or 0
+        series["images"] += record.get("image_count") or 0
+        series["image_fetch_seconds"] += record.get("image_fetch_seconds") or 0.0
+        wall = record.get("wall_seconds") or 0.0
+        series["wall_seconds"] += wall
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if wall <= bound:
+                series["buckets"][i] += 1
+        path = record.get("parse_path") or "none"
+        series["parse_paths"][path] = series["parse_paths"].get(path, 0) + 1
+        for field in TOKEN_FIELDS:
+            # State written before a field existed lacks it
+            series[field] = series.get(field, 0) + (record.get(field) or 0)
+
+    def write_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        def per_series(key):
+            return [
+                ({"kind": kind, "model": model}, series[key])
+                for (kind, model), series in self.series.items()
+            ]
+
+        metric("categorizer_model_calls_total", "counter", "Model calls", per_series("calls"))
+        metric("categorizer_model_errors_total", "counter", "Model calls that raised", per_series("errors"))
+        metric("categorizer_products_total", "counter", "Products sent to the model", per_series("products"))
+        metric("categorizer_images_total", "counter", "Images sent to the model", per_series("images"))
+        metric(
+            "categorizer_image_fetch_seconds_total",
+            "counter",
+            "Time spent fetching images for model calls",
+            per_series("image_fetch_seconds"),
+        )
+        metric(
+            "categorizer_tokens_total",
+            "counter",
+            "Tokens by type",
+            [
+                ({"kind": kind, "model": model, "type": field[: -len("_tokens")]}, series.get(field, 0))
+                for (kind, model), series in self.series.items()
+                for field in TOKEN_FIELDS
+            ],
+        )
+        metric(
+            "categorizer_parse_path_total",
+            "counter",
+            "How model answers were parsed",
+            [
+                ({"kind": kind, "model": model, "path": path}, count)
+                for (kind, model), series in self.series.items()
+                for path, count in series["parse_paths"].items()
+            ],
+        )
+
+        lines.append("# HELP categorizer_call_seconds Wall time of model calls")
+        lines.append("# TYPE categorizer_call_seconds histogram")
+        for (kind, model), series in self.series.items():
+            labels = f'kind="{kind}",model="{model}"'
+            for bound, count in zip(LATENCY_BUCKETS, series["buckets"]):
+                lines.append(f'categorizer_call_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'categorizer_call_seconds_bucket{{{labels},le="+Inf"}} {series["calls"]}')
+            lines.append(f"categorizer_call_seconds_sum{{{labels}}} {series['wall_seconds']}")
+            lines.append(f"categorizer_call_seconds_count{{{labels}}} {series['calls']}")
+
+        tmp_path = f"{self.prometheus_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prometheus_path)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))], 3)
+
+
+def aggregate(records, by=("kind", "model")):
+    """Summary per group of records: calls, errors, tokens, latency and parse paths"""
+    groups = {}
+    for record in records:
+        key = " / ".join(str(record.get(field)) for field in by)
+        groups.setdefault(key, []).append(record)
+
+    summary = {}
+    for key, group in sorted(groups.items()):
+        products = sum(r.get("batch_size") or 0 for r in group)
+        walls = [r.get("wall_seconds") or 0.0 for r in group]
+        tokens = {field: sum(r.get(field) or 0 for r in group) for field in TOKEN_FIELDS}
+        parse_paths = {}
+        for r in group:
+            path = r.get("parse_path") or "none"
+            parse_paths[path] = parse_paths.get(path, 0) + 1
+        summary[key] = {
+            "calls": len(group),
+            "errors": sum(1 for r in group if r.get("error")),
+            "products": products,
+            "images": sum(r.get("image_count") or 0 for r in group),
+            "image_fetch_seconds": round(sum(r.get("image_fetch_seconds") or 0.0 for r in group), 3),
+            **tokens,
+            "tokens_per_product": round(tokens["total_tokens"] / products, 1) if products else None,
+            "cached_share": (
+                round(tokens["cached_tokens"] / tokens["prompt_tokens"], 3)
+                if tokens["prompt_tokens"]
+                else None
+            ),
+            "wall_seconds": round(sum(walls), 3),
+            "p50_seconds": percentile(walls, 50),
+            "p95_seconds": percentile(walls, 95),
+            "parse_paths": parse_paths,
+            "finish_reasons": {
+                reason: sum(1 for r in group if r.get("finish_reason") == reason)
+                for reason in {r.get("finish_reason") for r in group}
+                if reason
+            },
+        }
+    return summary
+
+
+def read_records(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model call telemetry tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    aggregate_parser = subparsers.add_parser("aggregate", help="Summarize telemetry JSONL files")
+    aggregate_parser.add_argument("files", nargs="+")
+    aggregate_parser.add_argument(
+        "--by", nargs="+", default=["kind", "model"], help="Record fields to group by"
+    )
+    args = parser.parse_args()
+
+    records = []
+    for path in args.files:
+        records.extend(read_records(path))
+    print(json.dumps(aggregate(records, args.by), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# The categorization scripts are run from their own directory and import each other by name
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "product-categorization")
+)
+
+TAXONOMY = [
+    {
+        "name": "Produce",
+        "subcategories": [
+            {"name": "Fruit", "productTypes": ["Apples", "Bananas", "Citrus"]},
+            {"name": "Vegetables", "productTypes": ["Carrots", "Lettuce"]},
+        ],
+    },
+    {
+        "name": "Pantry",
+        "subcategories": [
+            {"name": "Pasta", "gridOnly": True},
+            {"name": "Baking", "productTypes": ["Flour", "Sugar"]},
+        ],
+    },
+]
+
+
+@pytest.fixture
+def fake_wrapper(monkeypatch, tmp_path):
+    """gemini_wrapper wired to a FakeGeminiClient built with the given options"""
+    import gemini_wrapper
+    from fake_gemini import FakeGeminiClient
+    from taxonomy_cache import TaxonomyCacheManager
+
+    def wire(**options):
+        client = FakeGeminiClient(TAXONOMY, **{"latency_seconds": 0.01, **options})
+        monkeypatch.setattr(gemini_wrapper, "client", client)
+        monkeypatch.setattr(
+            gemini_wrapper,
+            "taxonomy_caches",
+            TaxonomyCacheManager(client, str(tmp_path / "taxonomy_cache_state.json")),
+        )
+        monkeypatch.setattr(gemini_wrapper, "result_cache", None)
+        monkeypatch.setattr(gemini_wrapper, "log", lambda message: None)
+        return gemini_wrapper, client
+
+    return wire
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from batch_engine import AdaptiveBatchSizer, BatchEngine
+from conftest import TAXONOMY
+from taxonomy_utils import build_path_set, is_valid_categorization
+
+
+def aligned(batch, status="ok"):
+    return {"categorizations": [{"status": status} for _ in batch], "taxonomy_cache_name": None}
+
+
+def run(categorize_fn, products, batch_size, **kwargs):
+    engine = BatchEngine(categorize_fn, concurrency=1, **kwargs)
+    return asyncio.run(engine.run(products, {}, batch_size, adaptive=True))
+
+
+def test_missing_items_shrink_the_batch_size():
+    def categorize(batch, taxonomy, cache_name, max_output_tokens):
+        # An aligned response whose last item never came back
+        result = aligned(batch)
+        if len(batch) > 5:
+            result["categorizations"][-1] = {"status": "missing"}
+        return result
+
+    result = run(categorize, [{"description": str(i)} for i in range(40)], 20)
+    sizes = result["stats"]["batch_sizes"]
+    assert sizes[:2] == [20, 10]
+    assert max(sizes[2:]) <= 10
+    assert len(result["categorizations"]) == 40
+
+
+def test_a_high_share_of_invalid_items_shrinks_the_batch_size():
+    def categorize(batch, taxonomy, cache_name, max_output_tokens):
+        result = aligned(batch)
+        for item in result["categorizations"][: len(batch) // 2]:
+            item["status"] = "invalid"
+        return result
+
+    sizes = run(categorize, [{"description": str(i)} for i in range(30)], 20)["stats"]["batch_sizes"]
+    assert sizes[:2] == [20, 10]
+
+
+def test_clean_responses_grow_the_batch_size():
+    def categorize(batch, taxonomy, cache_name, max_output_tokens):
+        return aligned(batch)
+
+    sizes = run(categorize, [{"description": str(i)} for i in range(60)], 20)["stats"]["batch_sizes"]
+    assert sizes[:2] == [20, 25]
+
+
+def test_should_shrink_thresholds():
+    sizer = AdaptiveBatchSizer(20)
+    assert sizer.should_shrink(20, missing=1, invalid=0)
+    assert sizer.should_shrink(20, missing=0, invalid=5)
+    assert not sizer.should_shrink(20, missing=0, invalid=4)
+    assert not sizer.should_shrink(1, missing=1, invalid=0)
+    assert not AdaptiveBatchSizer(20, adaptive=False).should_shrink(20, missing=3, invalid=0)
+
+
+def test_fake_client_errors_are_retried_within_the_concurrency_bound(fake_wrapper):
+    gemini_wrapper, client = fake_wrapper(latency_seconds=0.02, error_rate=0.3, seed=3)
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+
+    def categorize(batch, taxonomy, cache_name, max_output_tokens):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            return gemini_wrapper.request_with_salvage(batch, taxonomy, cache_name, max_output_tokens)
+        finally:
+            with lock:
+                in_flight["now"] -= 1
+
+    products = [{"description": f"product {i}"} for i in range(60)]
+    engine = BatchEngine(categorize, concurrency=3, max_retries=8, backoff_seconds=0.01)
+    result = asyncio.run(engine.run(products, TAXONOMY, 5))
+
+    assert client.errors > 0
+    assert result["stats"]["retries"] == client.errors
+    assert result["stats"]["failed_batches"] == 0
+    assert 1 < in_flight["peak"] <= 3
+    path_set = build_path_set(TAXONOMY)
+    assert len(result["categorizations"]) == len(products)
+    assert all(is_valid_categorization(item, path_set) for item in result["categorizations"])
+    # Each answer is the fake's pick for that product's own description
+    answers = client.categorize_answer(
+        "".join(f"- Description: {product['description']}\n" for product in products)
+    )
+    assert [item["product_type"] for item in result["categorizations"]] == [
+        answer["product_type"] for answer in answers
+    ]
@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+from bulk_job import Checkpoint, read_pending, run_bulk_job
+from conftest import TAXONOMY
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def categorization(product):
+    if product["productId"].startswith("bad"):
+        return {"status": "invalid"}
+    return {"category": "Produce", "subcategory": "Fruit", "product_type": "Apples", "status": "ok"}
+
+
+def is_valid(item):
+    return item.get("status") == "ok"
+
+
+class Crash(Exception):
+    pass
+
+
+def categorize_until(crash_after=None):
+    """A categorize function that raises after crash_after chunks"""
+    calls = []
+
+    def categorize(products, cache_name):
+        if crash_after is not None and len(calls) == crash_after:
+            raise Crash()
+        calls.append([product["productId"] for product in products])
+        return {"categorizations": [categorization(p) for p in products], "taxonomy_cache_name": None}
+
+    return categorize, calls
+
+
+@pytest.fixture
+def job(tmp_path):
+    input_path = tmp_path / "products.jsonl"
+    ids = [f"p{i}" for i in range(7)] + ["bad0", "bad1"]
+    write_jsonl(input_path, [{"productId": pid, "description": pid} for pid in ids])
+    output_path = tmp_path / "out.jsonl"
+
+    def run(categorize, **kwargs):
+        return run_bulk_job(
+            str(input_path), str(output_path), TAXONOMY, categorize, is_valid, chunk_size=3, **kwargs
+        )
+
+    return run, output_path, tmp_path / "out.failures.jsonl", tmp_path / "out.checkpoint.json"
+
+
+def test_failure_rows_drop_their_markers(tmp_path):
+    path = tmp_path / "input.jsonl"
+    write_jsonl(
+        path,
+        [
+            {"productId": "a", "error": "invalid categorization (invalid)", "attempted": {}},
+            # A product's own "error" field is not a failure marker
+            {"productId": "b", "error": "misprint on label"},
+            {"productId": "c", "attempted": "twice"},
+        ],
+    )
+
+    assert list(read_pending(str(path), {"c"})) == [
+        ("a", {"productId": "a"}),
+        ("b", {"productId": "b", "error": "misprint on label"}),
+    ]
+
+
+def test_a_restarted_job_skips_done_chunks_without_duplicates(job):
+    run, output_path, failures_path, checkpoint_path = job
+
+    with pytest.raises(Crash):
+        run(categorize_until(crash_after=2)[0])
+    categorize, calls = categorize_until()
+    summary = run(categorize)
+
+    assert calls == [["p6", "bad0", "bad1"]]
+    assert [row["id"] for row in read_jsonl(output_path)] == [f"p{i}" for i in range(7)]
+    assert [row["id"] for row in read_jsonl(failures_path)] == ["bad0", "bad1"]
+    assert summary["done"] == 9
+    assert summary["processed_this_run"] == 3
+
+
+def test_output_written_after_the_last_checkpoint_is_dropped(job):
+    run, output_path, failures_path, checkpoint_path = job
+    with pytest.raises(Crash):
+        run(categorize_until(crash_after=1)[0])
+    # A chunk that was half-written when the job died
+    with open(output_path, "a") as f:
+        f.write('{"id": "p3", "category": "Prod')
+
+    run(categorize_until()[0])
+
+    rows = read_jsonl(output_path)
+    assert [row["id"] for row in rows] == [f"p{i}" for i in range(7)]
+
+
+def test_a_truncated_temporary_checkpoint_is_ignored(job):
+    run, output_path, failures_path, checkpoint_path = job
+    with pytest.raises(Crash):
+        run(categorize_until(crash_after=1)[0])
+    # The job died while writing the next checkpoint, before the atomic rename
+    state = checkpoint_path.read_text()
+    (checkpoint_path.parent / f"{checkpoint_path.name}.tmp").write_text(state[: len(state) // 2])
+
+    categorize, calls = categorize_until()
+    run(categorize)
+
+    assert calls == [["p3", "p4", "p5"], ["p6", "bad0", "bad1"]]
+
+
+def test_a_truncated_checkpoint_is_an_error_not_a_fresh_start(job):
+    run, output_path, failures_path, checkpoint_path = job
+    with pytest.raises(Crash):
+        run(categorize_until(crash_after=1)[0])
+    state = checkpoint_path.read_text()
+    checkpoint_path.write_text(state[: len(state) // 2])
+    written = output_path.read_text()
+
+    with pytest.raises(ValueError, match="unreadable"):
+        run(categorize_until()[0])
+    assert output_path.read_text() == written
+
+
+def test_a_checkpoint_of_another_input_is_rejected(job, tmp_path):
+    run, output_path, failures_path, checkpoint_path = job
+    run(categorize_until()[0])
+
+    other = tmp_path / "other.jsonl"
+    write_jsonl(other, [])
+    with pytest.raises(ValueError, match="different job"):
+        Checkpoint(str(checkpoint_path), str(other), TAXONOMY).load()
@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+
+import dual_categories
+from dual_categories import get_categorizations, verification_paths, walk_categorizations
+
+PATHS = verification_paths()
+
+
+@pytest.fixture(autouse=True)
+def quiet_walk():
+    # walk_categorizations logs every step at INFO
+    level = dual_categories.logger.level
+    dual_categories.logger.setLevel(logging.WARNING)
+    yield
+    dual_categories.logger.setLevel(level)
+
+
+def test_verification_paths_cover_categories_json():
+    assert len(PATHS) >= len(list(dual_categories.iter_paths(dual_categories.load_categories())))
+
+
+@pytest.mark.parametrize("path", PATHS, ids=" > ".join)
+def test_rule_table_matches_walk(path):
+    assert get_categorizations(*path) == walk_categorizations(*path)
+
+
+def test_unknown_triple_is_compiled_without_growing_the_table():
+    size = len(dual_categories.rule_table())
+    path = ("Dairy & Eggs", "Cheese", "Not A Real Product Type")
+    assert get_categorizations(*path) == walk_categorizations(*path)
+    assert len(dual_categories.rule_table()) == size
+
+
+def test_lookups_return_copies():
+    path = next(p for p in PATHS if get_categorizations(*p))
+    get_categorizations(*path)[0]["main_category"] = "Changed"
+    assert get_categorizations(*path) == walk_categorizations(*path)
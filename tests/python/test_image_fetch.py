@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "product-categorization")
+sys.path.insert(0, os.path.join(ROOT, "manual_task_scripts"))
+
+import gemini_wrapper  # noqa: E402
+from image_fetch_harness import StandIn, fetch_batch, fetch_session, small_jpeg  # noqa: E402
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setattr(gemini_wrapper, "image_cache", None)
+    monkeypatch.setattr(gemini_wrapper, "log", lambda message: None)
+    server = StandIn(small_jpeg())
+    yield server
+    server.server.shutdown()
+
+
+@pytest.mark.parametrize("deadline", [0.6, 1.0])
+def test_a_mixed_batch_meets_the_fetch_checks(stand_in, deadline):
+    _, session = fetch_session()
+    report = fetch_batch(
+        stand_in, session, fast=12, slow=3, missing=2, delay=0.05, slow_delay=3.0, deadline=deadline
+    )
+
+    assert report["checks"] == {name: True for name in report["checks"]}
+    assert report["loaded"] == 12
+    assert report["peak_in_flight"] <= gemini_wrapper.IMAGE_FETCH_WORKERS
+
+
+def test_fetches_past_the_deadline_get_a_short_timeout(stand_in):
+    timeouts = []
+
+    class RecordingSession:
+        def get(self, url, headers=None, timeout=None):
+            timeouts.append(timeout)
+            raise TimeoutError("recorded")
+
+    assert gemini_wrapper.load_image(f"{stand_in.base_url}/image/0", RecordingSession(), 0) is None
+    gemini_wrapper.load_image(f"{stand_in.base_url}/image/0", RecordingSession())
+
+    assert timeouts == [
+        (gemini_wrapper.IMAGE_PAST_DEADLINE_TIMEOUT_SECONDS,) * 2,
+        (gemini_wrapper.IMAGE_CONNECT_TIMEOUT_SECONDS, gemini_wrapper.IMAGE_READ_TIMEOUT_SECONDS),
+    ]
@@ -0,0 +1,73 @@
+import pytest
+
+from json_stream import JsonArrayStreamParser, parse_json_array
+
+TEXT = (
+    'Here you go:\n```json\n[\n'
+    '  {"index": 1, "description": "Say \\"cheese\\" {not a brace} [nor this]"},\n'
+    '  {"index": 2, "description": "back\\\\slash", "secondary": [{"target": "Deli > Cheese"}]},\n'
+    '  {"index": 3, "description": "caf\\u00e9"}\n'
+    "]\n```"
+)
+EXPECTED = [
+    {"index": 1, "description": 'Say "cheese" {not a brace} [nor this]'},
+    {"index": 2, "description": "back\\slash", "secondary": [{"target": "Deli > Cheese"}]},
+    {"index": 3, "description": "café"},
+]
+
+
+def feed_in_chunks(text, size):
+    parser = JsonArrayStreamParser()
+    elements = []
+    for start in range(0, len(text), size):
+        elements.extend(parser.feed(text[start : start + size]))
+    return parser, elements
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(TEXT)])
+def test_chunk_boundaries_inside_strings_and_escapes(size):
+    parser, elements = feed_in_chunks(TEXT, size)
+    assert elements == EXPECTED
+    assert parser.complete
+
+
+def test_every_split_point():
+    # Each split lands once inside a string, right after a backslash, mid-escape, etc.
+    for split in range(len(TEXT) + 1):
+        parser = JsonArrayStreamParser()
+        elements = parser.feed(TEXT[:split]) + parser.feed(TEXT[split:])
+        assert elements == EXPECTED, split
+
+
+def test_elements_arrive_as_soon_as_they_close():
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"index": 1}, {"ind') == [{"index": 1}]
+    assert parser.feed('ex": 2}]') == [{"index": 2}]
+
+
+def test_malformed_element_is_skipped():
+    parser, elements = feed_in_chunks('[{"index": 1}, {"index": 2,}, {"index": 3}]', 4)
+    assert elements == [{"index": 1}, {"index": 3}]
+    assert parser.skipped == 1
+    assert parser.complete
+
+
+def test_truncated_array_yields_complete_elements():
+    parser, elements = feed_in_chunks('[{"index": 1}, {"index": 2}, {"index": 3, "categ', 5)
+    assert elements == [{"index": 1}, {"index": 2}]
+    assert not parser.complete
+    assert parse_json_array('[{"index": 1}, {"index": 2') == [{"index": 1}]
+
+
+def test_prose_brackets_before_the_array_are_ignored():
+    assert parse_json_array('See [note] below: [{"index": 1}]') == [{"index": 1}]
+
+
+def test_empty_array_is_an_answer():
+    assert parse_json_array("[]") == []
+
+
+@pytest.mark.parametrize("text", ["no array here", '[{"index": 1,}]', '[{"ind'])
+def test_parse_json_array_raises_without_elements(text):
+    with pytest.raises(ValueError):
+        parse_json_array(text)
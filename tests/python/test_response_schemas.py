@@ -0,0 +1,34 @@
+import json
+import os
+
+import gemini_wrapper
+from response_schemas import decode_path_items, format_path, path_ids
+
+with open(os.path.join(os.path.dirname(gemini_wrapper.__file__), "categories.json")) as f:
+    TAXONOMY = json.load(f)
+
+
+def test_known_ids_and_paths_decode_to_fields():
+    path = path_ids(TAXONOMY)[1]
+    expected = dict(zip(("category", "subcategory", "product_type"), path))
+    assert decode_path_items([{"index": 1, "path_id": 1}], TAXONOMY) == [{"index": 1, **expected}]
+    assert decode_path_items([{"index": 1, "path": format_path(*path)}], TAXONOMY) == [
+        {"index": 1, **expected}
+    ]
+
+
+def test_unknown_id_keeps_the_raw_answer_for_the_follow_up_prompt():
+    [item] = decode_path_items([{"index": 1, "path_id": 99999}], TAXONOMY)
+    assert (item["category"], item["path_id"]) == ("", 99999)
+    prompt = gemini_wrapper.build_categorize_prompt(
+        [{"description": "Milk", "rejected_categorization": item}], TAXONOMY, True, schema_mode="id"
+    )
+    assert "NOT VALID (previous answer, not in the taxonomy): path_id 99999" in prompt
+
+
+def test_unknown_path_keeps_the_raw_answer_for_the_follow_up_prompt():
+    [item] = decode_path_items([{"index": 1, "path": "Bogus > Aisle > Thing"}], TAXONOMY)
+    prompt = gemini_wrapper.build_categorize_prompt(
+        [{"description": "Milk", "rejected_categorization": item}], TAXONOMY, True, schema_mode="path"
+    )
+    assert "NOT VALID (previous answer, not in the taxonomy): Bogus > Aisle > Thing" in prompt
@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import TAXONOMY
+from taxonomy_utils import build_path_set, is_valid_categorization
+
+PRODUCTS = [{"description": f"product {i}"} for i in range(8)]
+
+
+def salvage_run(fake_wrapper, monkeypatch, seed):
+    gemini_wrapper, client = fake_wrapper(invalid_rate=0.15, seed=seed)
+    batches = []
+    request_categorizations = gemini_wrapper.request_categorizations
+
+    def spy(batch, *args, **kwargs):
+        batches.append(batch)
+        return request_categorizations(batch, *args, **kwargs)
+
+    monkeypatch.setattr(gemini_wrapper, "request_categorizations", spy)
+    return gemini_wrapper.request_with_salvage(PRODUCTS, TAXONOMY), batches
+
+
+# With these seeds the fake answers one product of eight with an unknown product type
+@pytest.mark.parametrize("seed, position, status", [(4, 2, "salvaged"), (19, 5, "invalid")])
+def test_one_invalid_item_is_re_requested_alone(fake_wrapper, monkeypatch, seed, position, status):
+    result, batches = salvage_run(fake_wrapper, monkeypatch, seed)
+
+    assert [len(batch) for batch in batches] == [8, 1]
+    (follow_up,) = batches[1]
+    assert follow_up["description"] == PRODUCTS[position]["description"]
+    assert follow_up["rejected_categorization"]["product_type"] == "Not A Product Type"
+
+    categorizations = result["categorizations"]
+    assert [item["status"] for item in categorizations] == [
+        status if i == position else "ok" for i in range(len(PRODUCTS))
+    ]
+    path_set = build_path_set(TAXONOMY)
+    for item in categorizations:
+        assert is_valid_categorization(item, path_set) == (item["status"] != "invalid")
+    assert result["salvage"] == {
+        "salvaged": 1 if status == "salvaged" else 0,
+        "unresolved": 1 if status == "invalid" else 0,
+    }
+
+
+def test_clean_answers_need_no_follow_up(fake_wrapper, monkeypatch):
+    result, batches = salvage_run(fake_wrapper, monkeypatch, seed=0)
+
+    assert len(batches) == 1
+    assert all(item["status"] == "ok" for item in result["categorizations"])
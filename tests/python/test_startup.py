@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "product-categorization")
+sys.path.insert(0, os.path.join(ROOT, "manual_task_scripts"))
+
+from startup_report import DEFAULT_BUDGET_MS, ENTRY_POINTS, invocation_seconds  # noqa: E402
+
+# Heavy third-party packages and the optional stages, each imported only by the
+# mode or option that uses it
+DEFERRED = {
+    "requests",
+    "pydantic",
+    "google.genai",
+    "google.api_core",
+    "PIL",
+    "numpy",
+    "sentence_transformers",
+    "asyncio",
+    "batch_engine",
+    "bulk_job",
+    "dual_categories",
+    "fake_gemini",
+    "gemini_backends",
+    "knn_classifier",
+    "product_type_chooser",
+    "secondary_placements",
+    "taxonomy_shortlist",
+    "telemetry",
+}
+
+
+def imported_modules(argv, stdin=""):
+    """Names of the modules a python run imports, from -X importtime"""
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        cwd=ROOT,
+        input=stdin,
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+
+
+def test_import_defers_heavy_modules():
+    assert imported_modules(["-c", "import gemini_wrapper"]) & DEFERRED == set()
+
+
+@pytest.mark.parametrize("name", sorted(ENTRY_POINTS))
+def test_trivial_invocation_defers_heavy_modules(name):
+    module, argv, stdin = ENTRY_POINTS[name]
+    assert imported_modules([f"{module}.py", *argv], stdin) & DEFERRED == set()
+
+
+@pytest.mark.parametrize("name", sorted(ENTRY_POINTS))
+def test_trivial_invocation_within_budget(name):
+    module, argv, stdin = ENTRY_POINTS[name]
+    assert invocation_seconds(module, argv, stdin, runs=3) * 1000 <= DEFAULT_BUDGET_MS